@@ -0,0 +1,165 @@
+"""Indexes of the hot manager queries
+
+Indexes the columns the managers filter on (see tools/indexcheck.py):
+- party.game_category_id: the parties of a game, deleted with it
+- gamecategory.voice_id: the game of an "Add Party" channel, unique, one channel per game
+- streamermoderatorrelation.moderator_id: the streamers of a moderator, deleted with them
+- party (owner_id, game_category_id): unique, the parties of a member, one per game. Built
+  as a unique index then attached to the constraint of model/schemas.py, ALTER TABLE ADD
+  CONSTRAINT would block the writes while it scans the table
+
+The columns of streamermoderatorrelation become BIGINT like the ids they reference, an INTEGER
+column compared with a Discord id has to be cast and the index is not used.
+
+The indexes are built with CREATE INDEX CONCURRENTLY, outside of a transaction: the tables stay
+writable meanwhile. A build that fails leaves an invalid index behind, it is dropped and built
+again by the next upgrade. Tables that don't exist yet are skipped, the autogenerated migration
+of entrypoint.sh creates them with their indexes.
+
+Revision ID: 3f9c2a7d41b8
+Revises:
+Create Date: 2026-10-19 14:02:11.408263
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c2a7d41b8"
+down_revision: str | None = None
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# (name, table, columns, unique)
+indexes = [
+    ("ix_party_game_category_id", "party", ["game_category_id"], False),
+    ("ix_gamecategory_voice_id", "gamecategory", ["voice_id"], True),
+    (
+        "ix_streamermoderatorrelation_moderator_id",
+        "streamermoderatorrelation",
+        ["moderator_id"],
+        False,
+    ),
+]
+# (name, table, columns): PostgreSQL's name for the unnamed UniqueConstraint of the model
+constraint = (
+    "party_owner_id_game_category_id_key",
+    "party",
+    ["owner_id", "game_category_id"],
+)
+links = "streamermoderatorrelation"
+
+
+def existing_tables() -> set[str] | None:
+    """The tables of the database, None when generating SQL (--sql): all of them."""
+    if context.is_offline_mode():
+        return None
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def invalid_index(name: str) -> bool:
+    """Left behind by a CREATE INDEX CONCURRENTLY that failed."""
+    if context.is_offline_mode() or op.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT NOT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+        .scalar()
+    )
+
+
+def has_unique(table: str, columns: list[str]) -> bool:
+    """Already created with the table, or by a previous upgrade."""
+    if context.is_offline_mode():
+        return False
+    return any(
+        unique["column_names"] == columns
+        for unique in sa.inspect(op.get_bind()).get_unique_constraints(table)
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    tables = existing_tables()
+    if tables is None:
+        narrow = ["streamer_id", "moderator_id"]
+    elif links in tables:
+        narrow = [
+            column["name"]
+            for column in sa.inspect(op.get_bind()).get_columns(links)
+            if isinstance(column["type"], sa.Integer)
+            and not isinstance(column["type"], sa.BigInteger)
+        ]
+    else:
+        narrow = []
+    # Rewrites the table, skipped when it was already done
+    for column in narrow:
+        op.alter_column(
+            links, column, type_=sa.BigInteger(), existing_type=sa.Integer()
+        )
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in indexes:
+            if tables is not None and table not in tables:
+                continue
+            if invalid_index(name):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+        name, table, columns = constraint
+        if (tables is None or table in tables) and not has_unique(table, columns):
+            if invalid_index(name):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=True,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+            if op.get_context().dialect.name == "postgresql":
+                # Only takes the index over, the table isn't scanned again
+                op.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    name, table, _ = constraint
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+    else:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(indexes):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+    for column in ("streamer_id", "moderator_id"):
+        op.alter_column(
+            links, column, type_=sa.Integer(), existing_type=sa.BigInteger()
+        )
@@ -0,0 +1,127 @@
+"""
+JSON Lines history of benchmark runs and comparison against a baseline run.
+
+Every run appends one line: the suite, the commit it ran on, an optional label ("baseline",
+"pr-42"...) and its results, {case: {metric: value}}. A run is compared metric by metric with
+a baseline run of the same history, a change past the metric tolerance is a regression.
+"""
+
+from __future__ import annotations
+
+import json
+import platform
+import subprocess
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+
+
+@dataclass
+class Run:
+    suite: str
+    results: dict[str, dict[str, float]]
+    label: str | None = None
+    commit: str | None = None
+    at: str = field(default_factory=lambda: datetime.now(UTC).isoformat())
+    environment: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Tolerance:
+    """A regression is a higher value by more than `relative` AND more than `absolute`."""
+
+    relative: float
+    absolute: float = 0.0
+
+
+@dataclass
+class Comparison:
+    case: str
+    metric: str
+    baseline: float
+    current: float
+    regression: bool
+
+    @property
+    def change(self) -> float:
+        return (self.current - self.baseline) / self.baseline if self.baseline else 0.0
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(**extra: str) -> dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "node": platform.node(),
+        **extra,
+    }
+
+
+def load(path: Path, suite: str) -> list[Run]:
+    if not path.exists():
+        return []
+    runs = [Run(**json.loads(line)) for line in path.read_text().splitlines() if line]
+    return [run for run in runs if run.suite == suite]
+
+
+def append(path: Path, run: Run) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as file:
+        file.write(json.dumps(asdict(run)) + "\n")
+
+
+def find_baseline(runs: list[Run], reference: str | None) -> Run | None:
+    """
+    Args:
+        runs: The history, oldest first.
+        reference: A label or a commit prefix. None takes the last run labelled "baseline",
+            or the last run when none is.
+
+    Returns:
+        The most recent run matching the reference.
+    """
+    if reference is None:
+        labelled = [run for run in runs if run.label == "baseline"]
+        return (labelled or runs or [None])[-1]
+    for run in reversed(runs):
+        if run.label == reference or (run.commit and run.commit.startswith(reference)):
+            return run
+    return None
+
+
+def compare(
+    current: Run, baseline: Run, tolerances: dict[str, Tolerance]
+) -> list[Comparison]:
+    """Compares the metrics having a tolerance, for the cases present in both runs."""
+    comparisons = []
+    for case, metrics in current.results.items():
+        previous = baseline.results.get(case)
+        if previous is None:
+            continue
+        for metric, tolerance in tolerances.items():
+            if metric not in metrics or metric not in previous:
+                continue
+            value, reference = metrics[metric], previous[metric]
+            increase = value - reference
+            comparisons.append(
+                Comparison(
+                    case=case,
+                    metric=metric,
+                    baseline=reference,
+                    current=value,
+                    regression=increase > tolerance.absolute
+                    and increase > reference * tolerance.relative,
+                )
+            )
+    return comparisons
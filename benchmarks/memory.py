@@ -0,0 +1,337 @@
+"""
+Memory footprint benchmark: resident memory and Python heap of ZORS on a large simulated guild.
+
+The real bot and cogs run on the fake Discord of tools/simulator, with a guild sized like the
+biggest we expect (50k members, 2k roles, hundreds of game categories and parties). Memory is
+sampled after the startup (GUILD_CREATE, user sync), after a burst of activity (the simulator
+storms) and once garbage collected and idle again (steady state), along with the peaks.
+
+The heap is broken down by who allocated it (py-cord, SQLAlchemy, ZORS code...) from
+tracemalloc, the allocations of the fake Discord itself are left out, like its share of the
+resident memory. Object counts are reported for the py-cord caches, the identity maps of the
+open SQLAlchemy sessions and our own in-memory buffers.
+
+Usage:
+    python -m benchmarks.memory --database-url sqlite+aiosqlite:////tmp/zors-memory.db --reset
+    python -m benchmarks.memory ... --members 50000 --roles 2000 --games 200 --parties 500 --budget-mb 256
+
+Exits with status 1 when the steady resident memory exceeds the budget or a metric regressed
+past its tolerance compared with the baseline run of the history (see benchmarks/history.py).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import random
+import resource
+import sys
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+import discord
+from loguru import logger as log
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from benchmarks import history
+from model.schemas import Party
+from tools.simulator.fake_discord import FakeDiscord
+from tools.simulator.harness import SimulatedZORS, running_bot, use_settings
+from tools.simulator.scenarios import StormOptions, build_guild, storms
+from utils.memory import cache_sizes, format_bytes, rss_bytes
+from utils.metrics import metrics
+from utils.tracing import tracer
+
+SUITE = "memory"
+DEFAULT_HISTORY = Path("benchmarks/results/memory.jsonl")
+MB = 1024 * 1024
+
+# Allocation sites, by the path of the file that allocated
+owners = {
+    "simulator": ("/tools/simulator/", "/benchmarks/"),
+    "py-cord": ("/discord/",),
+    "sqlalchemy": ("/sqlalchemy/", "/sqlmodel/"),
+    "pydantic": ("/pydantic/", "/pydantic_core/"),
+    "zors": ("/cogs/", "/model/", "/utils/", "/main.py"),
+}
+
+tolerances = {
+    "rss_mb": history.Tolerance(relative=0.1, absolute=5.0),
+    "heap_mb": history.Tolerance(relative=0.1, absolute=2.0),
+    "peak_rss_mb": history.Tolerance(relative=0.1, absolute=5.0),
+    "mb": history.Tolerance(relative=0.1, absolute=1.0),
+}
+
+
+def _owner(filename: str) -> str:
+    for owner, fragments in owners.items():
+        if any(fragment in filename for fragment in fragments):
+            return owner
+    return "other"
+
+
+def heap_breakdown() -> dict[str, int]:
+    """Live traced memory by owner of the allocation site."""
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    breakdown = dict.fromkeys([*owners, "other"], 0)
+    for stat in snapshot.statistics("filename"):
+        breakdown[_owner(stat.traceback[0].filename)] += stat.size
+    return breakdown
+
+
+def identity_map_objects() -> int:
+    """Objects held by the identity maps of the sessions still alive."""
+    return sum(
+        len(obj.identity_map) for obj in gc.get_objects() if isinstance(obj, Session)
+    )
+
+
+def own_buffers(bot: SimulatedZORS) -> dict[str, int]:
+    """Entries of the bot's own in-memory buffers and registries."""
+    return {
+        "metric_series": sum(
+            len(metric.children()) for metric in metrics._metrics.values()
+        ),
+        "traces": len(tracer.traces),
+        "slow_queries": len(bot.database.queries.slow_queries),
+        "loop_stalls": len(bot.watchdog.recent_stalls) if bot.watchdog else 0,
+    }
+
+
+class Probe:
+    """Samples the memory of the bot, net of what the fake Discord uses."""
+
+    def __init__(self, fake_rss: int):
+        self.fake_rss = fake_rss
+        self.results: dict[str, dict[str, float]] = {}
+
+    def sample(self, phase: str, bot: SimulatedZORS) -> None:
+        heap = heap_breakdown()
+        bot_heap = sum(size for owner, size in heap.items() if owner != "simulator")
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.results[phase] = {
+            "rss_mb": round((rss_bytes() - self.fake_rss) / MB, 1),
+            "heap_mb": round(bot_heap / MB, 1),
+            "peak_rss_mb": round((peak_rss - self.fake_rss) / MB, 1),
+            "peak_heap_mb": round(tracemalloc.get_traced_memory()[1] / MB, 1),
+            "identity_map_objects": identity_map_objects(),
+        }
+        for owner, size in heap.items():
+            if owner != "simulator":
+                self.results[f"{phase}.heap[{owner}]"] = {"mb": round(size / MB, 2)}
+        self.results[f"{phase}.objects"] = {
+            **{f"pycord_{name}": count for name, count in cache_sizes(bot).items()},
+            **own_buffers(bot),
+        }
+        log.info(f"{phase}: {self.results[phase]}")
+
+
+def build_large_guild(
+    fake: FakeDiscord, args: argparse.Namespace
+) -> tuple[Any, Any, list[dict[str, Any]], list[dict[str, Any]]]:
+    """The simulated guild, plus the extra roles and the party channels of a big evening."""
+    guild, runtime, games = build_guild(fake, args.members, args.games)
+    for index in range(max(0, args.roles - len(fake.roles))):
+        fake.add_role(f"Rôle {index}", position=index + 10)
+    parties = []
+    for index in range(args.parties):
+        game = games[index % len(games)]
+        owner = guild.members[index % len(guild.members)]
+        channel = fake.add_channel(
+            f"membre{index}-party",
+            discord.ChannelType.voice.value,
+            parent_id=game["id"],
+        )
+        parties.append(
+            {
+                "channel_id": channel,
+                "game_category_id": game["id"],
+                "owner_id": owner,
+                "name": f"membre{index}-party",
+            }
+        )
+    return guild, runtime, games, parties
+
+
+async def benchmark(args: argparse.Namespace) -> history.Run:
+    start_rss = rss_bytes()
+    fake = FakeDiscord(seed=args.seed, latency=args.latency, jitter=0.0)
+    guild, runtime, games, parties = build_large_guild(fake, args)
+    use_settings(runtime)
+    fake_rss = rss_bytes() - start_rss
+    probe = Probe(fake_rss)
+    log.info(
+        f"Fake guild built: {len(fake.members)} members, {len(fake.roles)} roles, "
+        f"{len(fake.channels)} channels ({format_bytes(fake_rss)})"
+    )
+
+    async with running_bot(fake, args.database_url, games, args.reset) as (
+        bot,
+        database,
+    ):
+        async with database.engine.begin() as conn:
+            await conn.execute(insert(Party.__table__), parties)  # type: ignore[attr-defined]
+        probe.sample("startup", bot)
+
+        options = StormOptions(
+            members=min(args.active, len(guild.members)),
+            rate=args.rate,
+            dwell=0.5,
+            hops=1,
+        )
+        rng = random.Random(args.seed)
+        for name in args.storm:
+            await storms[name](fake, guild, options, rng)
+            await bot.idle()
+        probe.sample("activity", bot)
+
+        gc.collect()
+        await asyncio.sleep(args.settle)
+        gc.collect()
+        probe.sample("steady", bot)
+
+    return history.Run(
+        suite=SUITE,
+        results=probe.results,
+        label=args.label,
+        commit=history.current_commit(),
+        environment=history.environment(
+            members=str(args.members),
+            roles=str(args.roles),
+            games=str(args.games),
+            parties=str(args.parties),
+            database=database.engine.dialect.name,
+        ),
+    )
+
+
+def render(run: history.Run) -> str:
+    lines = []
+    for phase in ("startup", "activity", "steady"):
+        values = run.results[phase]
+        lines.append(
+            f"{phase:<9} RSS {values['rss_mb']:>7.1f} MiB (peak {values['peak_rss_mb']:.1f})"
+            f"  heap {values['heap_mb']:>7.1f} MiB (peak {values['peak_heap_mb']:.1f})"
+            f"  identity maps {values['identity_map_objects']:g}"
+        )
+        lines.append(
+            "          heap: "
+            + ", ".join(
+                f"{case.split('[')[1][:-1]} {result['mb']:.1f}"
+                for case, result in run.results.items()
+                if case.startswith(f"{phase}.heap[")
+            )
+        )
+        lines.append(
+            "          objects: "
+            + ", ".join(
+                f"{name} {count:g}"
+                for name, count in run.results[f"{phase}.objects"].items()
+            )
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.memory",
+        description="Measure the memory footprint of ZORS on a large simulated guild.",
+    )
+    parser.add_argument(
+        "--database-url",
+        required=True,
+        help="SQLAlchemy async URL of a scratch database.",
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Drop all tables before starting."
+    )
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--roles", type=int, default=2000)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--parties", type=int, default=500)
+    parser.add_argument(
+        "--storm",
+        nargs="*",
+        choices=list(storms),
+        default=["party", "commands"],
+        help="Activity run between the startup and the steady state samples.",
+    )
+    parser.add_argument(
+        "--active", type=int, default=200, help="Members taking part in the storms."
+    )
+    parser.add_argument("--rate", type=float, default=50.0)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Fake REST latency, in seconds."
+    )
+    parser.add_argument(
+        "--settle", type=float, default=2.0, help="Idle time before the steady sample."
+    )
+    parser.add_argument(
+        "--budget-mb",
+        type=float,
+        help="Steady resident memory allowed (default: memory.budget_mb of the settings).",
+    )
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc depth.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument(
+        "--label", help='Label of this run in the history, e.g. "baseline".'
+    )
+    parser.add_argument(
+        "--baseline",
+        help='Label or commit of the run to compare with (default: last "baseline" run).',
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not append to the history."
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    log.remove()
+    log.add(sys.stderr, level=args.log_level)
+
+    tracemalloc.start(args.frames)
+    previous = history.load(args.history, SUITE)
+    run = asyncio.run(benchmark(args))
+    tracemalloc.stop()
+    if not args.no_save:
+        history.append(args.history, run)
+    print(render(run))
+
+    failed = False
+    budget = args.budget_mb
+    if budget is None:
+        from utils.settings import settings
+
+        budget = settings.runtime.memory.budget_mb
+    steady = run.results["steady"]["rss_mb"]
+    if steady > budget:
+        print(f"OVER BUDGET: steady RSS {steady:.1f} MiB > {budget:g} MiB")
+        failed = True
+
+    baseline = history.find_baseline(previous, args.baseline)
+    if baseline is not None:
+        comparisons = history.compare(run, baseline, tolerances)
+        regressions = [
+            comparison for comparison in comparisons if comparison.regression
+        ]
+        print(
+            f"Compared with {baseline.label or 'run'} {baseline.commit} ({baseline.at})"
+        )
+        for comparison in regressions:
+            print(
+                f"REGRESSION {comparison.case} {comparison.metric}: "
+                f"{comparison.baseline:g} -> {comparison.current:g} ({comparison.change:+.1%})"
+            )
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
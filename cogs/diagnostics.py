@@ -0,0 +1,250 @@
+import asyncio
+import re
+from collections import Counter
+from pathlib import Path
+
+import discord
+from discord.ext import commands
+from loguru import logger as log
+
+from main import ZORS
+from model.database import db_pool_connections
+from utils.memory import AllocationTracker, cache_sizes, format_bytes, rss_bytes
+from utils.metrics import cache_requests, merge_histograms, metrics
+from utils.profiler import profile
+from utils.settings import settings
+from utils.watchdog import loop_lag
+from utils.zors_cog import ZorsCog
+
+_task_number = re.compile(r"-\d+$")
+
+
+def _percentiles(metric_name: str, quantiles=(0.5, 0.95, 0.99)) -> str:
+    """Percentiles of a histogram over all its labels, from the metrics registry."""
+    metric = metrics.get(metric_name)
+    histogram = merge_histograms(metric.children().values()) if metric else None
+    if histogram is None or histogram.count == 0:
+        return "aucune donnée"
+    values = " · ".join(
+        f"p{q * 100:g} {histogram.quantile(q) * 1000:.1f} ms"  # type: ignore[operator]
+        for q in quantiles
+    )
+    return f"{values}\n{histogram.count} mesures"
+
+
+class Diagnostics(ZorsCog):
+    """
+    Outils de diagnostic réservés aux administrateurs, utilisables en production
+    sans redémarrer le bot.
+    """
+
+    def __init__(self, bot: ZORS):
+        self.bot = bot
+        self._profiling = asyncio.Lock()
+        self.allocations = AllocationTracker(settings.runtime.memory.tracemalloc_frames)
+
+    @property
+    def profiles_path(self) -> Path:
+        return Path(settings.runtime.logs_path) / "profiles"
+
+    @commands.slash_command(
+        name="profile",
+        description="Profile le bot pendant quelques secondes (flamegraph).",
+    )
+    @commands.has_permissions(administrator=True)
+    @discord.option(
+        name="seconds",
+        description="Durée de l'échantillonnage en secondes.",
+        min_value=1,
+        max_value=300,
+        default=30,
+    )
+    @discord.option(
+        name="mode",
+        description="threads: temps CPU par pile Python, tasks: où attendent les tâches asyncio.",
+        choices=["threads", "tasks"],
+        default="threads",
+    )
+    async def profile(self, ctx: discord.ApplicationContext, seconds: int, mode: str):
+        """
+        Lance un profileur statistique sur le processus en cours et écrit les piles
+        au format "collapsed" dans logs/profiles/, prêtes pour un flamegraph.
+        """
+        if self._profiling.locked():
+            await ctx.respond("Un profilage est déjà en cours.", ephemeral=True)
+            return
+
+        async with self._profiling:
+            await ctx.defer(ephemeral=True)
+            log.info(f"{ctx.author} started a {seconds}s {mode} profile")
+            result = await profile(mode, seconds)  # type: ignore[arg-type]
+            path = await asyncio.to_thread(result.write, self.profiles_path)
+            log.info(f"Profile written to {path} ({result.samples} samples)")
+
+            # Shares of the stacks counted: a sample counts every thread or task
+            top = "\n".join(
+                f"`{hits / result.total:6.1%}` {frame}" for frame, hits in result.top(5)
+            )
+            await ctx.followup.send(
+                f"Profil `{mode}` de {result.duration:.0f}s ({result.samples} échantillons) "
+                f"écrit dans `{path}`.\n{top}",
+                file=discord.File(path),
+                ephemeral=True,
+            )
+
+    @commands.slash_command(
+        name="memory", description="Diagnostic mémoire du bot (caches, allocations)."
+    )
+    @commands.has_permissions(administrator=True)
+    @discord.option(
+        name="action",
+        description="caches: tailles des caches, snapshot: allocations depuis le dernier snapshot, stop: arrête le suivi.",
+        choices=["caches", "snapshot", "stop"],
+        default="caches",
+    )
+    async def memory(self, ctx: discord.ApplicationContext, action: str):
+        """
+        Affiche la mémoire résidente et la taille des caches py-cord, ou compare
+        deux snapshots tracemalloc pour trouver ce qui grossit.
+        """
+        budget = settings.runtime.memory.budget_mb * 1024 * 1024
+        lines = [
+            f"RSS: **{format_bytes(rss_bytes())}** / budget {format_bytes(budget)}"
+        ]
+        match action:
+            case "caches":
+                lines.extend(
+                    f"`{name:<13}` {size}"
+                    for name, size in cache_sizes(self.bot).items()
+                )
+            case "snapshot":
+                await ctx.defer(ephemeral=True)
+                diffs = await asyncio.to_thread(self.allocations.snapshot)
+                if diffs is None:
+                    lines.append(
+                        "Suivi des allocations démarré, relancez `/memory snapshot` "
+                        "plus tard pour voir ce qui a grossi (`/memory stop` pour l'arrêter)."
+                    )
+                else:
+                    lines.extend(
+                        f"`{format_bytes(diff.size_diff):>11}` ({diff.count_diff:+} objets) {diff.location}"
+                        for diff in diffs
+                    )
+                if (traced := self.allocations.traced_memory()) is not None:
+                    lines.append(
+                        f"Tracé: {format_bytes(traced[0])} (pic {format_bytes(traced[1])})"
+                    )
+            case "stop":
+                self.allocations.stop()
+                lines.append("Suivi des allocations arrêté.")
+        log.info(f"{ctx.author} ran /memory {action}")
+        await ctx.respond("\n".join(lines), ephemeral=True)
+
+    @commands.slash_command(name="perf", description="État de santé du bot en direct.")
+    @commands.has_permissions(administrator=True)
+    async def perf(self, ctx: discord.ApplicationContext):
+        """
+        Statistiques d'exécution lues depuis l'instrumentation (métriques, watchdog,
+        requêtes lentes, caches py-cord), sans aucune requête à la base de données.
+        """
+        now = discord.utils.utcnow()
+        embed = discord.Embed(
+            title="ZORS - performances", color=discord.Color.blurple(), timestamp=now
+        )
+        embed.add_field(
+            name="Uptime", value=str(now - self.bot.started_at).split(".")[0]
+        )
+        embed.add_field(name="Gateway", value=f"{self.bot.latency * 1000:.0f} ms")
+        embed.add_field(
+            name="Mémoire",
+            value=f"{format_bytes(rss_bytes())} / {settings.runtime.memory.budget_mb} MiB",
+        )
+
+        lag = _percentiles(loop_lag.name)
+        if self.bot.watchdog is not None and self.bot.watchdog.recent_stalls:
+            worst = max(
+                self.bot.watchdog.recent_stalls, key=lambda stall: stall.duration
+            )
+            lag += (
+                f"\n{len(self.bot.watchdog.recent_stalls)} blocages récents, "
+                f"pire {worst.duration * 1000:.0f} ms ({worst.handler})"
+            )
+        embed.add_field(name="Latence de la boucle", value=lag, inline=False)
+        embed.add_field(
+            name="Commandes",
+            value=_percentiles("zors_command_duration_seconds"),
+            inline=False,
+        )
+
+        pool = {
+            state: child.value
+            for (state,), child in db_pool_connections.children().items()
+        }
+        embed.add_field(
+            name="Pool DB",
+            value=" · ".join(f"{state} {value:.0f}" for state, value in pool.items())
+            or "aucune donnée",
+            inline=False,
+        )
+        slow_queries = sorted(
+            self.bot.database.queries.slow_queries,
+            key=lambda query: query.duration,
+            reverse=True,
+        )[:3]
+        embed.add_field(
+            name="Requêtes lentes récentes",
+            value="\n".join(
+                f"`{query.duration * 1000:.0f} ms` {query.origin}: "
+                f"`{' '.join(query.statement.split())[:80]}`"
+                for query in slow_queries
+            )
+            or "aucune",
+            inline=False,
+        )
+
+        lookups: dict[str, Counter[str]] = {}
+        for (cache, result), child in cache_requests.children().items():
+            lookups.setdefault(cache, Counter())[result] += int(child.value)
+        embed.add_field(
+            name="Caches",
+            value="\n".join(
+                f"{cache}: {counts['hit'] / total:.1%} de hits ({total} lectures)"
+                for cache, counts in lookups.items()
+                if (total := counts["hit"] + counts["miss"])
+            )
+            or "aucune lecture",
+            inline=False,
+        )
+
+        gaming = self.bot.get_cog("Gaming")
+        guild = ctx.guild
+        if gaming is not None and guild is not None:
+            parties = [
+                channel
+                for channel in guild.voice_channels
+                if gaming.is_party_channel(channel)  # type: ignore[attr-defined]
+            ]
+            embed.add_field(
+                name="Parties",
+                value=f"{len(parties)} salons, "
+                f"{sum(1 for channel in parties if channel.members)} occupés",
+            )
+        sizes = cache_sizes(self.bot)
+        embed.add_field(
+            name="Cache py-cord",
+            value=f"{sizes['members']} membres · {sizes['messages']} messages",
+        )
+
+        tasks = Counter(
+            _task_number.sub("", task.get_name()) for task in asyncio.all_tasks()
+        )
+        embed.add_field(
+            name=f"Tâches en cours ({tasks.total()})",
+            value="\n".join(f"{name}: {count}" for name, count in tasks.most_common(5)),
+            inline=False,
+        )
+        await ctx.respond(embed=embed, ephemeral=True)
+
+
+def setup(bot: ZORS):
+    bot.add_cog(Diagnostics(bot))
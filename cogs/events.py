@@ -1,3 +1,9 @@
+import sys
+from contextlib import AsyncExitStack
+from contextvars import ContextVar, Token
+from time import perf_counter
+from typing import cast
+
 import discord
 from discord import ApplicationContext
 from discord.ext import commands
@@ -5,12 +11,29 @@ from loguru import logger as log
 
 from main import ZORS
 from model.managers import MemberManager
+from utils.logger import TraceSampler, bind_context
+from utils.metrics import metrics
+from utils.tracing import Span, tracer
 from utils.zors_cog import ZorsCog
 
+_command_sampler = TraceSampler()
+_command_started: ContextVar[float] = ContextVar("command_started")
+_command_trace: ContextVar[tuple[Span, Token] | None] = ContextVar("command_trace")
+_command_transaction: ContextVar[AsyncExitStack | None] = ContextVar(
+    "command_transaction", default=None
+)
+
+command_duration = metrics.histogram(
+    "zors_command_duration_seconds", "Slash command latency.", ("command",)
+)
+command_errors = metrics.counter(
+    "zors_command_errors_total", "Slash commands that raised an error.", ("command",)
+)
+
 
 async def _log_every_command(ctx: ApplicationContext):
     """
-    Logs every command called by a user.
+    Logs every command called by a user and opens its transaction.
     This is used instead of the default on_application_command since it runs in parallel with the command not before it.
     Args:
         ctx: The context of the command.
@@ -18,13 +41,77 @@ async def _log_every_command(ctx: ApplicationContext):
     Returns:
 
     """
-    log.trace(f"Command {ctx.command} called by {ctx.author}.")
+    _command_started.set(perf_counter())
+    cog = ctx.cog.qualified_name if ctx.cog else None
+    member_id = ctx.author.id if ctx.author else None
+    command = ctx.command.qualified_name if ctx.command else None
+    trace = tracer.start_trace(
+        f"/{command}",
+        cog=cog,
+        guild_id=ctx.guild_id,
+        member_id=member_id,
+        interaction_id=ctx.interaction.id,
+    )
+    _command_trace.set(trace)
+    bind_context(
+        cog=cog,
+        guild_id=ctx.guild_id,
+        member_id=member_id,
+        command=command,
+        trace_id=trace[0].trace.trace_id if trace is not None else None,
+    )
+    if _command_sampler.should_log():
+        log.trace(f"Command {ctx.command} called by {ctx.author}.")
+    # One transaction per command: its get_session() calls share it (see model/unitofwork.py)
+    transaction = AsyncExitStack()
+    await transaction.enter_async_context(cast(ZORS, ctx.bot).database.transaction())
+    _command_transaction.set(transaction)
+
+
+async def _log_command_duration(ctx: ApplicationContext):
+    """
+    Logs how long a command took and ends its transaction, runs after the command even if it failed.
+    Args:
+        ctx: The context of the command.
+
+    Returns:
+
+    """
+    if (transaction := _command_transaction.get()) is not None:
+        _command_transaction.set(None)
+        # Committed, or rolled back when the command failed
+        if (error := sys.exception()) is None:
+            await transaction.__aexit__(None, None, None)
+        else:
+            await transaction.__aexit__(type(error), error, error.__traceback__)
+    duration = perf_counter() - _command_started.get(perf_counter())
+    duration_ms = duration * 1000
+    command_duration.labels(
+        ctx.command.qualified_name if ctx.command else None
+    ).observe(duration)
+    bind_context(duration_ms=round(duration_ms, 2))
+    if (trace := _command_trace.get(None)) is not None:
+        span, token = trace
+        # The after hooks run in the finally clause around the command, the exception is still in flight
+        if (error := sys.exception()) is not None:
+            span.record_error(error)
+        tracer.end_trace(span, token)
+    log.debug(f"Command {ctx.command} finished in {duration_ms:.1f} ms.")
 
 
 class Events(ZorsCog):
+    # member_remove is only dispatched for cached members
+    required_intents = frozenset({"members"})
+    member_cache = frozenset({"joined"})
+
     def __init__(self, bot: ZORS):
         self.bot = bot
         self.bot.before_invoke(_log_every_command)
+        self.bot.after_invoke(_log_command_duration)
+        if self.bot.memberships is None:
+            # Without the write-behind buffer, one transaction per member
+            self.bot.work.register("member_join", self._add_member)
+            self.bot.work.register("member_remove", self._remove_member)
 
     @discord.Cog.listener()
     async def on_application_command_error(
@@ -32,6 +119,7 @@ class Events(ZorsCog):
         ctx: discord.ApplicationContext,
         error,  # not typed because it can be any exception
     ):
+        command_errors.labels(ctx.command.qualified_name if ctx.command else None).inc()
         message_beginning = (
             f"An error occurred while executing the command {ctx.command}."
         )
@@ -79,21 +167,37 @@ class Events(ZorsCog):
 
     @discord.Cog.listener()
     async def on_member_join(self, member: discord.Member):
+        self.bind_log_context(member)
         log.debug(f"Member {member} joined the server.")
         if member.bot:
             log.debug(f"Member {member} is a bot, skipping.")
             return
-        async with self.bot.database.get_session() as session:
-            await MemberManager.add(session, member)
+        if self.bot.memberships is not None:
+            self.bot.memberships.joined(member)
+        else:
+            await self.bot.work.submit("member_join", member.id, member)
 
     @discord.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
+        self.bind_log_context(member)
         log.trace(f"Member {member} left the server.")
         if member.bot:
             log.debug(f"Member {member} is a bot, skipping.")
             return
+        if self.bot.memberships is not None:
+            self.bot.memberships.left(member.id)
+        else:
+            await self.bot.work.submit("member_remove", member.id, member.id)
+
+    async def _add_member(self, member: discord.Member):
+        async with self.bot.database.get_session() as session:
+            await MemberManager.apply_memberships(
+                session, {member.id: member.display_name}, []
+            )
+
+    async def _remove_member(self, member_id: int):
         async with self.bot.database.get_session() as session:
-            await MemberManager.delete(session, member.id)
+            await MemberManager.apply_memberships(session, {}, [member_id])
 
 
 def setup(bot: ZORS):
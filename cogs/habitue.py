@@ -10,6 +10,7 @@ from main import ZORS
 from model.managers import HabitueManager
 from utils.positioning import place_with_config
 from utils.settings import settings
+from utils.workqueue import Policy
 from utils.zors_cog import ZorsCog
 
 # Define default colors at module level for decorator access
@@ -31,6 +32,10 @@ default_colors = {
 
 
 class Habitue(ZorsCog):
+    # member_update is only dispatched for cached members, the checkup reads guild.members
+    required_intents = frozenset({"members"})
+    member_cache = frozenset({"joined"})
+
     habitue_colorname_template = "couleur {username}"
     _processed_habitue: Member | None = (
         None  # TODO turn it into a set to handle multiple members being processed at the same time
@@ -38,6 +43,21 @@ class Habitue(ZorsCog):
 
     def __init__(self, bot: ZORS):
         self.bot = bot
+        if bot.database.changes is not None:
+            bot.database.changes.subscribe(self._on_habitue_change, ("habitue",))
+        # A role given then taken back before being handled cancel each other out
+        bot.work.register(
+            "member_update",
+            self._on_habitue_role,
+            Policy.COALESCE,
+            lambda waiting, new: new if waiting[2] == new[2] else None,
+        )
+
+    def _on_habitue_change(
+        self, table: str, key: str | None, deleted: bool = False
+    ) -> None:
+        # Another process may have recreated the role, look it up again
+        self.__dict__.pop("role_habitue", None)
 
     @cached_property
     def role_habitue(self) -> Role:
@@ -51,15 +71,23 @@ class Habitue(ZorsCog):
 
     @commands.Cog.listener()
     async def on_member_update(self, before: Member, after: Member):
+        self.bind_log_context(after)
         if self._processed_habitue:
             if before.id == self._processed_habitue.id:
                 return
-        if self.role_habitue not in before.roles and self.role_habitue in after.roles:
-            log.info(f"{after.display_name} was given the habitue role")
-            await self._add_habitue(after.guild, after)
-        elif self.role_habitue in before.roles and self.role_habitue not in after.roles:
-            log.info(f"{after.display_name} was removed from the habitue role")
-            await self._remove_habitue(after.guild, after)
+        given = self.role_habitue in after.roles
+        if given != (self.role_habitue in before.roles):
+            await self.bot.work.submit(
+                "member_update", after.id, after.guild, after, given
+            )
+
+    async def _on_habitue_role(self, guild: Guild, member: Member, given: bool):
+        if given:
+            log.info(f"{member.display_name} was given the habitue role")
+            await self._add_habitue(guild, member)
+        else:
+            log.info(f"{member.display_name} was removed from the habitue role")
+            await self._remove_habitue(guild, member)
 
     @commands.slash_command(
         name="add_habitue", description="Add a habitue to the server."
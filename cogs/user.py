@@ -6,6 +6,10 @@ from utils.zors_cog import ZorsCog
 
 
 class Member(ZorsCog):
+    # The checkup reads guild.members
+    required_intents = frozenset({"members"})
+    member_cache = frozenset({"joined"})
+
     def __init__(self, bot: ZORS):
         self.bot = bot
 
@@ -8,6 +8,7 @@ from loguru import logger as log
 from main import ZORS
 from model.managers import GameCategoryManager, PartyManager
 from model.schemas import GameCategory
+from model.views import GameRow, GameSummary
 from utils.positioning import place_with_config
 from utils.settings import settings
 from utils.zors_cog import ZorsCog
@@ -20,8 +21,17 @@ class Gaming(ZorsCog):
     et gère des salons vocaux dynamiques pour les parties.
     """
 
+    # Parties are emptied when their voice channel has no members left
+    required_intents = frozenset({"voice_states"})
+    member_cache = frozenset({"voice"})
+
     def __init__(self, bot: ZORS):
         self.bot = bot
+        self.party_logic_duration = self.metric_histogram(
+            "party_logic_duration_seconds",
+            "Time spent handling a voice state update in party_logic.",
+        )
+        bot.work.register("voice_state_update", self._timed_party_logic)
 
     # region events
 
@@ -36,11 +46,25 @@ class Gaming(ZorsCog):
         Gère la création et suppression des salons vocaux dynamiques pour les parties.
         Délègue le traitement à des fonctions spécialisées.
         """
-        # Appel à la fonction qui gère la logique des parties
-        await self.party_logic(member, before, after)
+        self.bind_log_context(member)
+        # Traitées dans l'ordre pour un même membre, par la file de travail du bot
+        await self.bot.work.submit(
+            "voice_state_update", member.id, member, before, after
+        )
 
     # endregion
 
+    async def _timed_party_logic(
+        self, member: Member, before: VoiceState, after: VoiceState
+    ):
+        with self.party_logic_duration.time():
+            await self.party_logic(member, before, after)
+
+    @staticmethod
+    def is_party_channel(channel: discord.abc.GuildChannel) -> bool:
+        """Les salons de partie sont nommés "<membre>-party", les hubs "➕Add Party"."""
+        return channel.name.endswith("-party") and not channel.name.startswith("➕")
+
     async def get_game_channel_associations(
         self, ctx: discord.AutocompleteContext
     ) -> list[discord.OptionChoice]:
@@ -48,22 +72,38 @@ class Gaming(ZorsCog):
         Récupère les noms et IDs des catégories de jeux depuis la base de données.
         Utilisé pour l'autocomplétion des commandes slash.
         """
-        async with self.bot.database.get_session() as session:
-            game_categories: list[GameCategory] = await GameCategoryManager.get_all(
-                session
+        games = self.bot.preload.games()
+        if games is not None:
+            game_categories: list[GameRow] | list[GameSummary] = list(
+                games.by_id.values()
             )
-            if not game_categories:
-                return [
-                    discord.OptionChoice(
-                        name="Aucune catégorie de jeu trouvée", value="0"
-                    )
-                ]
+        else:
+            async with self.bot.database.get_session() as session:
+                game_categories = await GameCategoryManager.get_summaries(session)
+        if not game_categories:
             return [
-                discord.OptionChoice(
-                    name=game_category.name, value=str(game_category.id)
-                )
-                for game_category in game_categories
+                discord.OptionChoice(name="Aucune catégorie de jeu trouvée", value="0")
             ]
+        return [
+            discord.OptionChoice(name=game_category.name, value=str(game_category.id))
+            for game_category in game_categories
+        ]
+
+    async def get_game_category(self, id: int) -> GameCategory | GameRow | None:
+        """La catégorie de jeu préchargée, ou lue en base si le préchargement n'est pas à jour."""
+        games = self.bot.preload.games()
+        if games is not None:
+            return games.by_id.get(id)
+        async with self.bot.database.get_session() as session:
+            return await GameCategoryManager.get_by_id(session, id)
+
+    async def get_hub_category(self, channel_id: int) -> GameCategory | GameRow | None:
+        """La catégorie de jeu dont channel_id est le salon "Add Party", s'il en est un."""
+        games = self.bot.preload.games()
+        if games is not None:
+            return games.by_voice.get(channel_id)
+        async with self.bot.database.get_session() as session:
+            return await GameCategoryManager.get_by_voice_id(session, channel_id)
 
     @commands.slash_command(name="add_game", description="Ajoute un jeu au serveur.")
     @commands.has_permissions(manage_channels=True)
@@ -211,32 +251,31 @@ class Gaming(ZorsCog):
         guild = self.require_guild(ctx)
         author = self.require_member(ctx)
 
-        async with self.bot.database.get_session() as session:
-            game_category = await GameCategoryManager.get_by_id(session, int(game))
-            if not game_category:
-                await ctx.respond("Ce jeu n'existe pas.", ephemeral=True)
-                return
-
-            role = guild.get_role(game_category.role_id)
-            if not role:
-                await ctx.respond("Le rôle de ce jeu est introuvable.", ephemeral=True)
-                log.error(
-                    f"Rôle {game_category.role_id} introuvable pour {game_category.name}"
-                )
-                return
-
-            if role in author.roles:
-                await ctx.respond(
-                    f"Vous avez déjà accès à {game_category.name}.", ephemeral=True
-                )
-                return
-
-            await author.add_roles(role, reason="Rejoint le jeu via /join_game")
+        game_category = await self.get_game_category(int(game))
+        if not game_category:
+            await ctx.respond("Ce jeu n'existe pas.", ephemeral=True)
+            return
+
+        role = guild.get_role(game_category.role_id)
+        if not role:
+            await ctx.respond("Le rôle de ce jeu est introuvable.", ephemeral=True)
+            log.error(
+                f"Rôle {game_category.role_id} introuvable pour {game_category.name}"
+            )
+            return
 
+        if role in author.roles:
             await ctx.respond(
-                f"Vous avez rejoint {game_category.name} ! 🎮", ephemeral=True
+                f"Vous avez déjà accès à {game_category.name}.", ephemeral=True
             )
-            log.info(f"{author.display_name} a rejoint {game_category.name}")
+            return
+
+        await author.add_roles(role, reason="Rejoint le jeu via /join_game")
+
+        await ctx.respond(
+            f"Vous avez rejoint {game_category.name} ! 🎮", ephemeral=True
+        )
+        log.info(f"{author.display_name} a rejoint {game_category.name}")
 
     @commands.slash_command(
         name="leave_game",
@@ -253,30 +292,29 @@ class Gaming(ZorsCog):
         guild = self.require_guild(ctx)
         author = self.require_member(ctx)
 
-        async with self.bot.database.get_session() as session:
-            game_category = await GameCategoryManager.get_by_id(session, int(game))
-            if not game_category:
-                await ctx.respond("Ce jeu n'existe pas.", ephemeral=True)
-                return
-
-            role = guild.get_role(game_category.role_id)
-            if not role:
-                await ctx.respond("Le rôle de ce jeu est introuvable.", ephemeral=True)
-                log.error(
-                    f"Rôle {game_category.role_id} introuvable pour {game_category.name}"
-                )
-                return
-
-            if role not in author.roles:
-                await ctx.respond(
-                    f"Vous n'avez pas accès à {game_category.name}.", ephemeral=True
-                )
-                return
-
-            await author.remove_roles(role, reason="Quitté le jeu via /leave_game")
-
-            await ctx.respond(f"Vous avez quitté {game_category.name}.", ephemeral=True)
-            log.info(f"{author.display_name} a quitté {game_category.name}")
+        game_category = await self.get_game_category(int(game))
+        if not game_category:
+            await ctx.respond("Ce jeu n'existe pas.", ephemeral=True)
+            return
+
+        role = guild.get_role(game_category.role_id)
+        if not role:
+            await ctx.respond("Le rôle de ce jeu est introuvable.", ephemeral=True)
+            log.error(
+                f"Rôle {game_category.role_id} introuvable pour {game_category.name}"
+            )
+            return
+
+        if role not in author.roles:
+            await ctx.respond(
+                f"Vous n'avez pas accès à {game_category.name}.", ephemeral=True
+            )
+            return
+
+        await author.remove_roles(role, reason="Quitté le jeu via /leave_game")
+
+        await ctx.respond(f"Vous avez quitté {game_category.name}.", ephemeral=True)
+        log.info(f"{author.display_name} a quitté {game_category.name}")
 
     async def party_logic(
         self,
@@ -292,88 +330,99 @@ class Gaming(ZorsCog):
         # Création d'un salon temporaire
         if before.channel != after.channel and after.channel is not None:
             after_channel = after.channel  # Type narrowing helper
-            async with self.bot.database.get_session() as session:
-                # Vérifier si le salon rejoint est un salon "Add Party"
-                game_categories: list[GameCategory] = await GameCategoryManager.get_all(
-                    session
-                )
-
-                for game_category in game_categories:
-                    if after_channel.id == game_category.voice_id:
-                        # Récupérer les parties de l'utilisateur
-                        user_parties = await PartyManager.get_by_owner(
-                            session, member.id
-                        )
-
-                        # Vérifier s'il a déjà une partie dans cette catégorie
-                        existing_party = next(
-                            (
-                                p
-                                for p in user_parties
-                                if p.game_category_id == game_category.id
-                            ),
-                            None,
+            # Vérifier si le salon rejoint est un salon "Add Party"
+            game_category = await self.get_hub_category(after_channel.id)
+            if game_category is not None:
+                async with self.bot.database.get_session() as session:
+                    # Un seul traitement à la fois par membre et par jeu, même entre
+                    # plusieurs instances : les autres laissent faire celui qui l'a
+                    if not await PartyManager.lock_creation(
+                        session, member.id, game_category.id
+                    ):
+                        log.debug(
+                            f"Partie de {member.display_name} déjà en cours de création"
                         )
+                        return
+
+                    # Récupérer les parties de l'utilisateur
+                    user_parties = await PartyManager.get_by_owner(session, member.id)
+
+                    # Vérifier s'il a déjà une partie dans cette catégorie
+                    existing_party = next(
+                        (
+                            p
+                            for p in user_parties
+                            if p.game_category_id == game_category.id
+                        ),
+                        None,
+                    )
 
-                        if existing_party:
-                            # Utiliser la partie existante
-                            channel = self.bot.get_channel(existing_party.channel_id)
-                            if channel and isinstance(
-                                channel, (VoiceChannel, discord.StageChannel)
-                            ):
-                                await member.move_to(channel)
-                                log.info(
-                                    f"Déplacement de {member.display_name} vers sa partie existante"
-                                )
-                                return
-                            else:
-                                # Si le salon n'existe plus, le supprimer de la BDD
-                                await PartyManager.delete(
-                                    session, existing_party.channel_id
-                                )
-
-                        # Créer un nouveau salon vocal
-                        category = after_channel.category
-                        if isinstance(category, CategoryChannel):
-                            party_name = f"{member.display_name}-party"
-                            new_channel = await category.create_voice_channel(
-                                party_name
+                    if existing_party:
+                        # Utiliser la partie existante
+                        channel = self.bot.get_channel(existing_party.channel_id)
+                        if channel and isinstance(
+                            channel, (VoiceChannel, discord.StageChannel)
+                        ):
+                            await member.move_to(channel)
+                            log.info(
+                                f"Déplacement de {member.display_name} vers sa partie existante"
                             )
-                        else:
-                            log.debug("La catégorie du salon n'est pas valide.")
                             return
+                        else:
+                            # Si le salon n'existe plus, le supprimer de la BDD
+                            await PartyManager.delete(
+                                session, existing_party.channel_id
+                            )
+                            # Le commit de la suppression a libéré le verrou
+                            if not await PartyManager.lock_creation(
+                                session, member.id, game_category.id
+                            ):
+                                return
 
-                        # Enregistrer dans la BDD
-                        await PartyManager.add(
-                            session, game_category, party_name, member, new_channel.id
-                        )
-
-                        # Déplacer le membre
-                        await member.move_to(new_channel)
-                        log.info(
-                            f"Salon '{party_name}' créé pour {member.display_name}"
-                        )
-                        break
+                    # Créer un nouveau salon vocal
+                    category = after_channel.category
+                    if isinstance(category, CategoryChannel):
+                        party_name = f"{member.display_name}-party"
+                        new_channel = await category.create_voice_channel(party_name)
+                    else:
+                        log.debug("La catégorie du salon n'est pas valide.")
+                        return
+
+                    # Enregistrer dans la BDD
+                    party = await PartyManager.add(
+                        session, game_category, party_name, member, new_channel.id
+                    )
+                    if party is not None and party.channel_id != new_channel.id:
+                        # Une autre instance a créé la partie entre-temps
+                        await new_channel.delete()
+                        existing = self.bot.get_channel(party.channel_id)
+                        if isinstance(existing, (VoiceChannel, discord.StageChannel)):
+                            await member.move_to(existing)
+                        return
+
+                    # Déplacer le membre
+                    await member.move_to(new_channel)
+                    log.info(f"Salon '{party_name}' créé pour {member.display_name}")
 
         # Suppression d'un salon temporaire vide
         if before.channel is not None and (
             after.channel != before.channel or after.channel is None
         ):
             # Vérifier si c'est un salon de partie
-            if before.channel.name.endswith(
-                "-party"
-            ) and not before.channel.name.startswith("➕"):
+            if self.is_party_channel(before.channel):
                 # Attendre pour vérifier que le salon est vide
                 await asyncio.sleep(0.5)
 
                 if len(before.channel.members) == 0:
                     async with self.bot.database.get_session() as session:
-                        # Supprimer la partie de la BDD
-                        party = await PartyManager.get_by_channel_id(
-                            session, before.channel.id
-                        )
-                        if party:
-                            await PartyManager.delete(session, before.channel.id)
+                        # Supprimer la partie de la BDD, s'il y en a une
+                        parties = self.bot.preload.parties()
+                        if parties is None or before.channel.id in parties.by_channel:
+                            party = await PartyManager.get_by_channel_id(
+                                session, before.channel.id
+                            )
+                            if party:
+                                await PartyManager.delete(session, before.channel.id)
 
                         # Supprimer le salon
                         await before.channel.delete()
@@ -57,7 +57,16 @@ if [ "$AUTO_MIGRATE_DB" = "true" ]; then
   # remove the old migration version from the database to avoid conflicts and force alembic to create a new one
   psql -h "$POSTGRES_HOST" -U "$POSTGRES_USER" -d "$POSTGRES_DB" -c "DELETE FROM alembic_version;" > /dev/null 2>&1
 
-  # Créer d'abord la révision avec --autogenerate
+  # Appliquer les migrations versionnées (alembic/versions), l'autogénération part de leur résultat
+  if ! alembic upgrade head; then
+    echo "❌ Échec des migrations versionnées."
+    # Nettoyage du mot de passe avant de quitter
+    unset PGPASSWORD
+    exit 1
+  fi
+  VERSIONED_REVISIONS=$(ls /app/alembic/versions/*.py 2> /dev/null)
+
+  # Créer ensuite la révision avec --autogenerate
   if ! alembic revision --autogenerate -m "Auto-migration $(date +%Y%m%d_%H%M%S)"; then
     echo "❌ Échec de la création de la révision Alembic (erreur de base de données)."
     # Nettoyage du mot de passe avant de quitter
@@ -65,8 +74,8 @@ if [ "$AUTO_MIGRATE_DB" = "true" ]; then
     exit 1
   fi
 
-  # Récupérer le nom du fichier de la dernière révision créée
-  LATEST_REVISION=$(ls -t /app/alembic/versions/*.py 2> /dev/null | head -1)
+  # Récupérer le nom du fichier de la dernière révision créée (pas une révision versionnée)
+  LATEST_REVISION=$(ls -t /app/alembic/versions/*.py 2> /dev/null | grep -vxF "$VERSIONED_REVISIONS" | head -1)
 
   # Extract only the revision ID (the first part before the underscore "_")
   REVISION_ID=$(basename "$LATEST_REVISION" .py | cut -d'_' -f1)
@@ -91,7 +100,7 @@ if [ "$AUTO_MIGRATE_DB" = "true" ]; then
     echo "Application des migrations..."
     if alembic upgrade head; then
       echo "✓ Migrations automatiques appliquées avec succès."
-      rm -f /app/alembic/versions/*.py
+      rm -f "$LATEST_REVISION"
     else
       echo "❌ Échec des migrations automatiques."
 
@@ -1,25 +1,92 @@
+import importlib
+import logging
 import traceback
 from asyncio import run
+from pathlib import Path
 from sys import exit
+from time import perf_counter
+from typing import Any
 
 import discord
 from discord import Guild
 from discord.ext import commands
+from discord.http import Route
 from loguru import logger as log
 from typing_extensions import override
 
 from model.database import Database
+from model.preload import Preload
+from model.writebehind import MembershipWriteBehind
 from utils import logger
+from utils.journal import GatewayJournal
+from utils.memory import CacheConfiguration, register_memory_metrics
+from utils.metrics import MetricsExporter, metrics
 from utils.settings import ConfigurationError, settings
+from utils.tracing import tracer
+from utils.watchdog import LoopWatchdog
+from utils.workqueue import WorkQueue
+from utils.zors_cog import ZorsCog
+
+gateway_events = metrics.counter(
+    "zors_gateway_events_total", "Gateway events dispatched, by event.", ("event",)
+)
+discord_requests = metrics.histogram(
+    "zors_discord_request_duration_seconds",
+    "Discord REST calls, rate limit waits included.",
+    ("method", "route", "status"),
+)
+discord_ratelimits = metrics.counter(
+    "zors_discord_ratelimited_total", "Discord REST calls answered with a 429."
+)
+discord_ratelimit_wait = metrics.counter(
+    "zors_discord_ratelimit_wait_seconds_total",
+    "Time spent sleeping on Discord 429 responses.",
+)
+
+
+class _RateLimitObserver(logging.Handler):
+    """Counts the 429 sleeps py-cord reports through its 'discord.http' logger."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if isinstance(record.msg, str) and record.msg.startswith(
+            "We are being rate limited"
+        ):
+            discord_ratelimits.inc()
+            discord_ratelimit_wait.inc(float(record.args[0]))  # type: ignore[index]
 
 
 class ZORS(commands.Bot):
     database: Database
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, database: Database | None = None, **kwargs):
         log.debug("ZORS bot is starting up...")
         super().__init__(*args, **kwargs)
-        self.database = Database(str(settings.env.postgres_url))
+        self.started_at = discord.utils.utcnow()
+        self.database = database or Database(
+            str(settings.env.postgres_url), settings.runtime.database
+        )
+        self._metrics_exporter: MetricsExporter | None = None
+        self.watchdog: LoopWatchdog | None = None
+        self.journal: GatewayJournal | None = None
+        # Database work of the gateway listeners, the cogs register their jobs on it
+        self.work = WorkQueue(
+            settings.runtime.work_queue.workers,
+            settings.runtime.work_queue.capacity,
+            settings.runtime.work_queue.policies,
+        )
+        # Member arrivals and departures, written in batches (None: one by one, see Events)
+        self.memberships: MembershipWriteBehind | None = None
+        if settings.runtime.database.write_behind:
+            self.memberships = MembershipWriteBehind(
+                self.database,
+                settings.runtime.database.write_behind_window_s,
+                settings.runtime.database.write_behind_max_rows,
+            )
+        # Small tables read by the handlers, loaded on READY
+        self.preload = Preload(self.database, settings.runtime.database.preload)
+        self.add_listener(self.preload.load, "on_ready")
+        self._instrument_http()
+        register_memory_metrics(self)
         log.info("Successfully connected to the database")
         log.trace("ZORS bot has been initialized.")
         log.info("Loading cogs...")
@@ -30,30 +97,49 @@ class ZORS(commands.Bot):
         Creates an instance of the bot.
         Returns: ZORS - Instance of the bot.
         """
-        zorsintents = discord.Intents.none()
-        zorsintents.members = True
-        zorsintents.guilds = True
-        zorsintents.guild_messages = True
-        zorsintents.bans = True
-        zorsintents.emojis_and_stickers = True
-        zorsintents.webhooks = True
-        zorsintents.messages = True
-        zorsintents.message_content = True
-        zorsintents.reactions = True
-        zorsintents.auto_moderation_configuration = True
-        zorsintents.auto_moderation_execution = True
-        zorsintents.voice_states = True
+        caches = CacheConfiguration.from_cogs(
+            cls._cog_classes(),
+            settings.runtime.memory.budget_mb,
+            settings.runtime.memory.max_messages,
+        )
+        log.info(f"Cache configuration: {caches.describe()}")
 
         bot = ZORS(
             description="ZORS !",
             activity=discord.Activity(type=discord.ActivityType.custom, name="ZORS !"),
-            intents=zorsintents,
+            intents=caches.intents,
+            member_cache_flags=caches.member_cache_flags,
+            max_messages=caches.max_messages,
             help_command=None,
         )
         await bot.database.create_db_and_tables()
         bot._load_cogs()
         return bot
 
+    @staticmethod
+    def _cog_classes() -> list[type[ZorsCog]]:
+        """
+        Imports the cog modules to read what they need before the bot exists,
+        intents and caches can't be changed once it is created.
+        Returns: The ZorsCog subclasses defined in the cogs directory.
+        """
+        root = Path(__file__).parent
+        classes: list[type[ZorsCog]] = []
+        for path in sorted((root / "cogs").rglob("*.py")):
+            if path.name.startswith("_"):
+                continue
+            module = importlib.import_module(
+                ".".join(path.relative_to(root).with_suffix("").parts)
+            )
+            classes.extend(
+                value
+                for value in vars(module).values()
+                if isinstance(value, type)
+                and issubclass(value, ZorsCog)
+                and value.__module__ == module.__name__
+            )
+        return classes
+
     @property
     def main_guild(self) -> Guild:
         guild = self.get_guild(settings.runtime.main_guild)
@@ -69,7 +155,98 @@ class ZORS(commands.Bot):
         Returns:
 
         """
-        await super().start(settings.env.discord_token, *args, **kwargs)
+        tracer.configure(
+            settings.runtime.tracing.enabled,
+            settings.runtime.tracing.buffer_size,
+            settings.runtime.tracing.otlp_file,
+        )
+        if settings.runtime.metrics.enabled:
+            self._metrics_exporter = MetricsExporter(
+                metrics, settings.runtime.metrics.host, settings.runtime.metrics.port
+            )
+            await self._metrics_exporter.start()
+        if settings.runtime.watchdog.enabled:
+            self.watchdog = LoopWatchdog(
+                settings.runtime.watchdog.interval_ms / 1000,
+                settings.runtime.watchdog.stall_threshold_ms / 1000,
+                settings.runtime.watchdog.summary_interval_s,
+            )
+            self.watchdog.start()
+        if settings.runtime.journal.enabled:
+            self.journal = GatewayJournal(
+                Path(settings.runtime.logs_path) / "journal",
+                settings.runtime.journal,
+                settings.runtime,
+            )
+            await self.journal.start(self._connection, self.database)
+        if self.database.changes is not None:
+            await self.database.changes.start()
+        if settings.runtime.database.mirror_user_ids:
+            await self.database.users.load()
+        await self.work.start()
+        if self.memberships is not None:
+            await self.memberships.start()
+        await super().start(
+            settings.env.discord_token.get_secret_value(), *args, **kwargs
+        )
+
+    @override
+    async def close(self) -> None:
+        # Queued jobs still need the REST client and the database
+        await self.work.stop()
+        if self.memberships is not None:
+            await self.memberships.stop()
+        await self.preload.stop()
+        await self.database.users.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        if self.journal is not None:
+            await self.journal.stop()
+        if self.database.changes is not None:
+            await self.database.changes.stop()
+        if self._metrics_exporter is not None:
+            await self._metrics_exporter.stop()
+        await super().close()
+        tracer.close()
+
+    @override
+    def dispatch(self, event_name: str, *args: Any, **kwargs: Any) -> None:
+        gateway_events.labels(event_name).inc()
+        super().dispatch(event_name, *args, **kwargs)
+
+    def _instrument_http(self) -> None:
+        """
+        Wraps the REST client to time every Discord call and count rate limits.
+        Returns:
+
+        """
+        request = self.http.request
+
+        async def instrumented_request(route: Route, **kwargs: Any) -> Any:
+            started = perf_counter()
+            status = "error"
+            with tracer.span(
+                f"{route.method} {route.path}",
+                **{"http.method": route.method, "http.route": route.path},
+            ) as span:
+                try:
+                    result = await request(route, **kwargs)
+                    status = "ok"
+                    return result
+                except discord.HTTPException as e:
+                    status = str(e.status)
+                    raise
+                finally:
+                    if span is not None:
+                        span.set(**{"http.status": status})
+                    discord_requests.labels(route.method, route.path, status).observe(
+                        perf_counter() - started
+                    )
+
+        self.http.request = instrumented_request  # type: ignore[method-assign]
+        logging.getLogger("discord.http").addHandler(
+            _RateLimitObserver(level=logging.WARNING)
+        )
 
     def _load_cogs(self) -> None:
         """
@@ -0,0 +1,128 @@
+"""
+Read-through cache of entities by primary key, shared by the sessions of a Database.
+
+The managers look an entity up with `cached` before querying it and store what they loaded
+with `remember`; every write going through them drops the entry with `forget` once committed.
+A read overtaken by a write (the entry forgotten, or changed by another process, between the
+`generation` taken before the query and `remember`) is not cached: it may be older than it.
+Entries are detached copies: a hit is merged into the calling session without a query, so
+the manager can still modify or delete what it gets. The TTL bounds how long a write made
+outside the managers (a migration, a manual fix) can go unnoticed.
+
+In a unit of work (see model/unitofwork.py) the writes are only committed at its end: the
+entries are dropped again then, and nothing is cached from a session holding uncommitted
+writes.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from model.dialects import table_name
+from model.unitofwork import in_unit_of_work
+from utils.cache import LRUCache
+
+SESSION_KEY = "entity_cache"
+# Entries to drop once the unit of work commits
+FORGET_KEY = "entity_cache_forget"
+
+
+class EntityCache:
+    """One LRU cache per model, keyed by primary key."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._caches: dict[type[SQLModel], LRUCache] = {}
+
+    def of(self, model: type[SQLModel]) -> LRUCache:
+        cache = self._caches.get(model)
+        if cache is None:
+            cache = self._caches[model] = LRUCache(
+                f"entity:{table_name(model)}", self.max_size, self.ttl
+            )
+        return cache
+
+    def clear(self) -> None:
+        for cache in self._caches.values():
+            cache.clear()
+
+    def on_change(self, table: str, key: str | None, deleted: bool = False) -> None:
+        """A committed write of this process or another one (see model/notifications.py)."""
+        for model, cache in self._caches.items():
+            if table_name(model) != table:
+                continue
+            if key is None:
+                cache.clear()
+            else:
+                cache.invalidate(int(key))
+
+
+def _entities(session: AsyncSession) -> EntityCache | None:
+    return session.info.get(SESSION_KEY)
+
+
+async def cached[M: SQLModel](
+    session: AsyncSession, model: type[M], key: object
+) -> M | None:
+    """The cached entity, attached to `session`, or None on a miss."""
+    entities = _entities(session)
+    if entities is None:
+        return None
+    entity = entities.of(model).get(key)
+    if entity is None:
+        return None
+    return await session.merge(entity, load=False)
+
+
+def generation(session: AsyncSession, model: type[SQLModel]) -> int | None:
+    """Taken before querying an entity on a miss, given back to `remember`."""
+    entities = _entities(session)
+    if entities is None:
+        return None
+    return entities.of(model).generation()
+
+
+def remember(
+    session: AsyncSession, entity: SQLModel | None, generation: int | None = None
+) -> None:
+    """Caches a copy of an entity loaded from the database, unless written since `generation`."""
+    entities = _entities(session)
+    if entities is None or entity is None or session.info.get(FORGET_KEY):
+        return
+    (key,) = inspect(entity, raiseerr=True).identity
+    entities.of(type(entity)).put(key, detached_copy(entity), generation)
+
+
+def detached_copy[M: SQLModel](entity: M) -> M:
+    """Copy of the columns of an entity, which `session.merge(copy, load=False)` attaches."""
+    model: type[M] = type(entity)
+    copy = model.model_validate(entity.model_dump())
+    make_transient_to_detached(copy)
+    return copy
+
+
+def forget(session: AsyncSession, model: type[SQLModel], key: object) -> None:
+    """Drops an entity written to the database."""
+    entities = _entities(session)
+    if entities is None:
+        return
+    entities.of(model).invalidate(key)
+    if in_unit_of_work(session):
+        # Another session may cache the row again before this one commits
+        session.info.setdefault(FORGET_KEY, []).append((model, key))
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed(session: Session) -> None:
+    forgotten = session.info.pop(FORGET_KEY, ())
+    entities: EntityCache | None = session.info.get(SESSION_KEY)
+    if entities is not None:
+        for model, key in forgotten:
+            entities.of(model).invalidate(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(FORGET_KEY, None)
@@ -0,0 +1,92 @@
+"""
+Coalescing of identical concurrent reads across the sessions of a Database.
+
+A manager wraps a read with `coalesced`: while the query of a key is running in one session,
+the other sessions asking for the same key wait for it instead of sending it again (see
+utils/singleflight.py). They get detached copies of the entities, merged into their own
+session without a query like the cache hits (see model/cache.py), so each caller can modify
+what it gets.
+
+Only column reads are shared: relationships are not copied. A session holding uncommitted
+writes neither shares its reads nor uses the ones of other sessions, they would not see the
+same rows.
+"""
+
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, Session
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from model.cache import detached_copy
+from utils.singleflight import SingleFlight
+
+SESSION_KEY = "coalesce_reads"
+# Set from the first write of a transaction until it ends
+WRITES_KEY = "uncommitted_writes"
+
+
+def _writing(session: AsyncSession) -> bool:
+    return bool(
+        session.info.get(WRITES_KEY) or session.new or session.dirty or session.deleted
+    )
+
+
+def _detached(result: Any) -> Any:
+    if isinstance(result, SQLModel):
+        return detached_copy(result)
+    if isinstance(result, list):
+        return [_detached(item) for item in result]
+    # Column values and views (see model/views.py) are immutable
+    return result
+
+
+async def _attached(session: AsyncSession, copies: Any) -> Any:
+    if isinstance(copies, SQLModel):
+        return await session.merge(copies, load=False)
+    if isinstance(copies, list):
+        return [await _attached(session, copy) for copy in copies]
+    return copies
+
+
+async def coalesced[R](
+    session: AsyncSession, key: Hashable, query: Callable[[], Awaitable[R]]
+) -> R:
+    """
+    Runs `query()` in `session`, or shares the result of the one running for `key`.
+
+    The key identifies the read and its parameters, e.g. ("gamecategory.id", 42). The result
+    may be an entity, a list of entities, a view or None.
+    """
+    flights: SingleFlight | None = session.info.get(SESSION_KEY)
+    if flights is None or _writing(session):
+        return await query()
+
+    async def run() -> tuple[R, Any]:
+        result = await query()
+        # Copied right away: the leader's session may modify its entities afterwards
+        return result, _detached(result)
+
+    (result, copies), shared = await flights.do(key, run)
+    if not shared:
+        return result
+    return await _attached(session, copies)
+
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session: Session, flush_context: Any) -> None:
+    session.info[WRITES_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(state: ORMExecuteState) -> None:
+    if not state.is_select:
+        state.session.info[WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _ended(session: Session) -> None:
+    session.info.pop(WRITES_KEY, None)
@@ -1,30 +1,160 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import SQLModel
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from utils.singletonmeta import SingletonMeta
+from model.cache import SESSION_KEY, EntityCache
+from model.dialects import configure, engine_options
+from model.instrumentation import QueryInstrumentation
+from model import coalescing, locks, notifications, unitofwork, userids
+from model.notifications import ChangeListener, LocalChanges
+from utils.metrics import metrics
+from utils.settings import DatabaseSettings
+from utils.singleflight import SingleFlight
+from utils.tracing import tracer
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
+from time import perf_counter
 
+db_pool_connections = metrics.gauge(
+    "zors_db_pool_connections", "Connections of the pool, by state.", ("state",)
+)
+db_session_duration = metrics.histogram(
+    "zors_db_session_duration_seconds", "Lifetime of a database session."
+)
+db_query_duration = metrics.histogram(
+    "zors_db_query_duration_seconds",
+    "Execution time of SQL statements, by statement type.",
+    ("statement",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
 
-class Database(metaclass=SingletonMeta):
-    def __init__(self, url: str):
-        self.engine = create_async_engine(url)
+
+class Database:
+    """
+    The engine and the sessions of one database.
+
+    Any async SQLAlchemy URL works: postgresql+asyncpg in production, sqlite+aiosqlite for the
+    tests and benchmarks ("sqlite+aiosqlite://" for a private in-memory database). Instances
+    are independent, several can live in the same process.
+    """
+
+    def __init__(self, url: str, config: DatabaseSettings | None = None, **engine):
+        self.engine = create_async_engine(url, **(engine_options(url) | engine))
+        configure(self.engine)
+        config = config or DatabaseSettings()
+        self.entities = EntityCache(config.entity_cache_size, config.entity_cache_ttl_s)
+        info: dict = {}
+        if config.entity_cache_size:
+            info[SESSION_KEY] = self.entities
+        # Identical reads running at the same time in several sessions (see model/coalescing.py)
+        self.flights: SingleFlight = SingleFlight("database")
+        if config.coalesce_reads:
+            info[coalescing.SESSION_KEY] = self.flights
+        # Ids of the user table, read when the bot starts (see model/userids.py)
+        self.users = userids.UserIds(self.engine)
+        if config.mirror_user_ids:
+            info[userids.SESSION_KEY] = self.users
+        # Advisory locks emulated in memory where the database has none (see model/locks.py)
+        if self.engine.dialect.name != "postgresql":
+            info[locks.LOCAL_KEY] = set()
+        # Writes committed by this process, as soon as they are
+        self.local_changes = LocalChanges()
+        info[notifications.LOCAL_KEY] = self.local_changes
+        # Other processes sharing the database, started by the bot (see ChangeListener)
+        self.changes: ChangeListener | None = None
+        if config.notify_changes and self.engine.dialect.name == "postgresql":
+            origin = notifications.new_origin()
+            info[notifications.SESSION_KEY] = origin
+            self.changes = ChangeListener(
+                self.engine.url, origin, config.listen_keepalive_s
+            )
+            self.changes.subscribe(self.entities.on_change)
+            # Its own notifications are skipped, its writes come from here instead
+            self.local_changes.subscribe(self.entities.on_change)
+            if config.mirror_user_ids:
+                self.changes.subscribe(self.users.on_change, ("user",))
         self.sessionmaker = async_sessionmaker(
-            self.engine, class_=AsyncSession, expire_on_commit=False
+            self.engine, class_=AsyncSession, expire_on_commit=False, info=info
         )
+        self.queries = QueryInstrumentation(self.engine, config)
+        self._instrument()
+
+    def _instrument(self):
+        pool = self.engine.pool
+        for state in ("checked_out", "checked_in", "overflow"):
+            getter = getattr(pool, state.replace("_", ""), None)
+            if getter is not None:
+                db_pool_connections.labels(state).set_function(getter)
+
+        sync_engine = self.engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            context._zors_started = perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            duration = perf_counter() - context._zors_started
+            statement_type = statement.lstrip().split(None, 1)[0].upper()
+            db_query_duration.labels(statement_type).observe(duration)
+            # Timed once, shared with the query instrumentation
+            self.queries.executed(
+                cursor, statement, parameters, statement_type, duration
+            )
 
     async def create_db_and_tables(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(SQLModel.metadata.create_all)
 
+    def _unit_of_work(self) -> AsyncSession | None:
+        session = unitofwork.current_session()
+        # The unit of work of another Database doesn't count
+        if session is not None and session.bind is self.engine:
+            return session
+        return None
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncSession]:
+        """
+        A unit of work (see model/unitofwork.py): the writes made with its session, or through
+        any get_session() of the task meanwhile, are committed together on exit.
+        Inside another unit of work, a SAVEPOINT of it.
+        """
+        session = self._unit_of_work()
+        if session is not None:
+            async with session.begin_nested():
+                yield session
+            return
+        async with self.get_session() as session:
+            token = unitofwork.enter(session)
+            try:
+                yield session
+            finally:
+                unitofwork.leave(token)
+
     @asynccontextmanager
     async def get_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        A session committed on exit, rolled back on error.
+        Inside a unit of work, its session in a SAVEPOINT (see transaction).
+        """
+        if self._unit_of_work() is not None:
+            async with self.transaction() as session:
+                yield session
+            return
         session = self.sessionmaker()
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
-        finally:
-            await session.close()
+        started = perf_counter()
+        with tracer.span("db.session"), self.queries.scope():
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                await session.close()
+                db_session_duration.observe(perf_counter() - started)
@@ -0,0 +1,124 @@
+"""
+Portability layer between the database backends: PostgreSQL (asyncpg) in production,
+SQLite (aiosqlite) for the local tests, the benchmarks and the simulator.
+
+The managers go through these helpers for the statements the dialects write differently
+(ON CONFLICT, RETURNING), everything else is plain SQLAlchemy.
+"""
+
+from typing import Any
+
+from sqlalchemy import Insert, Table, event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Dialect, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+def engine_options(url: str) -> dict[str, Any]:
+    """Options of create_async_engine for the backend of `url`."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return {}
+    if parsed.database in (None, "", ":memory:"):
+        # An in-memory database only lives as long as its connection: share a single one
+        return {
+            "poolclass": StaticPool,
+            "connect_args": {"check_same_thread": False},
+        }
+    return {}
+
+
+def configure(engine: AsyncEngine) -> None:
+    """Per connection setup the backend needs to behave like PostgreSQL."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, connection_record):
+        # Off by default in SQLite, enforced like PostgreSQL does
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def _table(model: type[SQLModel]) -> Table:
+    return model.__table__  # type: ignore[attr-defined]
+
+
+def table_name(model: type[SQLModel]) -> str:
+    """Name of the table of `model`, `__tablename__` is typed as a column by SQLModel."""
+    return _table(model).name
+
+
+def insert_ignore(dialect: Dialect, model: type[SQLModel]) -> Insert:
+    """INSERT skipping the rows whose primary key already exists."""
+    match dialect.name:
+        case "postgresql":
+            return postgresql.insert(_table(model)).on_conflict_do_nothing()
+        case "sqlite":
+            return sqlite.insert(_table(model)).on_conflict_do_nothing()
+        case name:
+            raise NotImplementedError(f"No INSERT ... ON CONFLICT for {name}")
+
+
+def upsert(dialect: Dialect, model: type[SQLModel]) -> Insert:
+    """INSERT updating the other columns of the rows whose primary key already exists."""
+    table = _table(model)
+    match dialect.name:
+        case "postgresql":
+            statement = postgresql.insert(table)
+        case "sqlite":
+            statement = sqlite.insert(table)
+        case name:
+            raise NotImplementedError(f"No INSERT ... ON CONFLICT for {name}")
+    return statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in table.columns
+            if not column.primary_key
+        },
+    )
+
+
+async def insert_missing(
+    session: AsyncSession, model: type[SQLModel], rows: list[dict[str, Any]]
+) -> set[Any]:
+    """
+    Insère en une requête les lignes dont la clé primaire n'existe pas encore.
+
+    Args:
+        session: La session de base de données
+        model: Le modèle de la table, à clé primaire simple
+        rows: Les lignes à insérer
+
+    Returns:
+        Les clés primaires des lignes réellement insérées
+    """
+    if not rows:
+        return set()
+    dialect = session.bind.dialect
+    (key,) = _table(model).primary_key.columns
+    if dialect.insert_returning and dialect.insert_executemany_returning:
+        result = await session.execute(
+            insert_ignore(dialect, model).returning(key), rows
+        )
+        return set(result.scalars().all())
+
+    # Without RETURNING, the existing keys are read first, in the same transaction
+    existing = set(
+        (
+            await session.execute(
+                select(key).where(key.in_([row[key.name] for row in rows]))
+            )
+        )
+        .scalars()
+        .all()
+    )
+    missing = [row for row in rows if row[key.name] not in existing]
+    if missing:
+        await session.execute(insert_ignore(dialect, model), missing)
+    return {row[key.name] for row in missing}
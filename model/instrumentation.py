@@ -0,0 +1,299 @@
+"""
+SQL instrumentation: per-statement timing attributed to the manager method that issued it,
+slow query capture and detection of wasteful query patterns.
+
+Manager classes are decorated with @track_operations so every statement knows its origin
+(e.g. "PartyManager.delete > MemberManager.get_by_id"). Patterns are analysed per session:
+Database.get_session opens a QueryScope that is checked when the session closes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import itertools
+import re
+from collections import Counter, deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import time
+from typing import TYPE_CHECKING
+
+from loguru import logger as log
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from utils.settings import DatabaseSettings
+
+db_queries = metrics.counter(
+    "zors_db_queries_total",
+    "SQL statements by originating manager method and statement type.",
+    ("origin", "statement"),
+)
+db_slow_queries = metrics.counter(
+    "zors_db_slow_queries_total",
+    "SQL statements slower than the configured threshold, by origin.",
+    ("origin",),
+)
+db_query_rows = metrics.histogram(
+    "zors_db_query_rows",
+    "Rows returned or affected by SQL statements, by statement type.",
+    ("statement",),
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+db_query_patterns = metrics.counter(
+    "zors_db_query_patterns_total",
+    "Wasteful query patterns detected in a session (n_plus_one, redundant_read, read_after_delete).",
+    ("pattern", "origin"),
+)
+
+_operation_ids = itertools.count()
+_from_clause = re.compile(r"\bFROM\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class _Operation:
+    name: str
+    id: int
+
+
+# Manager methods currently running in this task, outermost first
+_operations: ContextVar[tuple[_Operation, ...]] = ContextVar(
+    "db_operations", default=()
+)
+
+
+def _origin(operations: tuple[_Operation, ...]) -> str:
+    return " > ".join(operation.name for operation in operations) or "unknown"
+
+
+def track_operations[T: type](cls: T) -> T:
+    """
+    Class decorator for managers: every async classmethod records itself as the origin
+    of the statements it issues.
+    """
+    for name, attribute in list(vars(cls).items()):
+        if not isinstance(attribute, classmethod) or not inspect.iscoroutinefunction(
+            attribute.__func__
+        ):
+            continue
+        function = attribute.__func__
+        operation_name = f"{cls.__name__}.{name}"
+
+        def wrap(function=function, operation_name=operation_name):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                token = _operations.set(
+                    (
+                        *_operations.get(),
+                        _Operation(operation_name, next(_operation_ids)),
+                    )
+                )
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    _operations.reset(token)
+
+            return wrapper
+
+        setattr(cls, name, classmethod(wrap()))
+    return cls
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: str
+    origin: str
+    duration: float
+    rows: int | None
+    at: float = field(default_factory=time)
+
+
+@dataclass
+class _Execution:
+    statement: str
+    parameters: str
+    kind: str
+    operations: tuple[_Operation, ...]
+
+    @property
+    def reads(self) -> bool:
+        # Not the SELECTs calling a function (pg_notify, advisory locks...)
+        return self.kind == "SELECT" and _from_clause.search(self.statement) is not None
+
+
+@dataclass
+class QueryScope:
+    """Statements executed during one session, analysed when it closes."""
+
+    executions: list[_Execution] = field(default_factory=list)
+
+
+_scope: ContextVar[QueryScope | None] = ContextVar("db_query_scope", default=None)
+
+
+class QueryInstrumentation:
+    """
+    Records every statement executed by the bot, timed by the cursor hooks of the Database
+    (see Database._instrument) which hand each one to `executed`.
+    """
+
+    def __init__(self, engine: AsyncEngine, config: DatabaseSettings):
+        self.engine = engine
+        self.config = config
+        self.slow_queries: deque[SlowQuery] = deque(maxlen=50)
+        self._reported_patterns: set[tuple[str, str, str]] = set()
+        self._explain_tasks: set[asyncio.Task] = set()
+
+    # region hooks
+    def executed(
+        self, cursor, statement: str, parameters, kind: str, duration: float
+    ) -> None:
+        """A statement just executed, `kind` is its first keyword (SELECT...)."""
+        operations = _operations.get()
+        origin = _origin(operations)
+        db_queries.labels(origin, kind).inc()
+
+        scope = _scope.get()
+        if scope is not None:
+            scope.executions.append(
+                _Execution(statement, repr(parameters), kind, operations)
+            )
+
+        # -1 when the driver doesn't know (SELECTs on SQLite)
+        rows = cursor.rowcount if (cursor.rowcount or 0) >= 0 else None
+        if rows is not None:
+            db_query_rows.labels(kind).observe(rows)
+
+        if duration * 1000 >= self.config.slow_query_ms:
+            self._on_slow_query(
+                SlowQuery(statement, repr(parameters), origin, duration, rows),
+                statement,
+                parameters,
+                kind,
+            )
+
+    # endregion
+
+    # region slow queries
+    def _on_slow_query(
+        self, query: SlowQuery, statement: str, parameters, kind: str
+    ) -> None:
+        self.slow_queries.append(query)
+        db_slow_queries.labels(query.origin).inc()
+        log.warning(
+            f"Slow query ({query.duration * 1000:.1f} ms, {query.rows} rows) from {query.origin}: "
+            f"{' '.join(statement.split())} | parameters: {query.parameters}"
+        )
+        if (
+            self.config.explain_slow_queries
+            and kind == "SELECT"
+            and self.engine.dialect.name == "postgresql"
+        ):
+            task = asyncio.get_running_loop().create_task(
+                self._explain(statement, parameters, query.origin)
+            )
+            self._explain_tasks.add(task)
+            task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, statement: str, parameters, origin: str) -> None:
+        """Runs EXPLAIN ANALYZE on a separate connection, inside a transaction that is rolled back."""
+        _scope.set(None)
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+                )
+                plan = "\n".join(row[0] for row in result)
+            log.warning(f"Query plan of the slow query from {origin}:\n{plan}")
+        except Exception as e:  # noqa: BLE001 - diagnostics must never break the bot
+            log.debug(f"Could not explain the slow query from {origin}: {e}")
+
+    # endregion
+
+    # region patterns
+    @contextmanager
+    def scope(self) -> Iterator[None]:
+        """Collects the statements of a session and reports wasteful patterns at the end."""
+        if not self.config.detect_query_patterns:
+            yield
+            return
+        scope = QueryScope()
+        token = _scope.set(scope)
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+            self._analyse(scope)
+
+    def _analyse(self, scope: QueryScope) -> None:
+        executions = scope.executions
+        if len(executions) < 2:
+            return
+
+        by_statement: dict[str, list[_Execution]] = {}
+        for execution in executions:
+            by_statement.setdefault(execution.statement, []).append(execution)
+
+        for runs in by_statement.values():
+            if not runs[0].reads:
+                continue
+            parameters = Counter(run.parameters for run in runs)
+            # Same query, different parameters, over and over: a loop issuing one query per item
+            if len(parameters) >= self.config.n_plus_one_threshold:
+                # Attributed to the caller issuing most of them
+                origin = Counter(_origin(run.operations) for run in runs).most_common(1)
+                self._report(
+                    "n_plus_one",
+                    origin[0][0],
+                    runs[0].statement,
+                    f"executed {len(runs)} times with {len(parameters)} different parameters, "
+                    f"load them in one query",
+                )
+            # Same query, same parameters: the result could have been reused
+            for parameter, count in parameters.items():
+                if count > 1:
+                    run = next(run for run in runs if run.parameters == parameter)
+                    self._report(
+                        "redundant_read",
+                        _origin(run.operations),
+                        run.statement,
+                        f"executed {count} times with the same parameters {parameter}",
+                    )
+
+        # A read issued by a manager call after it deleted something
+        deleted_in: set[int] = set()
+        for execution in executions:
+            if not execution.operations:
+                continue
+            outermost = execution.operations[0].id
+            if execution.kind == "DELETE":
+                deleted_in.add(outermost)
+            elif execution.reads and outermost in deleted_in:
+                self._report(
+                    "read_after_delete",
+                    _origin(execution.operations),
+                    execution.statement,
+                    "read issued after a DELETE in the same manager call, "
+                    "fetch what is needed before deleting",
+                )
+
+    def _report(self, pattern: str, origin: str, statement: str, detail: str) -> None:
+        db_query_patterns.labels(pattern, origin).inc()
+        key = (pattern, origin, statement)
+        if key in self._reported_patterns:
+            return
+        # Only the first occurrence is logged, the metric keeps counting
+        self._reported_patterns.add(key)
+        log.warning(
+            f"Query pattern '{pattern}' from {origin}: {detail} | "
+            f"{' '.join(statement.split())}"
+        )
+
+    # endregion
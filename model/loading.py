@@ -0,0 +1,56 @@
+"""
+Declarative eager loading for the manager reads.
+
+An AsyncSession can't lazy-load a relationship: reading one that wasn't loaded raises
+MissingGreenlet. The read methods of the managers take a `load` spec naming the relationships
+to load with the entity, and how:
+
+    await GameCategoryManager.get_by_name(session, name, load={"parties": "selectin"})
+    await PartyManager.get_by_owner(session, id, load={"owner": "joined", "owner.habitue": "joined"})
+
+Keys are relationship paths from the queried model, dotted for nested ones (the parent path
+uses its own strategy, selectin when absent). "selectin" issues one extra SELECT ... IN per
+relationship for all the rows, the right choice for collections; "joined" adds a LEFT OUTER
+JOIN to the query, for many-to-one and one-to-one relationships.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Literal
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import SQLModel
+
+type Strategy = Literal["selectin", "joined"]
+type LoadSpec = Mapping[str, Strategy]
+
+_loaders = {"selectin": selectinload, "joined": joinedload}
+
+
+def eager(model: type[SQLModel], load: LoadSpec | None) -> list[Any]:
+    """Loader options of `select(model).options(...)` for a load spec."""
+    options = []
+    load = load or {}
+    for path, strategy in load.items():
+        names = path.split(".")
+        option: Any = None
+        current = model
+        for depth in range(len(names)):
+            relationship = inspect(current, raiseerr=True).relationships.get(
+                names[depth]
+            )
+            if relationship is None:
+                raise ValueError(
+                    f"{current.__name__} has no relationship {names[depth]!r} ({path})"
+                )
+            step = strategy
+            if depth < len(names) - 1:
+                step = load.get(".".join(names[: depth + 1]), "selectin")
+            attribute = getattr(current, names[depth])
+            if option is None:
+                option = _loaders[step](attribute)
+            else:
+                option = getattr(option, _loaders[step].__name__)(attribute)
+            current = relationship.mapper.class_
+        options.append(option)
+    return options
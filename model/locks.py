@@ -0,0 +1,77 @@
+"""
+Mutual exclusion between bot instances with PostgreSQL transaction-level advisory locks.
+
+A lock is identified by a namespace and integer parts (e.g. "party", owner_id, game_id),
+hashed into the 64-bit key of `pg_try_advisory_xact_lock`. It is held by the session's
+transaction and released by PostgreSQL when it commits or rolls back, so a crashed instance
+can't leave it behind. Locks never wait: whoever does not get one lets the holder do the work,
+and unrelated keys never block each other.
+
+On SQLite (a single process), the same semantics are emulated with the set of keys held by the
+transactions of the Database, given to its sessions under LOCAL_KEY: two Databases in the same
+process (the simulator, the benchmarks) don't contend.
+"""
+
+import hashlib
+import struct
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, SessionTransaction
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from utils.metrics import metrics
+
+# Keys held by the transaction of the session
+SESSION_KEY = "advisory_locks"
+# Keys held by the transactions of the Database, when it has no advisory locks
+LOCAL_KEY = "advisory_locks_local"
+
+db_lock_contention = metrics.counter(
+    "zors_db_lock_contention_total",
+    "Advisory locks already held by another transaction, by namespace.",
+    ("namespace",),
+)
+
+_signed = struct.Struct(">q")
+
+
+def lock_key(namespace: str, *parts: int) -> int:
+    """Stable signed 64-bit key, the same in every process."""
+    digest = hashlib.blake2b(
+        ":".join((namespace, *map(str, parts))).encode(), digest_size=8
+    ).digest()
+    return _signed.unpack(digest)[0]
+
+
+async def try_xact_lock(session: AsyncSession, namespace: str, *parts: int) -> bool:
+    """
+    Takes the lock for the rest of the session's current transaction, without waiting.
+
+    Returns:
+        False when another transaction holds it.
+    """
+    key = lock_key(namespace, *parts)
+    if session.bind.dialect.name == "postgresql":
+        acquired = bool(
+            (
+                await session.execute(select(func.pg_try_advisory_xact_lock(key)))
+            ).scalar()
+        )
+    else:
+        local: set[int] = session.info.setdefault(LOCAL_KEY, set())
+        held = session.info.setdefault(SESSION_KEY, set())
+        acquired = key in held or key not in local
+        if acquired:
+            local.add(key)
+            held.add(key)
+            # Held by a transaction, like PostgreSQL: make sure there is one to end
+            await session.connection()
+    if not acquired:
+        db_lock_contention.labels(namespace).inc()
+    return acquired
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_local_locks(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is None and (held := session.info.pop(SESSION_KEY, None)):
+        session.info[LOCAL_KEY].difference_update(held)
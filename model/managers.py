@@ -1,33 +1,78 @@
-from sqlmodel import select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import col, delete, or_, select
+from sqlmodel.sql.expression import SelectOfScalar
 from sqlmodel.ext.asyncio.session import AsyncSession
-from model.schemas import Habitue, User, GameCategory, Party, Streamer
+from model.schemas import (
+    Habitue,
+    User,
+    GameCategory,
+    Party,
+    Streamer,
+    StreamerModeratorRelation,
+)
+from model.cache import cached, forget, generation, remember
+from model.coalescing import coalesced
+from model.dialects import insert_ignore, insert_missing, table_name, upsert
+from model.locks import try_xact_lock
+from model.notifications import notify, notify_tables
+from model.instrumentation import track_operations
+from model.loading import LoadSpec, eager
+from model.views import (
+    GameChannels,
+    GameRow,
+    GameSummary,
+    fetch_all,
+    fetch_first,
+    select_view,
+)
+from model.unitofwork import commit
+from model.userids import added, removed, user_ids
 import discord
 from loguru import logger as log
 
 
+@track_operations
 class MemberManager:
     # region CRUD
     @classmethod
     async def add(cls, session: AsyncSession, member: discord.Member):
         new_user = User(id=member.id, name=member.display_name)
         session.add(new_user)
-        await session.commit()
+        # Recorded before the commit, the mirror takes it when it succeeds
+        added(session, [member.id])
+        await commit(session)
+        forget(session, User, member.id)
         log.debug(f"DATABASE: Added user {member.display_name}")
         return new_user
 
     @classmethod
-    async def get_by_id(cls, session: AsyncSession, id: int) -> User | None:
-        results = await session.exec(select(User).where(User.id == id))
-        user = results.first()
+    async def get_by_id(
+        cls, session: AsyncSession, id: int, load: LoadSpec | None = None
+    ) -> User | None:
+        """
+        Args:
+            load: Relations à charger avec l'utilisateur (voir model/loading.py), le cache
+                ne garde que les colonnes et n'est pas utilisé dans ce cas
+        """
+        user = None if load else await cached(session, User, id)
+        if user is None:
+            # Before the query: a write committed during it must not be cached over
+            since = generation(session, User)
+            results = await session.exec(
+                select(User).where(User.id == id).options(*eager(User, load))
+            )
+            user = results.unique().first()
+            if not load:
+                remember(session, user, since)
         if user is None:
             log.error(f"User with ID {id} not found in the database")
         return user
 
     @classmethod
     async def get_by_member(
-        cls, session: AsyncSession, member: discord.Member
+        cls, session: AsyncSession, member: discord.Member, load: LoadSpec | None = None
     ) -> User | None:
-        return await cls.get_by_id(session, member.id)
+        return await cls.get_by_id(session, member.id, load)
 
     @classmethod
     async def update(cls, session: AsyncSession, member: discord.Member):
@@ -35,7 +80,8 @@ class MemberManager:
         if user is None:
             return None
         user.name = member.display_name
-        await session.commit()
+        await commit(session)
+        forget(session, User, member.id)
         log.debug(f"DATABASE: Updated user {member.display_name}")
         return user
 
@@ -44,7 +90,11 @@ class MemberManager:
         user = await cls.get_by_id(session, id)
         if user is not None:
             await session.delete(user)
-            await session.commit()
+            removed(session, [id])
+            await commit(session)
+            # The habitue row goes with the user
+            forget(session, User, id)
+            forget(session, Habitue, id)
             log.debug(f"DATABASE: Deleted user {user.name} and all related entries")
             return True
         return False
@@ -76,23 +126,81 @@ class MemberManager:
             log.error("No members to sync.")
             return []
 
-        added_users_indices = []
-        results = await session.exec(select(User))
-        users = results.all()
-        existing_user_ids = [user.id for user in users]
-
-        for idx, (member_id, member_name) in enumerate(zip(members_ids, members_names)):
-            if member_id not in existing_user_ids:
-                new_user = User(id=member_id, name=member_name)
-                session.add(new_user)
-                added_users_indices.append(idx)
+        # Only the members missing from the mirror of the table need an INSERT
+        known = user_ids(session)
+        inserted = await insert_missing(
+            session,
+            User,
+            [
+                {"id": member_id, "name": member_name}
+                for member_id, member_name in zip(members_ids, members_names)
+                if known is None or member_id not in known
+            ],
+        )
+        if inserted:
+            await notify(session, table_name(User))
+            added(session, inserted)
+        await commit(session)
+        return [
+            idx for idx, member_id in enumerate(members_ids) if member_id in inserted
+        ]
+
+    @classmethod
+    async def apply_memberships(
+        cls, session: AsyncSession, joined: dict[int, str], left: list[int]
+    ) -> None:
+        """
+        Enregistre en une transaction les arrivées et départs accumulés (voir model/writebehind.py).
 
-        await session.commit()
-        return added_users_indices
+        Args:
+            session: La session de base de données
+            joined: Noms des membres arrivés, par ID (insérés, ou renommés s'ils existent déjà)
+            left: IDs des membres partis, supprimés avec tout ce qui dépend d'eux
+        """
+        known = user_ids(session)
+        if known is not None:
+            # Members never written (bots...) have nothing to delete
+            left = [id for id in left if id in known]
+        if joined:
+            await session.execute(
+                upsert(session.bind.dialect, User),
+                [{"id": id, "name": name} for id, name in joined.items()],
+            )
+            added(session, joined)
+        if left:
+            # Core DELETEs skip the ORM cascades, the dependent rows go first
+            await session.execute(delete(Party).where(col(Party.owner_id).in_(left)))
+            await session.execute(delete(Habitue).where(col(Habitue.id).in_(left)))
+            links = StreamerModeratorRelation
+            await session.execute(
+                delete(links).where(
+                    or_(
+                        col(links.moderator_id).in_(left),
+                        col(links.streamer_id).in_(left),
+                    )
+                )
+            )
+            await session.execute(delete(Streamer).where(col(Streamer.id).in_(left)))
+            await session.execute(delete(User).where(col(User.id).in_(left)))
+            removed(session, left)
+        changed = (
+            (User, Habitue, Party, Streamer, StreamerModeratorRelation)
+            if left
+            else (User,)
+        )
+        await notify_tables(session, *(table_name(table) for table in changed))
+        await commit(session)
+        for id in (*joined, *left):
+            forget(session, User, id)
+            forget(session, Habitue, id)
+        log.debug(
+            f"DATABASE: Applied {len(joined)} member arrivals and {len(left)} departures"
+        )
 
     # endregion
 
 
+@track_operations
 class HabitueManager:
     # region CRUD
     @classmethod
@@ -100,25 +208,43 @@ class HabitueManager:
         cls, session: AsyncSession, member: discord.Member, color: str | None = None
     ):
         color = color if color is not None else "#000000"
+        known = user_ids(session)
+        if known is None or member.id not in known:
+            # Its arrival may still wait in the write-behind buffer
+            if await insert_missing(
+                session, User, [{"id": member.id, "name": member.display_name}]
+            ):
+                await notify(session, table_name(User), member.id)
+                added(session, [member.id])
         new_habitue = Habitue(id=member.id, color=color)
         session.add(new_habitue)
-        await session.commit()
+        await commit(session)
+        forget(session, Habitue, member.id)
         log.debug(f"DATABASE: Added habitue {member.display_name}")
         return new_habitue
 
     @classmethod
-    async def get_by_id(cls, session: AsyncSession, id: int) -> Habitue | None:
-        results = await session.exec(select(Habitue).where(Habitue.id == id))
-        habitue = results.first()
+    async def get_by_id(
+        cls, session: AsyncSession, id: int, load: LoadSpec | None = None
+    ) -> Habitue | None:
+        habitue = None if load else await cached(session, Habitue, id)
+        if habitue is None:
+            since = generation(session, Habitue)
+            results = await session.exec(
+                select(Habitue).where(Habitue.id == id).options(*eager(Habitue, load))
+            )
+            habitue = results.unique().first()
+            if not load:
+                remember(session, habitue, since)
         if habitue is None:
             log.error(f"Habitue with ID {id} not found in the database")
         return habitue
 
     @classmethod
     async def get_by_member(
-        cls, session: AsyncSession, member: discord.Member
+        cls, session: AsyncSession, member: discord.Member, load: LoadSpec | None = None
     ) -> Habitue | None:
-        return await cls.get_by_id(session, member.id)
+        return await cls.get_by_id(session, member.id, load)
 
     @classmethod
     async def update(cls, session: AsyncSession, id: int, **kwargs):
@@ -130,7 +256,8 @@ class HabitueManager:
             if hasattr(habitue, key):
                 setattr(habitue, key, value)
 
-        await session.commit()
+        await commit(session)
+        forget(session, Habitue, id)
         log.debug(f"DATABASE: Updated habitue {habitue.id}")
         return habitue
 
@@ -145,7 +272,8 @@ class HabitueManager:
         habitue = await cls.get_by_id(session, id)
         if habitue is not None:
             await session.delete(habitue)
-            await session.commit()
+            await commit(session)
+            forget(session, Habitue, id)
             log.debug(f"DATABASE: Deleted habitue {id}")
             return True
         return False
@@ -194,25 +322,28 @@ class HabitueManager:
         Returns:
             Une liste des indices des habitués qui ont été ajoutés
         """
-        added_habitues_indices = []
-        results = await session.exec(select(Habitue))
-        habitues = results.all()
-        existing_habitue_ids = [habitue.id for habitue in habitues]
-
-        for idx, (member_id, has_role) in enumerate(
-            zip(members_ids, members_with_habitue_role)
-        ):
-            if has_role and member_id not in existing_habitue_ids:
-                new_habitue = Habitue(id=member_id, color="#000000")
-                session.add(new_habitue)
-                added_habitues_indices.append(idx)
-
-        await session.commit()
-        return added_habitues_indices
+        # Without their user row, the insert would fail on the foreign key
+        known = user_ids(session)
+        inserted = await insert_missing(
+            session,
+            Habitue,
+            [
+                {"id": member_id, "color": "#000000"}
+                for member_id, has_role in zip(members_ids, members_with_habitue_role)
+                if has_role and (known is None or member_id in known)
+            ],
+        )
+        if inserted:
+            await notify(session, table_name(Habitue))
+        await commit(session)
+        return [
+            idx for idx, member_id in enumerate(members_ids) if member_id in inserted
+        ]
 
     # endregion
 
 
+@track_operations
 class StreamerManager:
     """
     Gestionnaire pour les entités Streamer dans la base de données.
@@ -235,7 +366,7 @@ class StreamerManager:
         """
         new_streamer = Streamer(id=streamer_id, channel_tag=channel_tag)
         session.add(new_streamer)
-        await session.commit()
+        await commit(session)
         log.debug(f"DATABASE: Added streamer {streamer_id}")
         return new_streamer
 
@@ -258,23 +389,26 @@ class StreamerManager:
         Returns:
             Une liste des indices des streamers qui ont été ajoutés
         """
-        added_streamers_indices = []
-        results = await session.exec(select(Streamer))
-        streamers = results.all()
-        existing_streamer_ids = [streamer.id for streamer in streamers]
-
-        for idx, (member_id, has_role) in enumerate(
-            zip(members_ids, members_with_streamer_role)
-        ):
-            if has_role and member_id not in existing_streamer_ids:
-                new_streamer = Streamer(id=member_id, channel_tag=None)
-                session.add(new_streamer)
-                added_streamers_indices.append(idx)
-
-        await session.commit()
-        return added_streamers_indices
+        # Without their user row, the insert would fail on the foreign key
+        known = user_ids(session)
+        inserted = await insert_missing(
+            session,
+            Streamer,
+            [
+                {"id": member_id, "channel_tag": None}
+                for member_id, has_role in zip(members_ids, members_with_streamer_role)
+                if has_role and (known is None or member_id in known)
+            ],
+        )
+        if inserted:
+            await notify(session, table_name(Streamer))
+        await commit(session)
+        return [
+            idx for idx, member_id in enumerate(members_ids) if member_id in inserted
+        ]
 
 
+@track_operations
 class GameCategoryManager:
     # region CRUD
     @classmethod
@@ -297,32 +431,93 @@ class GameCategoryManager:
             role_id=role_id,
         )
         session.add(new_game_category)
-        await session.commit()
+        await commit(session)
         log.debug(f"DATABASE: Added game category {game_name}")
         return new_game_category
 
     @classmethod
-    async def get_by_id(cls, session: AsyncSession, id: int) -> GameCategory | None:
-        results = await session.exec(select(GameCategory).where(GameCategory.id == id))
-        game_category = results.first()
+    async def get_by_id(
+        cls, session: AsyncSession, id: int, load: LoadSpec | None = None
+    ) -> GameCategory | None:
+        game_categories = await cls._read(
+            session,
+            ("gamecategory.id", id),
+            select(GameCategory).where(GameCategory.id == id),
+            load,
+        )
+        game_category = game_categories[0] if game_categories else None
         if game_category is None:
             log.error(f"GameCategory with ID {id} not found in the database")
         return game_category
 
     @classmethod
-    async def get_by_name(cls, session: AsyncSession, name: str) -> GameCategory | None:
-        results = await session.exec(
-            select(GameCategory).where(GameCategory.name == name)
+    async def get_by_name(
+        cls, session: AsyncSession, name: str, load: LoadSpec | None = None
+    ) -> GameCategory | None:
+        game_categories = await cls._read(
+            session,
+            ("gamecategory.name", name),
+            select(GameCategory).where(GameCategory.name == name).limit(1),
+            load,
         )
-        game_category = results.first()
+        game_category = game_categories[0] if game_categories else None
         if game_category is None:
             log.error(f"GameCategory with name {name} not found in the database")
         return game_category
 
     @classmethod
-    async def get_all(cls, session) -> list[GameCategory]:
-        results = await session.exec(select(GameCategory))
-        return results.all()
+    async def get_by_voice_id(
+        cls, session: AsyncSession, voice_id: int, load: LoadSpec | None = None
+    ) -> GameCategory | None:
+        """La catégorie dont voice_id est le salon "Add Party", None pour les autres salons."""
+        game_categories = await cls._read(
+            session,
+            ("gamecategory.voice_id", voice_id),
+            select(GameCategory).where(GameCategory.voice_id == voice_id),
+            load,
+        )
+        return game_categories[0] if game_categories else None
+
+    @classmethod
+    async def get_all(
+        cls, session: AsyncSession, load: LoadSpec | None = None
+    ) -> list[GameCategory]:
+        return await cls._read(
+            session, ("gamecategory.all",), select(GameCategory), load
+        )
+
+    @classmethod
+    async def get_summaries(cls, session: AsyncSession) -> list[GameSummary]:
+        """Identifiant, nom et salon vocal de chaque catégorie, sans charger les entités."""
+        return await coalesced(
+            session,
+            ("gamecategory.summaries",),
+            lambda: fetch_all(
+                session, GameSummary, select_view(GameSummary, GameCategory)
+            ),
+        )
+
+    @classmethod
+    async def _read(
+        cls,
+        session: AsyncSession,
+        key: tuple,
+        statement: SelectOfScalar[GameCategory],
+        load: LoadSpec | None,
+    ) -> list[GameCategory]:
+        """
+        Lectures faites par beaucoup de commandes à la fois (après l'annonce d'un jeu...) :
+        sans relations à charger, les lectures identiques simultanées n'en font qu'une
+        (voir model/coalescing.py).
+        """
+
+        async def query() -> list[GameCategory]:
+            results = await session.exec(statement.options(*eager(GameCategory, load)))
+            return list(results.unique().all())
+
+        if load:
+            return await query()
+        return await coalesced(session, key, query)
 
     @classmethod
     async def update(cls, session: AsyncSession, id: int, **kwargs):
@@ -334,7 +529,7 @@ class GameCategoryManager:
             if hasattr(game_category, key):
                 setattr(game_category, key, value)
 
-        await session.commit()
+        await commit(session)
         log.debug(f"DATABASE: Updated game category {game_category.name}")
         return game_category
 
@@ -350,7 +545,7 @@ class GameCategoryManager:
         game_category = await cls.get_by_id(session, id)
         if game_category is not None:
             await session.delete(game_category)
-            await session.commit()
+            await commit(session)
             log.debug(f"DATABASE: Deleted game category {game_category.name}")
             return True
         return False
@@ -368,15 +563,32 @@ class GameCategoryManager:
     @classmethod
     async def get_channels(
         cls, session: AsyncSession, name: str
-    ) -> tuple[int, int, int] | None:
-        game_category = await cls.get_by_name(session, name)
-        if game_category is None:
-            return None
-        return game_category.forum_id, game_category.text_id, game_category.voice_id
+    ) -> GameChannels | None:
+        channels = await fetch_first(
+            session,
+            GameChannels,
+            select_view(GameChannels, GameCategory).where(
+                col(GameCategory.name) == name
+            ),
+        )
+        if channels is None:
+            log.error(f"GameCategory with name {name} not found in the database")
+        return channels
 
     @classmethod
-    async def get_parties(cls, session: AsyncSession, name: str) -> list[Party] | None:
-        game_category = await cls.get_by_name(session, name)
+    async def get_parties(
+        cls, session: AsyncSession, name: str, load: LoadSpec | None = None
+    ) -> list[Party] | None:
+        """
+        Args:
+            load: Relations des parties à charger avec elles, ex. {"owner": "joined"}
+        """
+        nested = {
+            f"parties.{path}": strategy for path, strategy in (load or {}).items()
+        }
+        game_category = await cls.get_by_name(
+            session, name, load={"parties": "selectin", **nested}
+        )
         if game_category is None:
             return None
         return game_category.parties
@@ -384,55 +596,114 @@ class GameCategoryManager:
     # endregion
 
 
+@track_operations
 class PartyManager:
     # region CRUD
     @classmethod
     async def add(
         cls,
         session: AsyncSession,
-        game_category: GameCategory,
+        game_category: GameCategory | GameRow,
         name: str,
         owner: discord.Member,
         channel_id: int,
     ):
-        new_party = Party(
+        """
+        Enregistre une partie, sauf si le membre en a déjà une dans cette catégorie.
+
+        Returns:
+            La partie du membre dans cette catégorie : la nouvelle, ou celle qui existait
+            déjà (son channel_id est alors différent de celui donné)
+        """
+        created = (
+            await session.execute(
+                insert_ignore(session.bind.dialect, Party)
+                .values(
+                    channel_id=channel_id,
+                    game_category_id=game_category.id,
+                    name=name,
+                    owner_id=owner.id,
+                )
+                .returning(col(Party.channel_id))
+            )
+        ).scalar()
+        if created is not None:
+            await notify(session, table_name(Party), channel_id)
+        await commit(session)
+        if created is None:
+            log.debug(
+                f"DATABASE: {owner.display_name} already has a party in {game_category.name}"
+            )
+            existing = await cls.get_by_owner_and_game(
+                session, owner.id, game_category.id
+            )
+            return existing[0] if existing else None
+        log.debug(f"DATABASE: Added party {name} owned by {owner.display_name}")
+        # The inserted values are the row, attached to the session without reading it back
+        party = Party(
             channel_id=channel_id,
             game_category_id=game_category.id,
             name=name,
             owner_id=owner.id,
         )
-        session.add(new_party)
-        await session.commit()
-        log.debug(f"DATABASE: Added party {name} owned by {owner.display_name}")
-        return new_party
+        make_transient_to_detached(party)
+        return await session.merge(party, load=False)
+
+    @classmethod
+    async def lock_creation(
+        cls, session: AsyncSession, owner_id: int, game_category_id: int
+    ) -> bool:
+        """
+        Réserve la création de la partie d'un membre dans une catégorie jusqu'à la fin de la
+        transaction (le prochain commit, ou celui de l'unité de travail), entre toutes les
+        instances du bot.
+
+        Returns:
+            False si une autre transaction s'en occupe déjà
+        """
+        return await try_xact_lock(session, "party", owner_id, game_category_id)
 
     @classmethod
     async def get_by_channel_id(
-        cls, session: AsyncSession, channel_id: int
+        cls, session: AsyncSession, channel_id: int, load: LoadSpec | None = None
     ) -> Party | None:
         results = await session.exec(
-            select(Party).where(Party.channel_id == channel_id)
+            select(Party)
+            .where(Party.channel_id == channel_id)
+            .options(*eager(Party, load))
         )
-        party = results.first()
+        party = results.unique().first()
         if party is None:
             log.warning(f"No party found with channel_id {channel_id}")
         return party
 
     @classmethod
-    async def get_by_owner(cls, session: AsyncSession, owner_id: int) -> list[Party]:
-        query = select(Party).where(Party.owner_id == owner_id)
+    async def get_by_owner(
+        cls, session: AsyncSession, owner_id: int, load: LoadSpec | None = None
+    ) -> list[Party]:
+        query = (
+            select(Party).where(Party.owner_id == owner_id).options(*eager(Party, load))
+        )
         results = await session.exec(query)
-        return list(results.all())
+        return list(results.unique().all())
 
     @classmethod
     async def get_by_owner_and_game(
-        cls, session: AsyncSession, owner_id: int, game_category_id: int
+        cls,
+        session: AsyncSession,
+        owner_id: int,
+        game_category_id: int,
+        load: LoadSpec | None = None,
     ) -> list[Party]:
-        query = select(Party).where(
-            Party.owner_id == owner_id, Party.game_category_id == game_category_id
+        query = (
+            select(Party)
+            .where(
+                Party.owner_id == owner_id, Party.game_category_id == game_category_id
+            )
+            .options(*eager(Party, load))
         )
         results = await session.exec(query)
-        return list(results.all())
+        return list(results.unique().all())
 
     @classmethod
     async def update(cls, session: AsyncSession, channel_id: int, **kwargs):
@@ -444,17 +715,20 @@ class PartyManager:
             if hasattr(party, key):
                 setattr(party, key, value)
 
-        await session.commit()
+        await commit(session)
         log.debug(f"DATABASE: Updated party {party.name}")
         return party
 
     @classmethod
     async def delete(cls, session: AsyncSession, channel_id: int):
-        party = await cls.get_by_channel_id(session, channel_id)
+        # The owner is only read for the log, loaded with the party
+        party = await cls.get_by_channel_id(
+            session, channel_id, load={"owner": "joined"}
+        )
         if party is not None:
+            owner: User | None = party.owner
             await session.delete(party)
-            await session.commit()
-            owner: User | None = await MemberManager.get_by_id(session, party.owner_id)
+            await commit(session)
             if owner is not None:
                 log.debug(f"DATABASE: Deleted party {party.name} owned by {owner.name}")
             else:
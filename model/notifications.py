@@ -0,0 +1,279 @@
+"""
+Cross-process change notifications through PostgreSQL LISTEN/NOTIFY.
+
+Every flush that writes a user, habitue, game category or party row also sends a
+`pg_notify` on the `zors_changes` channel with "<origin>:<write|delete>:<table>:<primary key>"
+("*" as key for bulk writes). PostgreSQL delivers them when the transaction commits and drops
+them on rollback.
+
+Each process keeps one dedicated LISTEN connection (ChangeListener) and hands the changes to
+its subscribers, which invalidate their local caches. The notifications of its own Database,
+recognized by their origin token, are skipped: LocalChanges already handed them over. After a
+reconnection, notifications sent while disconnected are lost: every subscriber is told that
+everything may have changed.
+
+The writes of the process itself are also handed to the subscribers of LocalChanges as soon as
+they are committed, with any database: they can't wait for the notification to come back.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import uuid
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
+
+from loguru import logger as log
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    import asyncpg
+
+CHANNEL = "zors_changes"
+# The origin token of the Database, written in its notifications
+SESSION_KEY = "notify_changes"
+# Tables written during the transaction, handed to LocalChanges once it commits
+CHANGED_KEY = "changed_tables"
+LOCAL_KEY = "local_changes"
+tracked_tables = frozenset(
+    {
+        "user",
+        "habitue",
+        "gamecategory",
+        "party",
+        "streamer",
+        "streamermoderatorrelation",
+    }
+)
+
+# (table, primary key, deleted), None when the whole table may have changed
+type Subscriber = Callable[[str, str | None, bool], None]
+
+db_notifications = metrics.counter(
+    "zors_db_notifications_total",
+    "Change notifications received from PostgreSQL, by table.",
+    ("table",),
+)
+db_listener_reconnects = metrics.counter(
+    "zors_db_listener_reconnects_total",
+    "Reconnections of the LISTEN connection, each one invalidates every local cache.",
+)
+
+
+def new_origin() -> str:
+    """Token telling the notifications of a Database apart from the ones of the others."""
+    return uuid.uuid4().hex
+
+
+def _payload(origin: str, table: str, key: object, deleted: bool = False) -> str:
+    return f"{origin}:{'delete' if deleted else 'write'}:{table}:{key}"
+
+
+def _changes(session: Session) -> set[tuple[str, str, bool]]:
+    changes = set()
+    dirty = [instance for instance in session.dirty if session.is_modified(instance)]
+    for instance in (*session.new, *dirty, *session.deleted):
+        state = inspect(instance)
+        table = state.mapper.local_table.name
+        if table not in tracked_tables:
+            continue
+        key = state.mapper.primary_key_from_instance(instance)
+        changes.add(
+            (
+                table,
+                ":".join(str(part) for part in key),
+                instance in session.deleted,
+            )
+        )
+    return changes
+
+
+def _record(session: Session, changes: Iterable[tuple[str, str, bool]]) -> None:
+    if session.info.get(LOCAL_KEY) is not None:
+        session.info.setdefault(CHANGED_KEY, set()).update(changes)
+
+
+@event.listens_for(Session, "after_flush")
+def _notify_flushed(session: Session, flush_context) -> None:
+    origin = session.info.get(SESSION_KEY)
+    if not origin and session.info.get(LOCAL_KEY) is None:
+        return
+    changes = _changes(session)
+    _record(session, changes)
+    if origin and changes:
+        session.connection().execute(
+            select(
+                *(
+                    func.pg_notify(CHANNEL, _payload(origin, *change))
+                    for change in sorted(changes)
+                )
+            )
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_committed(session: Session) -> None:
+    changes = session.info.pop(CHANGED_KEY, ())
+    local: LocalChanges | None = session.info.get(LOCAL_KEY)
+    if local is not None:
+        for table, key, deleted in changes:
+            local.dispatch(table, None if key == "*" else key, deleted)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(CHANGED_KEY, None)
+
+
+async def notify(
+    session: AsyncSession, table: str, key: object = "*", deleted: bool = False
+) -> None:
+    """Announces a write made with a Core statement, which the flush doesn't see."""
+    _record(session.sync_session, [(table, str(key), deleted)])
+    if origin := session.info.get(SESSION_KEY):
+        await session.execute(
+            select(func.pg_notify(CHANNEL, _payload(origin, table, key, deleted)))
+        )
+
+
+async def notify_tables(session: AsyncSession, *tables: str) -> None:
+    """Announces bulk writes to several tables, in one statement."""
+    _record(session.sync_session, [(table, "*", False) for table in tables])
+    if (origin := session.info.get(SESSION_KEY)) and tables:
+        await session.execute(
+            select(
+                *(
+                    func.pg_notify(CHANNEL, _payload(origin, table, "*"))
+                    for table in tables
+                )
+            )
+        )
+
+
+class _Subscribers:
+    def __init__(self) -> None:
+        self._subscribers: list[tuple[Subscriber, frozenset[str]]] = []
+
+    def subscribe(
+        self, subscriber: Subscriber, tables: Iterable[str] = tracked_tables
+    ) -> None:
+        self._subscribers.append((subscriber, frozenset(tables)))
+
+    def dispatch(self, table: str, key: str | None, deleted: bool = False) -> None:
+        for subscriber, tables in self._subscribers:
+            if table in tables:
+                try:
+                    subscriber(table, key, deleted)
+                except Exception as e:
+                    log.opt(exception=e).error(
+                        f"Change subscriber {subscriber!r} failed on {table}:{key}"
+                    )
+
+
+class LocalChanges(_Subscribers):
+    """Writes committed by the sessions of this process, dispatched right after the commit."""
+
+
+class ChangeListener(_Subscribers):
+    """Dedicated LISTEN connection dispatching change notifications to the subscribers."""
+
+    def __init__(
+        self, url: URL, origin: str, keepalive: float = 30.0, retry: float = 1.0
+    ):
+        """
+        Args:
+            url: The database, listened to outside of the pool.
+            origin: Token of the notifications of this Database, skipped.
+            keepalive: Delay between two pings of an idle connection, in seconds.
+            retry: First delay before reconnecting, doubled up to a minute.
+        """
+        super().__init__()
+        self.origin = origin
+        # asyncpg itself, outside of the pool: the connection stays checked out for good
+        self._dsn = url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        self.keepalive = keepalive
+        self.retry = retry
+        self._task: asyncio.Task | None = None
+        self.connected = asyncio.Event()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="database: listen")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        try:
+            origin, operation, table, key = payload.split(":", 3)
+        except ValueError:
+            log.warning(f"Change notifications: malformed payload {payload!r}")
+            return
+        if origin == self.origin:
+            # Ours, already dispatched by LocalChanges when it was committed
+            return
+        db_notifications.labels(table).inc()
+        self.dispatch(table, None if key == "*" else key, operation == "delete")
+
+    def _resync(self) -> None:
+        for table in tracked_tables:
+            self.dispatch(table, None)
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        delay, first = self.retry, True
+        while True:
+            # Closed by the finally block, whatever failed after it was opened
+            opened: asyncpg.Connection | None = None
+            try:
+                connection: asyncpg.Connection = await asyncpg.connect(self._dsn)
+                opened = connection
+                await connection.add_listener(CHANNEL, self._on_notification)
+                if not first:
+                    db_listener_reconnects.inc()
+                    self._resync()
+                    log.info("Change notifications: LISTEN connection restored")
+                first, delay = False, self.retry
+                self.connected.set()
+                await self._watch(connection)
+                log.warning(
+                    f"Change notifications: LISTEN connection closed, "
+                    f"reconnecting in {delay:.0f}s"
+                )
+            except (
+                OSError,
+                TimeoutError,
+                asyncpg.PostgresError,
+                asyncpg.InterfaceError,
+            ) as e:
+                log.warning(
+                    f"Change notifications: LISTEN connection lost ({e!r}), "
+                    f"retrying in {delay:.0f}s"
+                )
+            finally:
+                self.connected.clear()
+                if opened is not None and not opened.is_closed():
+                    opened.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    async def _watch(self, connection: asyncpg.Connection) -> None:
+        """Returns when the connection is closed, raises when it stops answering."""
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _: closed.set())
+        while not closed.is_set():
+            try:
+                await asyncio.wait_for(closed.wait(), self.keepalive)
+            except TimeoutError:
+                # A dead peer doesn't always close the socket, ping it
+                await asyncio.wait_for(connection.fetchval("SELECT 1"), self.keepalive)
@@ -0,0 +1,276 @@
+"""
+Startup preload of the small tables owned by the bot.
+
+On READY, the game categories, parties, habitues and streamers (with their moderators) are read
+in one go, one connection per table in parallel on PostgreSQL, one after the other on SQLite,
+into compact read-only indexes. The interaction and voice handlers read them instead of the
+database.
+
+A committed write of this process (see LocalChanges) or a change notification of another one
+makes the index of its table stale: until it is reloaded in the background, with a single
+SELECT, its accessor returns None and the caller reads the database like before. A handler
+never gets rows older than a write it can know about.
+"""
+
+import asyncio
+import contextvars
+from collections.abc import Mapping
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, NamedTuple
+
+from loguru import logger as log
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import SQLModel
+
+from model.database import Database
+from model.dialects import table_name
+from model.schemas import (
+    GameCategory,
+    Habitue,
+    Party,
+    Streamer,
+    StreamerModeratorRelation,
+)
+from model.views import (
+    GameRow,
+    HabitueRow,
+    ModeratorRow,
+    PartyRow,
+    StreamerRow,
+    select_view,
+)
+from utils.metrics import cache_requests, metrics
+
+preload_rows = metrics.gauge(
+    "zors_preload_rows", "Rows held by the preloaded indexes, by table.", ("table",)
+)
+preload_duration = metrics.histogram(
+    "zors_preload_duration_seconds",
+    "Time taken to read the preloaded tables, by index.",
+    ("index",),
+)
+
+
+@dataclass(frozen=True)
+class Games:
+    by_id: Mapping[int, GameRow]
+    by_name: Mapping[str, GameRow]
+    # By "Add Party" voice channel
+    by_voice: Mapping[int, GameRow]
+
+    @classmethod
+    def build(cls, games: list[GameRow]) -> "Games":
+        return cls(
+            {game.id: game for game in games},
+            {game.name: game for game in games},
+            {game.voice_id: game for game in games},
+        )
+
+
+@dataclass(frozen=True)
+class Parties:
+    by_channel: Mapping[int, PartyRow]
+    by_owner: Mapping[int, tuple[PartyRow, ...]]
+
+    @classmethod
+    def build(cls, parties: list[PartyRow]) -> "Parties":
+        by_owner: dict[int, tuple[PartyRow, ...]] = {}
+        for party in parties:
+            by_owner[party.owner_id] = (*by_owner.get(party.owner_id, ()), party)
+        return cls({party.channel_id: party for party in parties}, by_owner)
+
+
+@dataclass(frozen=True)
+class Habitues:
+    colors: Mapping[int, str]
+
+    @classmethod
+    def build(cls, habitues: list[HabitueRow]) -> "Habitues":
+        return cls({habitue.id: habitue.color for habitue in habitues})
+
+
+@dataclass(frozen=True)
+class Streamers:
+    by_id: Mapping[int, StreamerRow]
+    moderators: Mapping[int, frozenset[int]]
+
+    @classmethod
+    def build(
+        cls, streamers: list[StreamerRow], moderators: list[ModeratorRow]
+    ) -> "Streamers":
+        moderated: dict[int, set[int]] = {}
+        for link in moderators:
+            moderated.setdefault(link.streamer_id, set()).add(link.moderator_id)
+        return cls(
+            {streamer.id: streamer for streamer in streamers},
+            {id: frozenset(users) for id, users in moderated.items()},
+        )
+
+
+class _Index:
+    def __init__(self, name: str, build: Any, *reads: tuple[type[SQLModel], Any]):
+        self.name = name
+        self.build = build
+        # (model, view) of each table read, in the order of the build arguments
+        self.reads: tuple[tuple[type[SQLModel], type[NamedTuple]], ...] = reads
+        self.value: Any = None
+        # Bumped by every change of its tables, the value is fresh while loaded == version
+        self.version = 0
+        self.loaded = -1
+        self.task: asyncio.Task | None = None
+        self._hits = cache_requests.labels(f"preload:{name}", "hit")
+        self._misses = cache_requests.labels(f"preload:{name}", "miss")
+
+    def get(self) -> Any:
+        if self.value is None or self.loaded != self.version:
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        return self.value
+
+
+class Preload:
+    def __init__(self, database: Database, enabled: bool = True, retry: float = 5.0):
+        """
+        Args:
+            database: Where the tables are read, its changes make the indexes stale.
+            enabled: False to never load anything, every accessor returns None.
+            retry: Delay before reading again a table whose reload failed, in seconds.
+        """
+        self.database = database
+        self.enabled = enabled
+        self.retry = retry
+        self._indexes = {
+            index.name: index
+            for index in (
+                _Index("games", Games.build, (GameCategory, GameRow)),
+                _Index("parties", Parties.build, (Party, PartyRow)),
+                _Index("habitues", Habitues.build, (Habitue, HabitueRow)),
+                _Index(
+                    "streamers",
+                    Streamers.build,
+                    (Streamer, StreamerRow),
+                    (StreamerModeratorRelation, ModeratorRow),
+                ),
+            )
+        }
+        self._by_table = {
+            table_name(model): index
+            for index in self._indexes.values()
+            for model, _ in index.reads
+        }
+        database.local_changes.subscribe(self.on_change, self._by_table)
+        if database.changes is not None:
+            database.changes.subscribe(self.on_change, self._by_table)
+
+    # region Accessors
+    def games(self) -> Games | None:
+        return self._indexes["games"].get()
+
+    def parties(self) -> Parties | None:
+        return self._indexes["parties"].get()
+
+    def habitues(self) -> Habitues | None:
+        return self._indexes["habitues"].get()
+
+    def streamers(self) -> Streamers | None:
+        return self._indexes["streamers"].get()
+
+    # endregion
+
+    async def load(self) -> None:
+        """Reads every preloaded table, called on READY."""
+        if not self.enabled:
+            return
+        started = perf_counter()
+        try:
+            counts = await self._load(list(self._indexes.values()))
+        except (SQLAlchemyError, OSError) as e:
+            log.opt(exception=e).error(
+                "Preload failed, retrying; the handlers read the database meanwhile"
+            )
+            for index in self._indexes.values():
+                self._refresh(index)
+            return
+        for index in self._indexes.values():
+            # Changed while they were read
+            if index.loaded != index.version:
+                self._refresh(index)
+        log.info(
+            f"Preloaded {', '.join(f'{count} {table}' for table, count in counts.items())} "
+            f"in {(perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    async def stop(self) -> None:
+        tasks = [index.task for index in self._indexes.values() if index.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def on_change(self, table: str, key: str | None, deleted: bool = False) -> None:
+        """A row of `table` was written, by this process or another one."""
+        index = self._by_table[table]
+        index.version += 1
+        # Nothing to refresh before the first load
+        if index.value is not None:
+            self._refresh(index)
+
+    def _refresh(self, index: _Index) -> None:
+        if index.task is None or index.task.done():
+            # Not in the context of the write that triggered it: its manager call, its trace
+            index.task = asyncio.create_task(
+                self._reload(index),
+                name=f"preload: {index.name}",
+                context=contextvars.Context(),
+            )
+
+    async def _reload(self, index: _Index) -> None:
+        while index.loaded != index.version:
+            try:
+                await self._load([index])
+            except (SQLAlchemyError, OSError) as e:
+                log.warning(
+                    f"Preload: reloading {index.name} failed ({e!r}), "
+                    f"retrying in {self.retry:.0f}s"
+                )
+                await asyncio.sleep(self.retry)
+
+    async def _load(self, indexes: list[_Index]) -> dict[str, int]:
+        versions = [index.version for index in indexes]
+        reads = [read for index in indexes for read in index.reads]
+        started = perf_counter()
+        results = iter(await self._fetch(reads))
+        counts: dict[str, int] = {}
+        for index, version in zip(indexes, versions):
+            tables = [next(results) for _ in index.reads]
+            preload_duration.labels(index.name).observe(perf_counter() - started)
+            for (model, _), rows in zip(index.reads, tables):
+                counts[table_name(model)] = len(rows)
+                preload_rows.labels(table_name(model)).set(len(rows))
+            index.value = index.build(*tables)
+            # A change committed meanwhile may be missing, _reload reads it again
+            index.loaded = version
+        return counts
+
+    async def _fetch(
+        self, reads: list[tuple[type[SQLModel], type[NamedTuple]]]
+    ) -> list[list[Any]]:
+        engine = self.database.engine
+
+        async def fetch(connection, model, view) -> list[Any]:
+            result = await connection.execute(select_view(view, model))
+            return [view._make(row) for row in result.all()]
+
+        if engine.dialect.name != "postgresql":
+            # A single connection at a time on SQLite
+            async with engine.connect() as connection:
+                return [await fetch(connection, model, view) for model, view in reads]
+
+        async def alone(model, view) -> list[Any]:
+            async with engine.connect() as connection:
+                return await fetch(connection, model, view)
+
+        return list(
+            await asyncio.gather(*(alone(model, view) for model, view in reads))
+        )
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from sqlalchemy import String
+from sqlalchemy import String, UniqueConstraint
 from sqlmodel import SQLModel, Field, BigInteger, Relationship
 
 from utils.color import Color
@@ -8,10 +8,15 @@ from utils.color import Color
 
 class StreamerModeratorRelation(SQLModel, table=True):
     streamer_id: int | None = Field(
-        default=None, foreign_key="streamer.id", primary_key=True
+        default=None, foreign_key="streamer.id", primary_key=True, sa_type=BigInteger
     )
+    # The primary key only serves the lookups by streamer
     moderator_id: int | None = Field(
-        default=None, foreign_key="user.id", primary_key=True
+        default=None,
+        foreign_key="user.id",
+        primary_key=True,
+        sa_type=BigInteger,
+        index=True,
     )
 
 
@@ -77,7 +82,8 @@ class GameCategory(SQLModel, table=True):
 
     forum_id: int = Field(sa_type=BigInteger)
     text_id: int = Field(sa_type=BigInteger)
-    voice_id: int = Field(sa_type=BigInteger)
+    # The "Add Party" channel of the game, see GameCategoryManager.get_by_voice_id
+    voice_id: int = Field(sa_type=BigInteger, unique=True, index=True)
     role_id: int = Field(sa_type=BigInteger)
 
     parties: list["Party"] = Relationship(
@@ -87,8 +93,14 @@ class GameCategory(SQLModel, table=True):
 
 
 class Party(SQLModel, table=True):
+    # One party per member and game, see PartyManager.add; also the index of the lookups
+    # by owner (get_by_owner, get_by_owner_and_game)
+    __table_args__ = (UniqueConstraint("owner_id", "game_category_id"),)
+
     channel_id: int = Field(primary_key=True, sa_type=BigInteger)
-    game_category_id: int = Field(foreign_key="gamecategory.id", sa_type=BigInteger)
+    game_category_id: int = Field(
+        foreign_key="gamecategory.id", sa_type=BigInteger, index=True
+    )
     owner_id: int = Field(foreign_key="user.id", sa_type=BigInteger)
     name: str
 
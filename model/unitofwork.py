@@ -0,0 +1,53 @@
+"""
+Units of work: several manager calls committed as a single transaction.
+
+`Database.transaction()` opens one and makes its session the current one of the task
+(a ContextVar): `get_session()` and nested `transaction()` calls made meanwhile get the same
+session, inside a SAVEPOINT, so a failing block only undoes its own writes. The managers end
+their writes with `commit(session)`, which only flushes inside a unit of work; the unit
+commits once, when it ends. Every slash command runs in one (see cogs/events.py).
+
+Outside of a unit of work, `commit(session)` commits like before.
+"""
+
+import asyncio
+from contextvars import ContextVar, Token
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+SESSION_KEY = "unit_of_work"
+
+# With the task that opened it: the tasks it starts inherit the variable, not the session,
+# an AsyncSession can't be used concurrently
+_current: ContextVar[tuple[AsyncSession, asyncio.Task | None] | None] = ContextVar(
+    "unit_of_work", default=None
+)
+
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    return bool(session.info.get(SESSION_KEY))
+
+
+def current_session() -> AsyncSession | None:
+    """Session of the unit of work running in this task, if any."""
+    current = _current.get()
+    if current is None or current[1] is not asyncio.current_task():
+        return None
+    return current[0]
+
+
+def enter(session: AsyncSession) -> Token:
+    session.info[SESSION_KEY] = True
+    return _current.set((session, asyncio.current_task()))
+
+
+def leave(token: Token) -> None:
+    _current.reset(token)
+
+
+async def commit(session: AsyncSession) -> None:
+    """End of a manager write: committed now, or with the unit of work it belongs to."""
+    if in_unit_of_work(session):
+        await session.flush()
+    else:
+        await session.commit()
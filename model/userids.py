@@ -0,0 +1,195 @@
+"""
+In-memory mirror of the ids of the `user` table.
+
+Several paths only need to know whether a member is already a row of `user`: the startup
+sync, the write-behind of the arrivals and departures, the habitue inserts that need their
+user first. The mirror answers without a query, in O(log n) and 8 bytes per member (see
+utils/idset.py). It is read once when the bot starts.
+
+The managers record the ids they insert and delete with `added` and `removed`; the mirror
+only changes when the transaction commits (the unit of work's, see model/unitofwork.py), a
+rollback leaves it untouched. It never holds an id the database doesn't have, as far as this
+process can know: a change notification from another process (see model/notifications.py)
+carrying one id is applied right away; a bulk one ("*") or a reconnection of the listener
+makes it stale until it is read again in the background, and `user_ids` returns None
+meanwhile, the callers query the database like before.
+"""
+
+import asyncio
+import contextvars
+from array import array
+from collections.abc import Iterable
+from time import perf_counter
+
+from loguru import logger as log
+from sqlalchemy import event, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlmodel import col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from model.schemas import User
+from utils.idset import IdSet
+from utils.metrics import metrics
+
+SESSION_KEY = "user_ids"
+# Changes to apply once the transaction commits: (added, ids)
+PENDING_KEY = "user_ids_pending"
+
+user_ids_entries = metrics.gauge(
+    "zors_user_ids_entries", "Ids held by the mirror of the user table."
+)
+user_ids_bytes = metrics.gauge(
+    "zors_user_ids_bytes", "Memory used by the mirror of the user table."
+)
+
+
+class UserIds:
+    def __init__(self, engine: AsyncEngine, retry: float = 5.0):
+        """
+        Args:
+            engine: Where the ids are read.
+            retry: Delay before reading them again after a failure, in seconds.
+        """
+        self.engine = engine
+        self.retry = retry
+        self.ids = IdSet()
+        self.loaded = False
+        # Changes committed while the ids are read, applied over what was read
+        self._replay: list[tuple[bool, tuple[int, ...]]] | None = None
+        self._stale = False
+        self._task: asyncio.Task | None = None
+        self._reading = asyncio.Lock()
+        user_ids_entries.labels().set_function(lambda: len(self.ids))
+        user_ids_bytes.labels().set_function(lambda: self.ids.nbytes)
+
+    def __contains__(self, id: object) -> bool:
+        return id in self.ids
+
+    async def load(self) -> None:
+        """Reads every id of `user`, the mirror is used once it returns."""
+        started = perf_counter()
+        try:
+            await self._read()
+        except (SQLAlchemyError, OSError) as e:
+            log.opt(exception=e).error(
+                f"User ids not loaded, retrying in {self.retry:.0f}s; "
+                "the database is queried meanwhile"
+            )
+            self._schedule()
+            return
+        log.info(
+            f"User ids loaded: {len(self.ids)} ids, {self.ids.nbytes / 1024:.0f} KiB "
+            f"in {(perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    async def _read(self) -> None:
+        async with self._reading:
+            started = perf_counter()
+            self._stale = False
+            self._replay = []
+            try:
+                ids = array("q")
+                async with self.engine.connect() as connection:
+                    result = await connection.stream_scalars(
+                        select(col(User.id)).order_by(col(User.id))
+                    )
+                    async for partition in result.partitions(10_000):
+                        ids.extend(partition)
+                self.ids = IdSet.from_sorted(ids)
+                for added, changed in self._replay:
+                    self._apply(added, changed)
+            except BaseException:
+                self._stale = True
+                raise
+            finally:
+                self._replay = None
+            self.loaded = not self._stale
+            log.debug(
+                f"User ids read: {len(self.ids)} ids "
+                f"in {(perf_counter() - started) * 1000:.1f} ms"
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _apply(self, added: bool, ids: Iterable[int]) -> None:
+        if added:
+            self.ids.update(ids)
+        else:
+            self.ids.difference_update(ids)
+
+    def committed(self, added: bool, ids: tuple[int, ...]) -> None:
+        self._apply(added, ids)
+        if self._replay is not None:
+            self._replay.append((added, ids))
+
+    def on_change(self, table: str, key: str | None, deleted: bool = False) -> None:
+        """Change notification from another process (ours are recorded by the managers)."""
+        if key is not None:
+            self.committed(not deleted, (int(key),))
+            return
+        # Bulk write or missed notifications (reconnection): read everything again
+        self.loaded = False
+        self._schedule()
+
+    def _schedule(self) -> None:
+        self._stale = True
+        if self._task is None or self._task.done():
+            # Not in the context of the write that triggered it
+            self._task = asyncio.create_task(
+                self._reload(), name="database: user ids", context=contextvars.Context()
+            )
+
+    async def _reload(self) -> None:
+        while self._stale:
+            try:
+                await self._read()
+            except (SQLAlchemyError, OSError) as e:
+                log.warning(
+                    f"User ids: reading them failed ({e!r}), retrying in {self.retry:.0f}s"
+                )
+                await asyncio.sleep(self.retry)
+
+
+def user_ids(session: AsyncSession) -> UserIds | None:
+    """The mirror of the user table, None when it can't be trusted (not loaded, stale)."""
+    mirror: UserIds | None = session.info.get(SESSION_KEY)
+    if mirror is None or not mirror.loaded:
+        return None
+    return mirror
+
+
+def added(session: AsyncSession, ids: Iterable[int]) -> None:
+    """Users inserted by the transaction of `session`."""
+    _record(session, True, ids)
+
+
+def removed(session: AsyncSession, ids: Iterable[int]) -> None:
+    """Users deleted by the transaction of `session`."""
+    _record(session, False, ids)
+
+
+def _record(session: AsyncSession, added: bool, ids: Iterable[int]) -> None:
+    if session.info.get(SESSION_KEY) is None:
+        return
+    if ids := tuple(ids):
+        session.info.setdefault(PENDING_KEY, []).append((added, ids))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session: Session) -> None:
+    pending = session.info.pop(PENDING_KEY, ())
+    mirror: UserIds | None = session.info.get(SESSION_KEY)
+    if mirror is not None:
+        for added, ids in pending:
+            mirror.committed(added, ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session) -> None:
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,76 @@
+"""
+Typed read-only views: the columns a caller needs instead of whole entities.
+
+A view is a NamedTuple whose fields are named after columns of a model. Its rows are plain
+tuples, they skip the identity map and have no relationship to load by accident.
+"""
+
+from typing import Any, NamedTuple
+
+from sqlalchemy import Select, select
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+class GameSummary(NamedTuple):
+    """What the autocompletion and the hub lookup need from a game category."""
+
+    id: int
+    name: str
+    voice_id: int
+
+
+class GameChannels(NamedTuple):
+    forum_id: int
+    text_id: int
+    voice_id: int
+
+
+class GameRow(NamedTuple):
+    id: int
+    name: str
+    forum_id: int
+    text_id: int
+    voice_id: int
+    role_id: int
+
+
+class PartyRow(NamedTuple):
+    channel_id: int
+    game_category_id: int
+    owner_id: int
+    name: str
+
+
+class StreamerRow(NamedTuple):
+    id: int
+    channel_tag: str | None
+
+
+class ModeratorRow(NamedTuple):
+    streamer_id: int
+    moderator_id: int
+
+
+class HabitueRow(NamedTuple):
+    id: int
+    color: str
+
+
+def select_view(view: type[NamedTuple], model: type[SQLModel]) -> Select:
+    """SELECT of the columns of `model` named by the fields of `view`."""
+    return select(*(getattr(model, field) for field in view._fields))
+
+
+async def fetch_all[V: NamedTuple](
+    session: AsyncSession, view: type[V], statement: Select
+) -> list[V]:
+    result = await session.execute(statement)
+    return [view._make(row) for row in result.all()]
+
+
+async def fetch_first[V: NamedTuple](
+    session: AsyncSession, view: type[V], statement: Select
+) -> V | None:
+    row: Any = (await session.execute(statement.limit(1))).first()
+    return None if row is None else view._make(row)
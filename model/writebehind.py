@@ -0,0 +1,191 @@
+"""
+Write-behind buffer of the member arrivals and departures.
+
+The gateway listeners only record the change in memory; the buffer writes everything it
+collected in a single transaction (one multi-row upsert, one DELETE per table) at most
+`window` seconds after the first change, or as soon as `max_rows` members are waiting. A
+raid or a prune then costs a few transactions instead of one per member.
+
+Only the latest change of a member is kept. A member who joins and leaves before the flush
+was never written, the pair cancels out; one who leaves and comes back is upserted, which
+refreshes the name. The departure of a member the database doesn't have (a bot...) is not
+recorded at all, when the mirror of the user table can tell (see model/userids.py).
+
+Durability: a change stays in memory for at most `window` seconds while the database is
+reachable, and is flushed when the bot closes. A failed flush keeps its changes (newer ones
+win) and is retried `window` seconds later; a crash loses at most the changes of that
+window, which the startup sync (MemberManager.sync_users) partially recovers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+
+import discord
+from loguru import logger as log
+from sqlalchemy.exc import SQLAlchemyError
+
+from model.database import Database
+from model.managers import MemberManager
+from utils.metrics import metrics
+
+write_behind_changes = metrics.counter(
+    "zors_write_behind_changes_total",
+    "Membership changes recorded by the write-behind buffer, by outcome "
+    "(joined, left, cancelled, skipped).",
+    ("outcome",),
+)
+write_behind_flushes = metrics.counter(
+    "zors_write_behind_flushes_total",
+    "Flushes of the write-behind buffer, by outcome.",
+    ("outcome",),
+)
+write_behind_pending = metrics.gauge(
+    "zors_write_behind_pending", "Membership changes waiting to be flushed."
+)
+write_behind_batch = metrics.histogram(
+    "zors_write_behind_batch_rows",
+    "Members written per flush.",
+    buckets=(1, 5, 10, 50, 100, 250, 500, 1000, 5000),
+)
+
+
+@dataclass
+class _Change:
+    # None when the member left
+    name: str | None
+    # A join of a member absent from the database: a departure cancels it
+    cancellable: bool = False
+
+
+class MembershipWriteBehind:
+    def __init__(self, database: Database, window: float = 2.0, max_rows: int = 500):
+        """
+        Args:
+            database: Where the changes are written.
+            window: Longest time a change waits in memory, in seconds.
+            max_rows: Members waiting that trigger a flush right away.
+        """
+        self.database = database
+        self.window = window
+        self.max_rows = max_rows
+        self._pending: dict[int, _Change] = {}
+        # Changes of the running flush, not in the mirror of the user table yet
+        self._inflight: dict[int, _Change] = {}
+        self._changed = asyncio.Event()
+        self._full = asyncio.Event()
+        # Loop time before which no flush is attempted, after a failed one
+        self._retry_at = 0.0
+        self._flushing = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        write_behind_pending.labels().set_function(lambda: len(self._pending))
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _written(self, member_id: int) -> bool | None:
+        """Whether the member has a row once the running flush is done, None if unknown."""
+        inflight = self._inflight.get(member_id)
+        if inflight is not None:
+            return inflight.name is not None
+        users = self.database.users
+        return member_id in users if users.loaded else None
+
+    def joined(self, member: discord.Member) -> None:
+        previous = self._pending.get(member.id)
+        # After a buffered departure, or for a member already written, the row is in the
+        # database
+        cancellable = previous is None and self._written(member.id) is not True
+        self._pending[member.id] = _Change(member.display_name, cancellable)
+        write_behind_changes.labels("joined").inc()
+        self._wake()
+
+    def left(self, member_id: int) -> None:
+        previous = self._pending.get(member_id)
+        if previous is not None and previous.cancellable:
+            del self._pending[member_id]
+            write_behind_changes.labels("cancelled").inc()
+            return
+        if previous is None and self._written(member_id) is False:
+            write_behind_changes.labels("skipped").inc()
+            return
+        self._pending[member_id] = _Change(None)
+        write_behind_changes.labels("left").inc()
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+
+    async def flush(self) -> bool:
+        """
+        Writes the waiting changes now.
+
+        Returns:
+            False when the database refused them, they are kept for the next flush.
+        """
+        async with self._flushing:
+            if not self._pending:
+                return True
+            changes, self._pending = self._pending, {}
+            self._inflight = changes
+            joined = {
+                id: change.name
+                for id, change in changes.items()
+                if change.name is not None
+            }
+            left = [id for id, change in changes.items() if change.name is None]
+            try:
+                async with self.database.get_session() as session:
+                    await MemberManager.apply_memberships(session, joined, left)
+            except (SQLAlchemyError, OSError) as e:
+                log.opt(exception=e).error(
+                    f"Write-behind: {len(changes)} membership changes not written, "
+                    f"retrying in {self.window:.0f}s"
+                )
+                write_behind_flushes.labels("failed").inc()
+                # The changes recorded during the flush are newer
+                self._pending = changes | self._pending
+                self._retry_at = asyncio.get_running_loop().time() + self.window
+                self._changed.set()
+                return False
+            finally:
+                self._inflight = {}
+            write_behind_flushes.labels("done").inc()
+            write_behind_batch.observe(len(changes))
+            return True
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="database: write-behind")
+
+    async def stop(self) -> None:
+        """Stops the timer and writes what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not await self.flush():
+            log.error(
+                f"Write-behind: {len(self._pending)} membership changes lost on shutdown"
+            )
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._changed.wait()
+            backoff = self._retry_at - loop.time()
+            if backoff > 0:
+                # After a failure, a full buffer doesn't bring the retry forward
+                await asyncio.sleep(backoff)
+            else:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except TimeoutError:
+                    pass
+            self._changed.clear()
+            self._full.clear()
+            await self.flush()
+            if self._pending:
+                self._changed.set()
@@ -0,0 +1,242 @@
+"""
+Search the bot logs, including rotated archives, without decompressing everything.
+
+Archives are indexed at rotation time (see utils/log_archive.py), only the segments whose
+time span and structured fields can match are decompressed.
+
+Usage:
+    python -m tools.logsearch index [--logs logs/]
+    python -m tools.logsearch search --since 30d --member 123456789 --grep "créé pour"
+"""
+
+import argparse
+import re
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from utils.log_archive import (
+    Segment,
+    compression_of,
+    index_path,
+    indexed_fields,
+    iter_archive,
+    line_time,
+    parse_json_line,
+    read_index,
+    read_segment,
+    reindex,
+)
+
+_relative_time = re.compile(r"^(\d+)([smhdw])$")
+_units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+@dataclass
+class Query:
+    since: float | None = None
+    until: float | None = None
+    fields: dict[str, str] = field(default_factory=dict)
+    grep: str | None = None
+
+    def segment_may_match(self, segment: Segment) -> bool:
+        if (
+            self.since is not None
+            and segment.end is not None
+            and segment.end < self.since
+        ):
+            return False
+        if (
+            self.until is not None
+            and segment.start is not None
+            and segment.start > self.until
+        ):
+            return False
+        for name, value in self.fields.items():
+            if name not in segment.fields:
+                # No line of the segment carries the field
+                return False
+            values = segment.fields[name]
+            if values is not None and value not in values:
+                return False
+        return True
+
+    def lines(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """Yields the matching lines, continuation lines inherit the time of the previous line."""
+        grep = self.grep.encode() if self.grep is not None else None
+        current_time: float | None = None
+        for line in lines:
+            record = parse_json_line(line)
+            current_time = line_time(line, record) or current_time
+            if current_time is not None:
+                if self.since is not None and current_time < self.since:
+                    continue
+                if self.until is not None and current_time > self.until:
+                    continue
+            if self.fields:
+                if record is None:
+                    continue
+                if any(
+                    str(record.get(name)) != value
+                    for name, value in self.fields.items()
+                ):
+                    continue
+            if grep is not None and grep not in line:
+                continue
+            yield line
+
+
+@dataclass
+class Stats:
+    files: int = 0
+    segments_read: int = 0
+    segments_skipped: int = 0
+    unindexed: list[Path] = field(default_factory=list)
+    matches: int = 0
+
+
+def parse_time(value: str) -> float:
+    """Parses an ISO date/datetime or a relative duration (30d, 12h, 15m...) into a timestamp."""
+    if match := _relative_time.match(value):
+        amount, unit = match.groups()
+        return (datetime.now() - timedelta(**{_units[unit]: int(amount)})).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def log_files(logs_path: Path) -> list[Path]:
+    """Returns the archives and live log files, oldest first."""
+    files = [
+        path
+        for path in logs_path.rglob("*")
+        if path.is_file()
+        and not path.name.endswith((".idx", ".part"))
+        and (compression_of(path) is not None or path.suffix in (".log", ".jsonl"))
+    ]
+    return sorted(files, key=lambda path: path.stat().st_mtime)
+
+
+def search_file(path: Path, query: Query, stats: Stats) -> Iterator[bytes]:
+    stats.files += 1
+    if compression_of(path) is None:
+        # Live file, not compressed yet
+        with open(path, "rb") as source:
+            yield from query.lines(source)
+        return
+
+    segments = read_index(path)
+    if segments is None:
+        stats.unindexed.append(path)
+        yield from query.lines(iter_archive(path))
+        return
+
+    for segment in segments:
+        if not query.segment_may_match(segment):
+            stats.segments_skipped += 1
+            continue
+        stats.segments_read += 1
+        yield from query.lines(read_segment(path, segment))
+
+
+def command_search(args: argparse.Namespace) -> int:
+    query = Query(
+        since=parse_time(args.since) if args.since else None,
+        until=parse_time(args.until) if args.until else None,
+        fields={
+            name: str(value)
+            for name in indexed_fields
+            if (value := getattr(args, name)) is not None
+        },
+        grep=args.grep,
+    )
+    stats = Stats()
+    started = time.perf_counter()
+    output = sys.stdout.buffer
+    for path in log_files(args.logs):
+        for line in search_file(path, query, stats):
+            stats.matches += 1
+            output.write(line if line.endswith(b"\n") else line + b"\n")
+            if args.limit is not None and stats.matches >= args.limit:
+                break
+        else:
+            continue
+        break
+    output.flush()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"{stats.matches} matches in {stats.files} files "
+        f"({stats.segments_read} segments read, {stats.segments_skipped} skipped) in {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    if stats.unindexed:
+        print(
+            f"{len(stats.unindexed)} archives have no index and were fully scanned, "
+            f"run `python -m tools.logsearch index` to index them",
+            file=sys.stderr,
+        )
+    return 0 if stats.matches else 1
+
+
+def command_index(args: argparse.Namespace) -> int:
+    for path in log_files(args.logs):
+        if compression_of(path) is None:
+            continue
+        if index_path(path).exists() and not args.force:
+            continue
+        started = time.perf_counter()
+        segments = reindex(path)
+        print(
+            f"Indexed {path} ({len(segments)} segments) in {time.perf_counter() - started:.2f}s",
+            file=sys.stderr,
+        )
+    return 0
+
+
+def setup_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Search the ZORS bot logs.")
+    parser.add_argument(
+        "--logs",
+        type=Path,
+        default=Path("logs/"),
+        help="Log directory (default: logs/)",
+    )
+    subparser = parser.add_subparsers(dest="action", required=True)
+
+    index_cmd = subparser.add_parser(
+        "index", help="Index rotated archives written before indexing existed."
+    )
+    index_cmd.add_argument(
+        "--force", action="store_true", help="Rebuild existing indexes"
+    )
+    index_cmd.set_defaults(handler=command_index)
+
+    search_cmd = subparser.add_parser("search", help="Print the matching log lines.")
+    search_cmd.add_argument(
+        "--since", help="ISO date/datetime or relative (30d, 12h...)"
+    )
+    search_cmd.add_argument(
+        "--until", help="ISO date/datetime or relative (30d, 12h...)"
+    )
+    search_cmd.add_argument("--level", help="Exact level name (JSON logs only)")
+    search_cmd.add_argument("--cog", help="Cog name (JSON logs only)")
+    search_cmd.add_argument(
+        "--guild", dest="guild_id", help="Guild id (JSON logs only)"
+    )
+    search_cmd.add_argument(
+        "--member", dest="member_id", help="Member id (JSON logs only)"
+    )
+    search_cmd.add_argument(
+        "--slash-command", dest="command", help="Slash command name (JSON logs only)"
+    )
+    search_cmd.add_argument("--grep", help="Substring the line must contain")
+    search_cmd.add_argument("--limit", type=int, help="Stop after N matches")
+    search_cmd.set_defaults(handler=command_search)
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = setup_parser().parse_args()
+    sys.exit(arguments.handler(arguments))
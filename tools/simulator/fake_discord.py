@@ -0,0 +1,685 @@
+"""
+In-process stand-in for Discord: one guild, a fake gateway and a fake REST API.
+
+The gateway feeds payloads straight to the py-cord parsers (READY, GUILD_CREATE, then
+whatever the storms and the REST side effects emit), like the websocket would.
+The REST layer answers the routes the cogs use after a random latency, applies per-route
+rate limit buckets (requests wait for the bucket reset, like py-cord does) and emits the gateway
+events Discord would send back (moving a member sends a VOICE_STATE_UPDATE...).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import random
+import re
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from time import perf_counter
+from typing import Any
+
+import discord
+from discord.http import Route
+from discord.state import ConnectionState
+from discord.webhook.async_ import AsyncWebhookAdapter
+from loguru import logger as log
+
+_route_parameter = re.compile(r"\\\{(\w+)\\\}")
+
+# Channel types of the Discord API
+_text, _voice, _category, _forum = 0, 2, 4, 15
+
+# Default buckets, close to what Discord answers for a bot on a single guild
+default_buckets = {
+    "POST /guilds/{guild_id}/channels": "5/5",
+    "DELETE /channels/{channel_id}": "5/5",
+    "PATCH /guilds/{guild_id}/members/{user_id}": "10/10",
+    "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": "10/10",
+    "DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}": "10/10",
+    "POST /guilds/{guild_id}/roles": "250/172800",
+    "PATCH /guilds/{guild_id}/roles": "10/10",
+}
+global_limit = "50/1"
+
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+def _colors(color: int) -> dict[str, int | None]:
+    return {"primary_color": color, "secondary_color": None, "tertiary_color": None}
+
+
+class _Response:
+    """What discord.HTTPException reads from an aiohttp response."""
+
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+@dataclass
+class RateLimit:
+    limit: int
+    per: float
+
+    @classmethod
+    def parse(cls, value: str) -> RateLimit:
+        """ "5/10" is 5 requests every 10 seconds."""
+        limit, per = value.split("/")
+        return cls(int(limit), float(per))
+
+
+@dataclass
+class _Bucket:
+    rate: RateLimit
+    remaining: int = 0
+    reset_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def acquire(self) -> float:
+        """Takes a request from the bucket, returns how long to wait when it is empty."""
+        now = perf_counter()
+        if now >= self.reset_at:
+            self.remaining = self.rate.limit
+            self.reset_at = now + self.rate.per
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0.0
+        return self.reset_at - now
+
+
+@dataclass
+class RestStats:
+    calls: Counter[str] = field(default_factory=Counter)
+    ratelimited: Counter[str] = field(default_factory=Counter)
+    # Seconds, by route
+    waited: defaultdict[str, float] = field(default_factory=lambda: defaultdict(float))
+    unhandled: Counter[str] = field(default_factory=Counter)
+
+    def clear(self) -> None:
+        for counter in (self.calls, self.ratelimited, self.waited, self.unhandled):
+            counter.clear()
+
+
+@dataclass
+class _Handler:
+    method: str
+    pattern: re.Pattern[str]
+    template: str
+    call: Callable[..., Any]
+
+
+class FakeDiscord:
+    """
+    World state of the simulated guild and the fake gateway and REST API over it.
+    Payloads are kept as the raw dicts Discord would send, py-cord builds its own objects.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        latency: float = 0.08,
+        jitter: float = 0.03,
+        buckets: dict[str, str] | None = None,
+    ):
+        """
+        Args:
+            seed: Seed of the random latencies and of the storms.
+            latency: Mean latency of a REST call, in seconds.
+            jitter: Standard deviation of the latency, in seconds.
+            buckets: Rate limits by "METHOD /route/{template}", as "requests/seconds".
+        """
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = {
+            route: RateLimit.parse(value)
+            for route, value in (buckets or default_buckets).items()
+        }
+        self._global = _Bucket(RateLimit.parse(global_limit))
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+        self.rest = RestStats()
+        self.events: asyncio.Queue[tuple[str, dict[str, Any]]] = asyncio.Queue()
+        self.dispatched: Counter[str] = Counter()
+        self._closed = asyncio.Event()
+
+        self._ids = itertools.count(discord.utils.time_snowflake(datetime.now(UTC)))
+        self.application_id = self.snowflake()
+        self.guild_id = self.snowflake()
+        self.roles: dict[int, dict[str, Any]] = {}
+        self.channels: dict[int, dict[str, Any]] = {}
+        self.members: dict[int, dict[str, Any]] = {}
+        self.voice: dict[int, int] = {}
+        # Called with ("channel" | "role", payload) when the REST API creates something
+        self.on_create: Callable[[str, dict[str, Any]], None] | None = None
+
+        self.everyone = self.add_role("@everyone", position=0, id=self.guild_id)
+        self.bot_user = self._user(self.application_id, "ZORS", bot=True)
+        self.members[self.application_id] = self._member(self.bot_user)
+        self._handlers = self._routes()
+
+    def snowflake(self) -> int:
+        # Spaced out so that consecutive ids don't collide on the worker/increment bits
+        return next(self._ids) + (1 << 22) * self.rng.randrange(1, 4)
+
+    # region world
+    def add_role(
+        self, name: str, position: int = 1, color: int = 0, **fields: Any
+    ) -> int:
+        role_id = fields.pop("id", None) or self.snowflake()
+        self.roles[role_id] = {
+            "id": str(role_id),
+            "name": name,
+            "permissions": "0",
+            "position": position,
+            "color": color,
+            "colors": _colors(color),
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+            "flags": 0,
+            **fields,
+        }
+        return role_id
+
+    def add_channel(
+        self, name: str, type: int, parent_id: int | None = None, **fields: Any
+    ) -> int:
+        channel_id = fields.pop("id", None) or self.snowflake()
+        self.channels[channel_id] = {
+            "id": str(channel_id),
+            "guild_id": str(self.guild_id),
+            "type": type,
+            "name": name,
+            "position": len(self.channels),
+            "parent_id": str(parent_id) if parent_id else None,
+            "permission_overwrites": [],
+            "nsfw": False,
+            "rate_limit_per_user": 0,
+            "bitrate": 64000,
+            "user_limit": 0,
+            "flags": 0,
+            **fields,
+        }
+        return channel_id
+
+    def add_game(self, name: str, parent_position: int) -> dict[str, int]:
+        """The structure /add_game creates: a category with a forum, a chat and a "➕Add Party" hub."""
+        category = self.add_channel(f"> {name}", _category, position=parent_position)
+        return {
+            "category": category,
+            "forum": self.add_channel("Forum", _forum, category),
+            "text": self.add_channel("Chat", _text, category),
+            "voice": self.add_channel("➕Add Party", _voice, category),
+            "role": self.add_role(name, mentionable=True),
+        }
+
+    @staticmethod
+    def _user(user_id: int, name: str, bot: bool = False) -> dict[str, Any]:
+        return {
+            "id": str(user_id),
+            "username": name,
+            "global_name": name,
+            "discriminator": "0",
+            "avatar": None,
+            "bot": bot,
+        }
+
+    @staticmethod
+    def _member(user: dict[str, Any], roles: list[int] | None = None) -> dict[str, Any]:
+        return {
+            "user": user,
+            "roles": [str(role) for role in roles or ()],
+            "joined_at": _iso(datetime.now(UTC)),
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+        }
+
+    def new_member(
+        self,
+        roles: list[int] | None = None,
+        user_id: int | None = None,
+        name: str | None = None,
+    ) -> int:
+        user_id = user_id or self.snowflake()
+        user = self._user(user_id, name or f"membre{len(self.members)}")
+        self.members[user_id] = self._member(user, roles)
+        return user_id
+
+    def load_structure(self, guild: dict[str, Any]) -> None:
+        """Replaces the guild with a recorded one: ids, channels, roles and voice states."""
+        self.guild_id = int(guild["id"])
+        self.roles.clear()
+        self.channels.clear()
+        for role in guild["roles"]:
+            self.add_role(
+                role["name"], role["position"], role["color"] or 0, id=int(role["id"])
+            )
+        self.everyone = self.guild_id
+        for channel in guild["channels"]:
+            parent_id = channel["parent_id"]
+            self.add_channel(
+                channel["name"],
+                channel["type"],
+                int(parent_id) if parent_id else None,
+                id=int(channel["id"]),
+                position=channel["position"],
+            )
+        for state in guild["voice_states"]:
+            user_id = int(state["user_id"])
+            if user_id not in self.members:
+                self.new_member(user_id=user_id)
+            self.voice[user_id] = int(state["channel_id"])
+
+    def _voice_state(self, user_id: int) -> dict[str, Any]:
+        channel_id = self.voice.get(user_id)
+        return {
+            "guild_id": str(self.guild_id),
+            "channel_id": str(channel_id) if channel_id else None,
+            "user_id": str(user_id),
+            "member": self.members[user_id],
+            "session_id": f"session-{user_id}",
+            "deaf": False,
+            "mute": False,
+            "self_deaf": False,
+            "self_mute": False,
+            "self_video": False,
+            "suppress": False,
+            "request_to_speak_timestamp": None,
+        }
+
+    def guild_payload(self) -> dict[str, Any]:
+        return {
+            "id": str(self.guild_id),
+            "name": "ZORS (simulation)",
+            "owner_id": str(self.application_id),
+            "unavailable": False,
+            "member_count": len(self.members),
+            "large": len(self.members) > 250,
+            "features": [],
+            "emojis": [],
+            "stickers": [],
+            "roles": list(self.roles.values()),
+            "channels": list(self.channels.values()),
+            "members": list(self.members.values()),
+            "voice_states": [self._voice_state(user) for user in self.voice],
+            "threads": [],
+            "presences": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "premium_tier": 0,
+            "preferred_locale": "fr",
+        }
+
+    def message_payload(self, channel_id: int, content: str | None) -> dict[str, Any]:
+        return {
+            "id": str(self.snowflake()),
+            "channel_id": str(channel_id),
+            "guild_id": str(self.guild_id),
+            "author": self.bot_user,
+            "content": content or "",
+            "timestamp": _iso(datetime.now(UTC)),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+            "flags": 0,
+        }
+
+    # endregion
+
+    # region gateway
+    def emit(self, event: str, data: dict[str, Any]) -> None:
+        self.events.put_nowait((event, data))
+
+    async def run_gateway(self, state: ConnectionState) -> None:
+        """READY and GUILD_CREATE, then every emitted event until close()."""
+        state.parsers["READY"](
+            {
+                "v": 10,
+                "user": self.bot_user,
+                "guilds": [{"id": str(self.guild_id), "unavailable": True}],
+                "session_id": "simulation",
+                "application": {"id": str(self.application_id), "flags": 0},
+            }
+        )
+        state.parsers["GUILD_CREATE"](self.guild_payload())
+        consumer = asyncio.create_task(self._consume(state), name="simulator: gateway")
+        await self._closed.wait()
+        consumer.cancel()
+
+    async def _consume(self, state: ConnectionState) -> None:
+        while True:
+            event, data = await self.events.get()
+            self.dispatched[event] += 1
+            try:
+                state.parsers[event](data)
+            except Exception as e:  # noqa: BLE001 - a bad payload must not stop the gateway
+                log.opt(exception=e).error(f"Simulated gateway failed to parse {event}")
+            finally:
+                self.events.task_done()
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def user_voice(self, user_id: int, channel_id: int | None) -> None:
+        """A member joins, switches or leaves a voice channel."""
+        if channel_id is None:
+            self.voice.pop(user_id, None)
+        else:
+            self.voice[user_id] = channel_id
+        self.emit("VOICE_STATE_UPDATE", self._voice_state(user_id))
+
+    def member_roles(
+        self, user_id: int, add: int | None = None, remove: int | None = None
+    ) -> None:
+        member = self.members[user_id]
+        roles = [role for role in member["roles"] if role != str(remove)]
+        if add is not None and str(add) not in roles:
+            roles.append(str(add))
+        member["roles"] = roles
+        self.emit("GUILD_MEMBER_UPDATE", {"guild_id": str(self.guild_id), **member})
+
+    def set_member_roles(self, user_id: int, roles: list[int]) -> None:
+        self.members[user_id]["roles"] = [str(role) for role in roles]
+        self.emit(
+            "GUILD_MEMBER_UPDATE",
+            {"guild_id": str(self.guild_id), **self.members[user_id]},
+        )
+
+    def member_join(
+        self,
+        roles: list[int] | None = None,
+        user_id: int | None = None,
+        name: str | None = None,
+    ) -> int:
+        user_id = self.new_member(roles, user_id, name)
+        self.emit(
+            "GUILD_MEMBER_ADD",
+            {"guild_id": str(self.guild_id), **self.members[user_id]},
+        )
+        return user_id
+
+    def member_leave(self, user_id: int) -> None:
+        self.voice.pop(user_id, None)
+        member = self.members.pop(user_id)
+        self.emit(
+            "GUILD_MEMBER_REMOVE",
+            {"guild_id": str(self.guild_id), "user": member["user"]},
+        )
+
+    def interaction(
+        self,
+        user_id: int,
+        command: str,
+        options: dict[str, Any] | list[dict[str, Any]] | None = None,
+    ) -> None:
+        """
+        A member runs a slash command, answered through the fake webhook adapter.
+        Options are {name: string value}, or the option payloads as Discord sends them.
+        """
+        if isinstance(options, dict):
+            options = [
+                {"name": name, "type": 3, "value": value}
+                for name, value in options.items()
+            ]
+        interaction_id = self.snowflake()
+        channel_id = next(
+            int(channel["id"])
+            for channel in self.channels.values()
+            if channel["type"] == _text
+        )
+        self.emit(
+            "INTERACTION_CREATE",
+            {
+                "id": str(interaction_id),
+                "application_id": str(self.application_id),
+                "type": 2,
+                "token": f"simulated-{interaction_id}",
+                "version": 1,
+                "guild_id": str(self.guild_id),
+                "channel_id": str(channel_id),
+                "channel": self.channels[channel_id],
+                "member": {**self.members[user_id], "permissions": "0"},
+                "locale": "fr",
+                "guild_locale": "fr",
+                "app_permissions": "0",
+                # Unknown command id: py-cord falls back on the name
+                "data": {
+                    "id": str(self.snowflake()),
+                    "name": command,
+                    "type": 1,
+                    "options": options or [],
+                },
+            },
+        )
+
+    # endregion
+
+    # region REST
+    async def request(self, route: Route, **kwargs: Any) -> Any:
+        """Drop-in replacement of HTTPClient.request."""
+        handler, match = self._resolve(route)
+        key = f"{route.method} {handler.template if handler else route.path}"
+        self.rest.calls[key] += 1
+        await self._ratelimit(route, key)
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if handler is None or match is None:
+            if not self.rest.unhandled[key]:
+                log.warning(f"Simulated REST has no handler for {key}")
+            self.rest.unhandled[key] += 1
+            return None
+        return handler.call(**match.groupdict(), payload=kwargs.get("json") or {})
+
+    async def _ratelimit(self, route: Route, key: str) -> None:
+        rate = self.rate_limits.get(key)
+        if rate is not None:
+            bucket = self._buckets.setdefault(
+                (route.method, route.bucket), _Bucket(rate)
+            )
+            # py-cord serializes the requests of a bucket and sleeps until the reset
+            # once the headers say it is exhausted, instead of taking 429s
+            async with bucket.lock:
+                await self._wait(bucket, key)
+        await self._wait(self._global, key)
+
+    async def _wait(self, bucket: _Bucket, key: str) -> None:
+        while (wait := bucket.acquire()) > 0:
+            self.rest.ratelimited[key] += 1
+            self.rest.waited[key] += wait
+            await asyncio.sleep(wait)
+
+    def _resolve(self, route: Route) -> tuple[_Handler | None, re.Match[str] | None]:
+        path = route.url.removeprefix(route.base).split("?", 1)[0]
+        for handler in self._handlers:
+            if handler.method == route.method and (
+                match := handler.pattern.fullmatch(path)
+            ):
+                return handler, match
+        return None, None
+
+    def _routes(self) -> list[_Handler]:
+        routes = {
+            "GET /users/@me": lambda payload: self.bot_user,
+            "GET /soundboard-default-sounds": lambda payload: [],
+            "POST /guilds/{guild_id}/channels": self._create_channel,
+            "PATCH /guilds/{guild_id}/channels": lambda guild_id, payload: None,
+            "DELETE /channels/{channel_id}": self._delete_channel,
+            "PUT /channels/{channel_id}/permissions/{target}": lambda payload, **_: (
+                None
+            ),
+            "PATCH /guilds/{guild_id}/members/{user_id}": self._edit_member,
+            "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": self._add_member_role,
+            "DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}": self._remove_member_role,
+            "POST /guilds/{guild_id}/roles": self._create_role,
+            "PATCH /guilds/{guild_id}/roles": self._move_roles,
+            "PATCH /guilds/{guild_id}/roles/{role_id}": self._edit_role,
+            "DELETE /guilds/{guild_id}/roles/{role_id}": self._delete_role,
+            # Interaction responses, through FakeWebhookAdapter
+            "POST /interactions/{interaction_id}/{token}/callback": self._interaction_callback,
+            "POST /webhooks/{application_id}/{token}": self._followup,
+            "GET /webhooks/{application_id}/{token}/messages/{message_id}": self._followup,
+            "PATCH /webhooks/{application_id}/{token}/messages/{message_id}": self._followup,
+            "DELETE /webhooks/{application_id}/{token}/messages/{message_id}": lambda payload, **_: (
+                None
+            ),
+        }
+        handlers = []
+        for route, call in routes.items():
+            method, template = route.split(" ", 1)
+            pattern = _route_parameter.sub(r"(?P<\1>[^/]+)", re.escape(template))
+            handlers.append(_Handler(method, re.compile(pattern), template, call))
+        return handlers
+
+    def _not_found(self, what: str) -> discord.NotFound:
+        return discord.NotFound(_Response(404, "Not Found"), f"Unknown {what}")  # type: ignore[arg-type]
+
+    def _create_channel(self, guild_id: str, payload: dict[str, Any]) -> dict[str, Any]:
+        parent_id = payload.get("parent_id")
+        channel_id = self.add_channel(
+            payload["name"],
+            payload.get("type", _text),
+            int(parent_id) if parent_id else None,
+        )
+        if self.on_create is not None:
+            self.on_create("channel", self.channels[channel_id])
+        self.emit("CHANNEL_CREATE", self.channels[channel_id])
+        return self.channels[channel_id]
+
+    def _delete_channel(
+        self, channel_id: str, payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        channel = self.channels.pop(int(channel_id), None)
+        if channel is None:
+            raise self._not_found("Channel")
+        # Discord disconnects whoever is still in a deleted voice channel
+        for user_id, voice_channel in list(self.voice.items()):
+            if voice_channel == int(channel_id):
+                self.user_voice(user_id, None)
+        self.emit("CHANNEL_DELETE", channel)
+        return channel
+
+    def _edit_member(
+        self, guild_id: str, user_id: str, payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        member = self.members.get(int(user_id))
+        if member is None:
+            raise self._not_found("Member")
+        if "channel_id" in payload:
+            channel_id = payload["channel_id"]
+            self.user_voice(int(user_id), int(channel_id) if channel_id else None)
+        if "nick" in payload:
+            member["nick"] = payload["nick"]
+            self.emit("GUILD_MEMBER_UPDATE", {"guild_id": guild_id, **member})
+        return member
+
+    def _add_member_role(
+        self, guild_id: str, user_id: str, role_id: str, payload: dict[str, Any]
+    ) -> None:
+        if int(user_id) not in self.members:
+            raise self._not_found("Member")
+        self.member_roles(int(user_id), add=int(role_id))
+
+    def _remove_member_role(
+        self, guild_id: str, user_id: str, role_id: str, payload: dict[str, Any]
+    ) -> None:
+        if int(user_id) not in self.members:
+            raise self._not_found("Member")
+        self.member_roles(int(user_id), remove=int(role_id))
+
+    def _create_role(self, guild_id: str, payload: dict[str, Any]) -> dict[str, Any]:
+        role_id = self.add_role(
+            payload.get("name", "new role"),
+            color=payload.get("colors", {}).get("primary_color", 0),
+            mentionable=payload.get("mentionable", False),
+            hoist=payload.get("hoist", False),
+        )
+        if self.on_create is not None:
+            self.on_create("role", self.roles[role_id])
+        self.emit(
+            "GUILD_ROLE_CREATE", {"guild_id": guild_id, "role": self.roles[role_id]}
+        )
+        return self.roles[role_id]
+
+    def _move_roles(self, guild_id: str, payload: Any) -> list[dict[str, Any]]:
+        for position in payload or ():
+            role = self.roles.get(int(position["id"]))
+            if role is not None and role["position"] != position["position"]:
+                role["position"] = position["position"]
+                self.emit("GUILD_ROLE_UPDATE", {"guild_id": guild_id, "role": role})
+        return list(self.roles.values())
+
+    def _edit_role(
+        self, guild_id: str, role_id: str, payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        role = self.roles.get(int(role_id))
+        if role is None:
+            raise self._not_found("Role")
+        role.update(payload)
+        if "colors" in payload:
+            role["color"] = payload["colors"]["primary_color"]
+        self.emit("GUILD_ROLE_UPDATE", {"guild_id": guild_id, "role": role})
+        return role
+
+    def _delete_role(
+        self, guild_id: str, role_id: str, payload: dict[str, Any]
+    ) -> None:
+        if self.roles.pop(int(role_id), None) is None:
+            raise self._not_found("Role")
+        for member in self.members.values():
+            if role_id in member["roles"]:
+                member["roles"].remove(role_id)
+        self.emit("GUILD_ROLE_DELETE", {"guild_id": guild_id, "role_id": role_id})
+
+    def _interaction_callback(
+        self, interaction_id: str, token: str, payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        return {
+            "interaction": {
+                "id": interaction_id,
+                "type": 2,
+                # 5 is a deferred response
+                "response_message_loading": payload.get("type") == 5,
+                "response_message_ephemeral": bool(
+                    payload.get("data", {}).get("flags", 0) & 64
+                ),
+            }
+        }
+
+    def _followup(self, payload: dict[str, Any], **_: str) -> dict[str, Any]:
+        channel_id = next(iter(self.channels))
+        return self.message_payload(channel_id, payload.get("content"))
+
+    # endregion
+
+
+class FakeWebhookAdapter(AsyncWebhookAdapter):
+    """Interaction responses and followups go through webhooks, not HTTPClient.request."""
+
+    def __init__(self, discord: FakeDiscord):
+        super().__init__()
+        self.discord = discord
+
+    async def request(self, route: Route, session: Any, **kwargs: Any) -> Any:  # type: ignore[override]
+        return await self.discord.request(
+            route, json=kwargs.get("payload") or _multipart_payload(kwargs)
+        )
+
+
+def _multipart_payload(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Responses with files are sent as multipart, the JSON is the payload_json part."""
+    for part in kwargs.get("multipart") or ():
+        if part.get("name") == "payload_json":
+            return json.loads(part["value"])
+    return {}
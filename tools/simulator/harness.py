@@ -0,0 +1,368 @@
+"""
+Runs the real ZORS against a FakeDiscord and measures what it does, for the simulator and
+the journal replay.
+
+The bot is the real one (cogs, managers, database, instrumentation), only the websocket and
+the REST client are replaced. Every listener and slash command run is timed, and a workload
+(a storm, a replayed journal) is reported with the REST calls and rate limits it caused.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Coroutine
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any
+
+from discord.webhook.async_ import async_context
+from loguru import logger as log
+from sqlmodel import SQLModel
+from typing_extensions import override
+
+from main import ZORS
+from model.database import Database
+from model.managers import GameCategoryManager
+from tools.simulator.fake_discord import FakeDiscord, FakeWebhookAdapter
+from utils.memory import CacheConfiguration
+from utils.settings import AppSettings, EnvSettings, RuntimeSettings, settings
+
+
+class SimulatedZORS(ZORS):
+    """ZORS wired to a FakeDiscord, timing every listener it runs."""
+
+    def __init__(self, fake: FakeDiscord, *args, **kwargs):
+        self.fake = fake
+        self.samples: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        super().__init__(*args, **kwargs)
+        self._time_jobs()
+
+    def _time_jobs(self) -> None:
+        """The listeners only queue the database work, time the jobs too."""
+        register = self.work.register
+
+        def timed_register(kind: str, handler, *args: Any, **kwargs: Any) -> None:
+            async def timed(*job_args: Any) -> None:
+                started = perf_counter()
+                try:
+                    await handler(*job_args)
+                finally:
+                    self.samples[f"work: {kind}"].append(perf_counter() - started)
+
+            register(kind, timed, *args, **kwargs)
+
+        self.work.register = timed_register  # type: ignore[method-assign]
+
+    @override
+    def _instrument_http(self) -> None:
+        # Replaced before ZORS wraps it, so the REST metrics and spans see the fake calls
+        self.http.request = self.fake.request  # type: ignore[method-assign]
+        super()._instrument_http()
+
+    @override
+    async def connect(self, *, reconnect: bool = True) -> None:
+        await self.fake.run_gateway(self._connection)
+
+    @override
+    async def _run_event(
+        self,
+        coro: Callable[..., Coroutine[Any, Any, Any]],
+        event_name: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        name = coro.__qualname__
+        if event_name == "on_interaction" and args and args[0].data:
+            name = f"/{args[0].data.get('name')}"
+        started = perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.samples[name].append(perf_counter() - started)
+
+    @override
+    async def on_error(self, event_method: str, *args: Any, **kwargs: Any) -> None:
+        # Counted for the report instead of printing every traceback on stderr
+        error = sys.exception()
+        self.errors[f"{event_method}: {type(error).__name__}"] += 1
+        log.opt(exception=error).debug(f"Error in {event_method}")
+
+    async def idle(self, quiet: float = 0.1) -> None:
+        """
+        Waits until the gateway is drained, no listener or queued job is running anymore
+        and the buffered membership changes are written.
+        """
+        while True:
+            await self.fake.events.join()
+            await asyncio.sleep(quiet)
+            if (
+                not self._tasks
+                and self.fake.events.empty()
+                and self.work.idle
+                and not self.memberships
+            ):
+                return
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.work.join()
+            if self.memberships is not None and not await self.memberships.flush():
+                # Logged by the buffer, retrying here would spin
+                return
+
+
+# region report
+@dataclass
+class Distribution:
+    count: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+    @classmethod
+    def of(cls, samples: list[float], duration: float) -> Distribution:
+        ordered = sorted(samples)
+
+        def percentile(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        return cls(
+            count=len(ordered),
+            throughput=len(ordered) / duration,
+            p50=percentile(0.5),
+            p95=percentile(0.95),
+            p99=percentile(0.99),
+            max=ordered[-1],
+        )
+
+
+@dataclass
+class StormReport:
+    storm: str
+    duration: float
+    events: dict[str, int]
+    handlers: dict[str, Distribution]
+    rest_calls: dict[str, int]
+    ratelimited: dict[str, int]
+    ratelimit_wait: dict[str, float]
+    errors: dict[str, int]
+    loop_stalls: int
+    slow_queries: int
+
+    def render(self) -> str:
+        events = sum(self.events.values())
+        lines = [
+            (
+                f"Storm {self.storm}: {events} gateway events in {self.duration:.1f}s "
+                f"({events / self.duration:.1f}/s), {self.loop_stalls} loop stalls, "
+                f"{self.slow_queries} slow queries"
+            ),
+            f"  {'handler':<36} {'count':>6} {'/s':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}",
+        ]
+        for name, stats in sorted(
+            self.handlers.items(), key=lambda item: item[1].count, reverse=True
+        ):
+            lines.append(
+                f"  {name:<36} {stats.count:>6} {stats.throughput:>7.1f}"
+                + "".join(
+                    f" {value * 1000:>6.1f} ms"
+                    for value in (stats.p50, stats.p95, stats.p99, stats.max)
+                )
+            )
+        lines.append(f"  {'REST route':<68} {'calls':>6} {'limited':>7} {'waited':>8}")
+        for route, calls in sorted(
+            self.rest_calls.items(), key=lambda item: item[1], reverse=True
+        ):
+            lines.append(
+                f"  {route:<68} {calls:>6} {self.ratelimited.get(route, 0):>7} "
+                f"{self.ratelimit_wait.get(route, 0.0):>7.1f}s"
+            )
+        lines.extend(
+            f"  error {error}: {count}" for error, count in self.errors.items()
+        )
+        return "\n".join(lines)
+
+
+# endregion
+
+
+# region setup
+def _bucket(value: str) -> tuple[str, str]:
+    route, _, rate = value.rpartition("=")
+    if not route or "/" not in rate:
+        raise argparse.ArgumentTypeError(
+            f"expected 'METHOD /route/{{param}}=requests/seconds', got {value!r}"
+        )
+    return route, rate
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options of the database, the fake Discord and the report, shared by the tools."""
+    parser.add_argument(
+        "--database-url",
+        required=True,
+        help="SQLAlchemy async URL of a scratch database: a local PostgreSQL, or a "
+        "SQLite file (sqlite+aiosqlite:////tmp/zors.db).",
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Drop all tables before starting."
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.08, help="Mean REST latency, in seconds."
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.03, help="REST latency deviation, in seconds."
+    )
+    parser.add_argument(
+        "--bucket",
+        type=_bucket,
+        action="append",
+        default=[],
+        help="Override a rate limit: 'METHOD /route/{param}=requests/seconds'.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--log-level", default="WARNING", help="Bot log level on stderr."
+    )
+    parser.add_argument(
+        "--json", type=Path, help="Also write the report to this JSON file."
+    )
+
+
+def use_settings(runtime: RuntimeSettings) -> None:
+    """Replaces the settings with the simulated guild's, no config.yaml or .env needed."""
+    settings.use(
+        AppSettings(
+            env=EnvSettings(
+                _env_file=None,  # type: ignore[call-arg]
+                discord_token="simulation",  # type: ignore[arg-type]
+                postgres_password="simulation",  # type: ignore[arg-type]
+                postgres_user="simulation",
+                postgres_db="simulation",
+                postgres_host="localhost",
+                postgres_port=5432,
+            ),
+            runtime=runtime,
+        )
+    )
+
+
+async def seed_games(database: Database, games: list[dict[str, Any]]) -> None:
+    """The game categories /add_game would have registered."""
+    async with database.get_session() as session:
+        for game in games:
+            await GameCategoryManager.add(
+                session,
+                int(game["id"]),
+                game["name"],
+                int(game["forum_id"]),
+                int(game["text_id"]),
+                int(game["voice_id"]),
+                int(game["role_id"]),
+            )
+
+
+async def create_bot(fake: FakeDiscord, database: Database) -> SimulatedZORS:
+    caches = CacheConfiguration.from_cogs(
+        ZORS._cog_classes(),
+        settings.runtime.memory.budget_mb,
+        settings.runtime.memory.max_messages,
+    )
+    bot = SimulatedZORS(
+        fake,
+        database=database,
+        intents=caches.intents,
+        member_cache_flags=caches.member_cache_flags,
+        max_messages=caches.max_messages,
+        help_command=None,
+        auto_sync_commands=False,
+        chunk_guilds_at_startup=False,
+        guild_ready_timeout=0.1,
+    )
+    bot._load_cogs()
+    return bot
+
+
+@asynccontextmanager
+async def running_bot(
+    fake: FakeDiscord,
+    database_url: str,
+    games: list[dict[str, Any]],
+    reset: bool = False,
+) -> AsyncIterator[tuple[SimulatedZORS, Database]]:
+    """
+    Starts the bot on the fake guild once the settings are in place (see use_settings),
+    with the given games registered in the database, and stops it on exit.
+    """
+    database = Database(database_url, settings.runtime.database)
+    if reset:
+        async with database.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+    await database.create_db_and_tables()
+    await seed_games(database, games)
+
+    # Interaction responses are sent through the webhook adapter of the current context
+    async_context.set(FakeWebhookAdapter(fake))
+    bot = await create_bot(fake, database)
+    runner = asyncio.create_task(bot.start(), name="simulator: bot")
+    ready = asyncio.create_task(bot.wait_until_ready())
+    await asyncio.wait((runner, ready), return_when=asyncio.FIRST_COMPLETED)
+    if runner.done():
+        # The bot died during the startup, raise its error
+        ready.cancel()
+        await runner
+    await bot.idle()
+    log.info(f"Simulated guild ready: {len(fake.members)} members, {len(games)} games")
+    try:
+        yield bot, database
+    finally:
+        fake.close()
+        await bot.close()
+        await runner
+        await database.engine.dispose()
+
+
+async def measure(
+    name: str, bot: SimulatedZORS, database: Database, workload: Awaitable[None]
+) -> StormReport:
+    """Runs a workload until the bot is idle again and reports what it did."""
+    fake = bot.fake
+    bot.samples.clear()
+    bot.errors.clear()
+    fake.rest.clear()
+    fake.dispatched.clear()
+    stalls_before = len(bot.watchdog.recent_stalls) if bot.watchdog else 0
+    since = time()
+    log.info(f"Storm {name} starting")
+    started = perf_counter()
+    await workload
+    await bot.idle()
+    duration = perf_counter() - started
+    return StormReport(
+        storm=name,
+        duration=duration,
+        events=dict(fake.dispatched),
+        handlers={
+            handler: Distribution.of(samples, duration)
+            for handler, samples in bot.samples.items()
+        },
+        rest_calls=dict(fake.rest.calls),
+        ratelimited=dict(fake.rest.ratelimited),
+        ratelimit_wait=dict(fake.rest.waited),
+        errors=dict(bot.errors),
+        loop_stalls=(
+            len(bot.watchdog.recent_stalls) - stalls_before if bot.watchdog else 0
+        ),
+        slow_queries=sum(
+            1 for query in database.queries.slow_queries if query.at >= since
+        ),
+    )
+
+
+# endregion
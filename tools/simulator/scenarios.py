@@ -0,0 +1,186 @@
+"""
+The simulated guild and the synthetic storms replayed against it.
+
+Each storm drives members through the fake gateway at a given rate, the way an evening peak
+looks from the bot: voice channel hopping between the "➕Add Party" hubs, mass habitue role
+grants, join/leave waves and slash commands.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from collections.abc import Awaitable, Callable, Coroutine, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+import discord
+
+from tools.simulator.fake_discord import FakeDiscord
+from utils.settings import (
+    ChannelsStructure,
+    DiscordStructure,
+    Placement,
+    Role,
+    RolePlacement,
+    Roles,
+    RolesStructure,
+    RuntimeSettings,
+)
+
+
+@dataclass(frozen=True)
+class StormOptions:
+    members: int
+    rate: float
+    dwell: float
+    hops: int
+
+
+@dataclass(frozen=True)
+class Guild:
+    """Ids of the simulated structure the storms act on."""
+
+    members: list[int]
+    hubs: list[int]
+    games: list[int]
+    habitue_role: int
+
+
+def build_guild(
+    fake: FakeDiscord, members: int, games: int
+) -> tuple[Guild, RuntimeSettings, list[dict[str, Any]]]:
+    """
+    Generates the guild structure the cogs expect, the matching config and the game
+    categories /add_game would have registered.
+    """
+    gamer = fake.add_role("Gamer", position=2)
+    habitue = fake.add_role("Les Habitués", position=3)
+    access_separator = fake.add_role("── Jeux ──", position=4)
+    colors_separator = fake.add_role("── Couleurs ──", position=5)
+    fake.add_channel("général", discord.ChannelType.text.value)
+    games_root = fake.add_channel("Jeux", discord.ChannelType.category.value)
+    structures = [
+        fake.add_game(f"Jeu {index}", parent_position=index + 2)
+        for index in range(games)
+    ]
+    member_ids = [fake.new_member([gamer]) for _ in range(members)]
+
+    guild = Guild(
+        members=member_ids,
+        hubs=[structure["voice"] for structure in structures],
+        games=[structure["category"] for structure in structures],
+        habitue_role=habitue,
+    )
+    runtime = RuntimeSettings(
+        main_guild=fake.guild_id,
+        roles=Roles(lesHabitues=Role(id=habitue), gamer=Role(id=gamer)),
+        discord_structure=DiscordStructure(
+            channels=ChannelsStructure(games_root_category_id=games_root),
+            roles=RolesStructure(
+                access_separator_id=access_separator,
+                habitue_colors_separator_id=colors_separator,
+            ),
+        ),
+        role_placement=RolePlacement(
+            game_roles=Placement(anchor_id=access_separator),
+            habitue_color_roles=Placement(anchor_id=colors_separator),
+        ),
+        log_enqueue=False,
+    )
+    registered = [
+        {
+            "id": structure["category"],
+            "name": f"Jeu {index} ({structure['category']})",
+            "forum_id": structure["forum"],
+            "text_id": structure["text"],
+            "voice_id": structure["voice"],
+            "role_id": structure["role"],
+        }
+        for index, structure in enumerate(structures)
+    ]
+    return guild, runtime, registered
+
+
+type Storm = Callable[
+    [FakeDiscord, Guild, StormOptions, random.Random], Awaitable[None]
+]
+
+
+async def _paced[T](
+    items: Iterable[T],
+    rate: float,
+    action: Callable[[T], Coroutine[Any, Any, None]],
+) -> None:
+    """Starts one action per item at `rate` per second, returns once all are done."""
+    tasks = []
+    for item in items:
+        tasks.append(asyncio.create_task(action(item)))
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+
+
+def _dwell(options: StormOptions, rng: random.Random) -> float:
+    return rng.uniform(options.dwell / 2, options.dwell * 1.5)
+
+
+async def party(
+    fake: FakeDiscord, guild: Guild, options: StormOptions, rng: random.Random
+) -> None:
+    """Members hop between the "➕Add Party" hubs, then disconnect."""
+
+    async def hop(member: int) -> None:
+        for _ in range(options.hops):
+            fake.user_voice(member, rng.choice(guild.hubs))
+            await asyncio.sleep(_dwell(options, rng))
+        fake.user_voice(member, None)
+
+    await _paced(rng.sample(guild.members, options.members), options.rate, hop)
+
+
+async def habitue(
+    fake: FakeDiscord, guild: Guild, options: StormOptions, rng: random.Random
+) -> None:
+    """Mass grant of the habitue role, each one creates and places a color role."""
+
+    async def grant(member: int) -> None:
+        fake.member_roles(member, add=guild.habitue_role)
+
+    await _paced(rng.sample(guild.members, options.members), options.rate, grant)
+
+
+async def churn(
+    fake: FakeDiscord, guild: Guild, options: StormOptions, rng: random.Random
+) -> None:
+    """A wave of new members joining the guild and leaving shortly after."""
+
+    async def visit(_: int) -> None:
+        member = fake.member_join()
+        await asyncio.sleep(_dwell(options, rng))
+        fake.member_leave(member)
+
+    await _paced(range(options.members), options.rate, visit)
+
+
+async def commands(
+    fake: FakeDiscord, guild: Guild, options: StormOptions, rng: random.Random
+) -> None:
+    """/ping, /join_game and /leave_game from random members."""
+
+    async def run(member: int) -> None:
+        game = str(rng.choice(guild.games))
+        for _ in range(options.hops):
+            fake.interaction(member, "ping")
+            fake.interaction(member, "join_game", {"game": game})
+            await asyncio.sleep(_dwell(options, rng))
+            fake.interaction(member, "leave_game", {"game": game})
+
+    await _paced(rng.sample(guild.members, options.members), options.rate, run)
+
+
+storms: dict[str, Storm] = {
+    "party": party,
+    "habitue": habitue,
+    "churn": churn,
+    "commands": commands,
+}
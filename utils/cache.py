@@ -0,0 +1,73 @@
+"""
+Bounded in-memory cache: least recently used entries are evicted past `max_size`, entries
+older than `ttl` seconds are treated as missing. Lookups are counted in the shared
+zors_cache_requests_total metric under the name of the cache.
+
+A read-through caller takes the `generation` before reading the value and gives it back to
+`put`: the value is dropped if its key was invalidated meanwhile, it may predate the write
+that invalidated it. The generations of the last `max_size` invalidated keys are kept, older
+ones are only known as a floor, which may drop a value that was still fresh.
+"""
+
+from collections import OrderedDict
+from time import monotonic
+
+from utils.metrics import cache_requests
+
+
+class LRUCache[K, V]:
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        # Bumped by every invalidation, the generation of the last one of each key
+        self._generation = 0
+        self._invalidated: OrderedDict[K, int] = OrderedDict()
+        # Latest invalidation forgotten or covering every key (clear)
+        self._floor = 0
+        self._hits = cache_requests.labels(name, "hit")
+        self._misses = cache_requests.labels(name, "miss")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return entry[1]
+
+    def generation(self) -> int:
+        """To give to `put`, taken before reading the value from its source."""
+        return self._generation
+
+    def put(self, key: K, value: V, generation: int | None = None) -> None:
+        """Caches `value`, unless `key` was invalidated since `generation`."""
+        if generation is not None and generation < max(
+            self._floor, self._invalidated.get(key, 0)
+        ):
+            return
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+        self._generation += 1
+        self._invalidated[key] = self._generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
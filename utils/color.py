@@ -2,6 +2,12 @@ from typing import Tuple
 from httpx import TimeoutException, AsyncClient
 import re
 
+from utils.singleflight import SingleFlight
+from utils.tracing import tracer
+
+# Several habitues picking the same color at once ask the API only once
+_lookups: SingleFlight[str] = SingleFlight("color_name")
+
 
 class Color:
     @classmethod
@@ -14,15 +20,25 @@ class Color:
         """
         if not all(0 <= c <= 255 for c in color):
             raise ValueError(f"{color} is not a valid RGB color")
+        name, _ = await _lookups.do(tuple(color), lambda: cls._lookup(color))
+        return name
+
+    @classmethod
+    async def _lookup(cls, color: Tuple[int, int, int]) -> str:
         api_url = f"https://www.thecolorapi.com/id?rgb=({color[0]},{color[1]},{color[2]})&format=json"
-        try:
-            async with AsyncClient() as client:
-                response = await client.get(api_url, timeout=5)
-            if not response.is_success:
-                return "Unknown"
-            return response.json()["name"]["value"]
-        except TimeoutException:
-            return cls.to_hexstring(color)
+        with tracer.span("color.lookup", rgb=cls.to_hexstring(color)) as span:
+            try:
+                async with AsyncClient() as client:
+                    response = await client.get(api_url, timeout=5)
+                if span is not None:
+                    span.set(**{"http.status": response.status_code})
+                if not response.is_success:
+                    return "Unknown"
+                return response.json()["name"]["value"]
+            except TimeoutException:
+                if span is not None:
+                    span.set(timeout=True)
+                return cls.to_hexstring(color)
 
     @classmethod
     def to_hexstring(cls, color: Tuple[int, int, int]) -> str:
@@ -0,0 +1,100 @@
+"""
+Compact set of Discord ids.
+
+The ids are kept in a sorted array of signed 64-bit integers, 8 bytes each (a Python int in a
+set costs about 60), and looked up by bisection. Changes go to two small buffers first, the
+array is rebuilt once they hold `buffer` ids: a long run of single additions doesn't move the
+whole array every time.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from itertools import chain
+from sys import getsizeof
+
+
+class IdSet:
+    def __init__(self, ids: Iterable[int] = (), buffer: int = 1024):
+        """
+        Args:
+            ids: Initial ids, in any order, duplicates allowed.
+            buffer: Changes kept aside before the array is rebuilt.
+        """
+        self.buffer = buffer
+        self._sorted = array("q", sorted(set(ids)))
+        # Not in the array / in the array but removed
+        self._added: set[int] = set()
+        self._removed: set[int] = set()
+
+    @classmethod
+    def from_sorted(cls, ids: array, buffer: int = 1024) -> "IdSet":
+        """Takes over an array already sorted and without duplicates (ORDER BY a key)."""
+        if ids.typecode != "q":
+            raise ValueError(f"Expected an array of 'q', not {ids.typecode!r}")
+        id_set = cls(buffer=buffer)
+        id_set._sorted = ids
+        return id_set
+
+    def _in_array(self, id: int) -> bool:
+        index = bisect_left(self._sorted, id)
+        return index < len(self._sorted) and self._sorted[index] == id
+
+    def __contains__(self, id: object) -> bool:
+        if id in self._added:
+            return True
+        if id in self._removed or not isinstance(id, int):
+            return False
+        return self._in_array(id)
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._added) - len(self._removed)
+
+    def __iter__(self) -> Iterator[int]:
+        """The ids in ascending order."""
+        self.compact()
+        return iter(self._sorted)
+
+    def add(self, id: int) -> None:
+        self._removed.discard(id)
+        if not self._in_array(id):
+            self._added.add(id)
+            self._changed()
+
+    def discard(self, id: int) -> None:
+        self._added.discard(id)
+        if self._in_array(id):
+            self._removed.add(id)
+            self._changed()
+
+    def update(self, ids: Iterable[int]) -> None:
+        for id in ids:
+            self.add(id)
+
+    def difference_update(self, ids: Iterable[int]) -> None:
+        for id in ids:
+            self.discard(id)
+
+    def _changed(self) -> None:
+        if len(self._added) + len(self._removed) >= self.buffer:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merges the buffered changes into the array."""
+        if not self._added and not self._removed:
+            return
+        kept: Iterable[int] = self._sorted
+        if self._removed:
+            removed = self._removed
+            kept = (id for id in self._sorted if id not in removed)
+        # The kept ids are one sorted run: Timsort only sorts the additions and merges
+        self._sorted = array("q", sorted(chain(kept, self._added)))
+        self._added.clear()
+        self._removed.clear()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used, buffers included."""
+        return (
+            getsizeof(self._sorted) + getsizeof(self._added) + getsizeof(self._removed)
+        )
@@ -0,0 +1,386 @@
+"""
+Opt-in journal of the gateway events the cogs consume, for record-and-replay.
+
+The journal wraps the py-cord parsers of the events it records (voice states, member
+join/remove/update, interactions, and the channel and role creations needed to follow the
+bot's own side effects at replay). Payloads are anonymized as they arrive: every snowflake is
+replaced with a keyed HMAC of it, names derived from members are pseudonymized, tokens and
+avatars are dropped. Timestamps are kept, as offsets from the start of the recording.
+
+A journal file is a magic string followed by blocks: a 4-byte big-endian length and a zlib
+compressed run of JSON lines. The first block of every file is a header with the structure of
+the guild, the anonymized runtime settings and the registered games, so each rotated file
+can be replayed on its own (see tools/simulator/replay.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import struct
+import zlib
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from time import time
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger as log
+
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from discord.state import ConnectionState
+
+    from model.database import Database
+    from utils.settings import JournalSettings, RuntimeSettings
+
+MAGIC = b"ZORSJRNL1\n"
+VERSION = 1
+SUFFIX = ".zjl"
+
+journal_records = metrics.counter(
+    "zors_journal_records_total", "Gateway events written to the journal.", ("event",)
+)
+
+# Events the cogs listen to, replayed as they were received
+recorded_events = (
+    "VOICE_STATE_UPDATE",
+    "GUILD_MEMBER_ADD",
+    "GUILD_MEMBER_REMOVE",
+    "GUILD_MEMBER_UPDATE",
+    "INTERACTION_CREATE",
+)
+# Side effects of the bot's REST calls, used at replay to match what it creates again
+structure_events = ("CHANNEL_CREATE", "CHANNEL_DELETE", "GUILD_ROLE_CREATE")
+
+_length = struct.Struct(">I")
+_snowflake = re.compile(r"^\d{17,20}$")
+# Integers that look like snowflakes but aren't
+_not_ids = frozenset({"permissions", "app_permissions", "allow", "deny", "flags"})
+_personal = frozenset({"username", "global_name", "nick", "display_name"})
+_dropped = frozenset(
+    {
+        "avatar",
+        "banner",
+        "avatar_decoration_data",
+        "email",
+        "token",
+        "session_id",
+        "collectibles",
+    }
+)
+# Channel and role names built from a member name by the cogs ("<membre>-party", "couleur <membre>")
+_member_named = (
+    re.compile(r"^(?P<name>.+)(?P<affix>-party)$"),
+    re.compile(r"^(?P<affix>couleur )(?P<name>.+)$"),
+)
+
+
+class Anonymizer:
+    """
+    Keyed pseudonymization: the same id or name always gives the same value with the same key,
+    and can't be reversed without it. The key is never written to the journal.
+    """
+
+    def __init__(self, key: bytes | None = None):
+        self._key = key or secrets.token_bytes(32)
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._key, value.encode(), hashlib.sha256).digest()
+
+    def id(self, value: int | str) -> int:
+        # Kept in the snowflake range (19 digits), so anonymized payloads still look like Discord's
+        return (1 << 62) | (int.from_bytes(self._digest(str(value))[:8]) >> 2)
+
+    def name(self, value: str) -> str:
+        return f"membre-{self._digest(value)[:3].hex()}"
+
+    def channel_name(self, value: str) -> str:
+        for pattern in _member_named:
+            if match := pattern.fullmatch(value):
+                return value.replace(match["name"], self.name(match["name"]))
+        return value
+
+    def payload(self, value: Any, key: str | None = None) -> Any:
+        """Anonymizes a gateway payload, recursively."""
+        match value:
+            case dict():
+                return {
+                    (str(self.id(k)) if _snowflake.match(k) else k): self.payload(v, k)
+                    for k, v in value.items()
+                    if k not in _dropped
+                }
+            case list():
+                return [self.payload(item, key) for item in value]
+            case str() if key in _personal:
+                return self.name(value)
+            case str() if key == "name":
+                return self.channel_name(value)
+            case str() if key not in _not_ids and _snowflake.match(value):
+                return str(self.id(value))
+            case _:
+                return value
+
+    def settings(self, runtime: RuntimeSettings) -> dict[str, Any]:
+        """The ids of the runtime settings the cogs need to find the guild structure."""
+
+        def ids(value: Any) -> Any:
+            if isinstance(value, dict):
+                return {k: ids(v) for k, v in value.items()}
+            if isinstance(value, int) and not isinstance(value, bool):
+                return self.id(value)
+            return value
+
+        return ids(
+            runtime.model_dump(
+                include={"main_guild", "roles", "discord_structure", "role_placement"}
+            )
+        )
+
+
+def _channel(payload: dict[str, Any]) -> dict[str, Any]:
+    return {
+        key: payload.get(key) for key in ("id", "type", "name", "parent_id", "position")
+    }
+
+
+def _role(payload: dict[str, Any]) -> dict[str, Any]:
+    return {key: payload.get(key) for key in ("id", "name", "position", "color")}
+
+
+def guild_structure(payload: dict[str, Any]) -> dict[str, Any]:
+    """What the replay needs from a GUILD_CREATE: channels, roles and voice states, no members."""
+    return {
+        "id": payload["id"],
+        "channels": [_channel(channel) for channel in payload.get("channels", ())],
+        "roles": [_role(role) for role in payload.get("roles", ())],
+        "voice_states": [
+            {key: state.get(key) for key in ("user_id", "channel_id")}
+            for state in payload.get("voice_states", ())
+        ],
+    }
+
+
+@dataclass
+class Record:
+    t: float
+    event: str
+    data: dict[str, Any]
+
+
+def write_block(file, lines: list[bytes]) -> int:
+    data = zlib.compress(b"".join(lines), 6)
+    file.write(_length.pack(len(data)) + data)
+    return _length.size + len(data)
+
+
+def read_journal(path: Path) -> tuple[dict[str, Any], Iterator[Record]]:
+    """
+    Returns:
+        The header of a journal file and an iterator over its records.
+        A block truncated by a crash ends the iteration.
+    """
+    file = path.open("rb")
+    if file.read(len(MAGIC)) != MAGIC:
+        file.close()
+        raise ValueError(f"{path} is not a ZORS journal")
+
+    def blocks() -> Iterator[dict[str, Any]]:
+        with file:
+            while len(prefix := file.read(_length.size)) == _length.size:
+                (length,) = _length.unpack(prefix)
+                data = file.read(length)
+                if len(data) < length:
+                    log.warning(f"Truncated block at the end of {path}")
+                    return
+                for line in zlib.decompress(data).splitlines():
+                    yield json.loads(line)
+
+    lines = blocks()
+    header = next(lines, None)
+    if header is None or header.get("type") != "header":
+        raise ValueError(f"{path} has no header")
+    if header["version"] != VERSION:
+        raise ValueError(f"{path} is a version {header['version']} journal")
+    return header, (Record(line["t"], line["e"], line["d"]) for line in lines)
+
+
+def journal_files(path: Path) -> list[Path]:
+    """The journal files of a directory, oldest first, or the file itself."""
+    if path.is_dir():
+        return sorted(path.glob(f"journal-*{SUFFIX}"))
+    return [path]
+
+
+class GatewayJournal:
+    """
+    Records the gateway events of the main guild to rotating journal files.
+
+    Events are anonymized and buffered by the parser wrappers, a background task compresses
+    and writes them every `flush_interval` seconds in a thread.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        config: JournalSettings,
+        runtime: RuntimeSettings,
+        anonymizer: Anonymizer | None = None,
+    ):
+        self.directory = directory
+        self.config = config
+        self.runtime = runtime
+        self.anonymizer = anonymizer or Anonymizer()
+        self.guild_id = str(runtime.main_guild)
+        self._pending: list[bytes] = []
+        self._header: dict[str, Any] = {
+            "type": "header",
+            "version": VERSION,
+            "settings": self.anonymizer.settings(runtime),
+            "games": [],
+            "guild": None,
+        }
+        self._file = None
+        self._path: Path | None = None
+        self._size = 0
+        self._started = 0.0
+        self._flusher: asyncio.Task | None = None
+        # One write at a time: the final flush of stop() waits for the one in progress
+        self._writing = asyncio.Lock()
+
+    async def start(self, state: ConnectionState, database: Database) -> None:
+        """Reads the registered games and wraps the parsers of the recorded events."""
+        from model.managers import GameCategoryManager
+
+        async with database.get_session() as session:
+            games = await GameCategoryManager.get_all(session)
+        self._header["games"] = [
+            {
+                key: value if key == "name" else self.anonymizer.id(value)
+                for key, value in game.model_dump().items()
+            }
+            for game in games
+        ]
+        self._started = time()
+
+        state.parsers["GUILD_CREATE"] = self._observe_guild(
+            state.parsers["GUILD_CREATE"]
+        )
+        for event in (*recorded_events, *structure_events):
+            if event in state.parsers:
+                state.parsers[event] = self._recorder(event, state.parsers[event])
+        self._flusher = asyncio.create_task(self._flush_loop(), name="journal: flush")
+        log.info(f"Gateway journal recording to {self.directory}")
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _observe_guild(
+        self, parser: Callable[[dict[str, Any]], None]
+    ) -> Callable[[dict[str, Any]], None]:
+        def observe(data: dict[str, Any]) -> None:
+            if data.get("id") == self.guild_id:
+                self._header["guild"] = self.anonymizer.payload(guild_structure(data))
+            parser(data)
+
+        return observe
+
+    def _recorder(
+        self, event: str, parser: Callable[[dict[str, Any]], None]
+    ) -> Callable[[dict[str, Any]], None]:
+        def record(data: dict[str, Any]) -> None:
+            try:
+                if data.get("guild_id", self.guild_id) == self.guild_id:
+                    self._record(event, data)
+            except Exception as e:  # noqa: BLE001 - recording must never lose an event
+                log.opt(exception=e).warning(f"Could not journal a {event}")
+            parser(data)
+
+        return record
+
+    def _record(self, event: str, data: dict[str, Any]) -> None:
+        line = {
+            "t": round(time() - self._started, 3),
+            "e": event,
+            "d": self.anonymizer.payload(data),
+        }
+        self._pending.append(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+        journal_records.labels(event).inc()
+        self._track_structure(event, line["d"])
+
+    def _track_structure(self, event: str, data: dict[str, Any]) -> None:
+        """Keeps the guild of the header current, for the next rotated file."""
+        guild = self._header["guild"]
+        if guild is None:
+            return
+        if event == "CHANNEL_CREATE":
+            guild["channels"].append(_channel(data))
+        elif event == "CHANNEL_DELETE":
+            guild["channels"] = [
+                channel for channel in guild["channels"] if channel["id"] != data["id"]
+            ]
+        elif event == "GUILD_ROLE_CREATE":
+            guild["roles"].append(_role(data["role"]))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.flush_interval_s)
+            try:
+                await self._flush()
+            except OSError as e:
+                log.opt(exception=e).error("Could not write the gateway journal")
+
+    async def _flush(self) -> None:
+        async with self._writing:
+            # Taken on the loop thread, the parsers keep appending while the thread writes
+            lines, self._pending = self._pending, []
+            if not lines:
+                return
+            header = self._header | {"started_at": self._started}
+            write = asyncio.ensure_future(
+                asyncio.to_thread(
+                    self._write,
+                    lines,
+                    json.dumps(header, separators=(",", ":")).encode(),
+                )
+            )
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # The thread can't be interrupted, the file stays locked until it is done
+                await write
+                raise
+
+    def _write(self, lines: list[bytes], header: bytes) -> None:
+        if self._file is None or self._size >= self.config.max_file_mb * 1024 * 1024:
+            self._rotate(header)
+        self._size += write_block(self._file, lines)
+        self._file.flush()  # type: ignore[union-attr]
+
+    def _rotate(self, header: bytes) -> None:
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        now = datetime.now(UTC)
+        self._path = self.directory / f"journal-{now:%Y%m%d-%H%M%S-%f}{SUFFIX}"
+        self._file = self._path.open("wb")
+        self._file.write(MAGIC)
+        # Every file starts with the header: offsets are relative to its started_at
+        self._size = len(MAGIC) + write_block(self._file, [header + b"\n"])
+        log.debug(f"Gateway journal rotated to {self._path}")
+
+        for old in journal_files(self.directory)[: -self.config.max_files]:
+            old.unlink(missing_ok=True)
@@ -0,0 +1,326 @@
+"""
+Background compression and indexing of rotated log files.
+
+Rotated files are written as a sequence of independently compressed segments
+(concatenated gzip members or zstd frames, both still readable by zcat/zstdcat).
+A sidecar `<archive>.idx` file records, for each segment, its byte range, its time span
+and the structured field values it contains, so searches only decompress matching segments.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Literal
+
+from loguru import logger
+
+type CompressionType = Literal["gz", "zstd"]
+
+_extensions: dict[CompressionType, str] = {"gz": "gz", "zstd": "zst"}
+_segment_max_lines = 4096
+_segment_max_bytes = 1024 * 1024
+_index_version = 1
+_text_time_format = "%d/%m/%Y %H:%M:%S"
+
+# Structured fields recorded in the index, a segment with more distinct values than
+# _max_indexed_values for a field stores None and is always scanned for that field
+indexed_fields = ("level", "cog", "guild_id", "member_id", "command")
+_max_indexed_values = 256
+
+
+@dataclass
+class Segment:
+    """A compressed chunk of an archive and what it contains."""
+
+    offset: int
+    length: int
+    lines: int
+    start: float | None = None
+    end: float | None = None
+    fields: dict[str, list[str] | None] = field(default_factory=dict)
+
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_compression(compression: CompressionType) -> CompressionType:
+    """
+    Returns the compression that will actually be used.
+    zstd needs the optional `zstandard` package, gz is used when it is missing.
+    """
+    if compression == "zstd" and not _zstd_available():
+        logger.warning(
+            "zstd log compression requested but 'zstandard' is not installed, falling back to gz"
+        )
+        return "gz"
+    return compression
+
+
+def compression_of(archive: Path) -> CompressionType | None:
+    """Returns the compression of an archive from its extension, None if it isn't one."""
+    for compression, extension in _extensions.items():
+        if archive.name.endswith(f".{extension}"):
+            return compression
+    return None
+
+
+def index_path(archive: Path) -> Path:
+    return archive.with_name(f"{archive.name}.idx")
+
+
+# region line parsing
+def parse_json_line(line: bytes) -> dict | None:
+    """Returns the record of a JSON log line, None for free-text lines."""
+    if not line.startswith(b"{"):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def line_time(line: bytes, record: dict | None = None) -> float | None:
+    """Returns the timestamp of a log line, None for continuation lines (tracebacks...)."""
+    if record is not None:
+        timestamp = record.get("timestamp")
+        return float(timestamp) if timestamp is not None else None
+    try:
+        return datetime.strptime(
+            line[:19].decode("ascii"), _text_time_format
+        ).timestamp()
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+# endregion
+
+
+# region writing
+def _compress(data: bytes, compression: CompressionType) -> bytes:
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+class _SegmentBuilder:
+    """Accumulates lines and the index data of the segment being built."""
+
+    def __init__(self):
+        self.lines: list[bytes] = []
+        self.size = 0
+        self.start: float | None = None
+        self.end: float | None = None
+        self.values: dict[str, set[str] | None] = {
+            name: set() for name in indexed_fields
+        }
+
+    def add(self, line: bytes) -> None:
+        record = parse_json_line(line)
+        timestamp = line_time(line, record)
+        if timestamp is not None:
+            self.start = timestamp if self.start is None else min(self.start, timestamp)
+            self.end = timestamp if self.end is None else max(self.end, timestamp)
+        if record is not None:
+            for name in indexed_fields:
+                values = self.values[name]
+                value = record.get(name)
+                if values is None or value is None:
+                    continue
+                values.add(str(value))
+                if len(values) > _max_indexed_values:
+                    self.values[name] = None
+        self.lines.append(line)
+        self.size += len(line)
+
+    @property
+    def full(self) -> bool:
+        return len(self.lines) >= _segment_max_lines or self.size >= _segment_max_bytes
+
+    def segment(self, offset: int, length: int) -> Segment:
+        return Segment(
+            offset=offset,
+            length=length,
+            lines=len(self.lines),
+            start=self.start,
+            end=self.end,
+            fields={
+                name: sorted(values) if values is not None else None
+                for name, values in self.values.items()
+                if values is None or values
+            },
+        )
+
+
+def write_archive(
+    lines: Iterable[bytes], archive: Path, compression: CompressionType
+) -> list[Segment]:
+    """
+    Writes lines as a segmented archive along with its index.
+    Both files are written under a temporary name first so a crash never leaves a truncated archive.
+
+    Returns:
+        The segments of the archive.
+    """
+    partial = archive.with_name(f"{archive.name}.part")
+    segments: list[Segment] = []
+    offset = 0
+    with open(partial, "wb") as target:
+
+        def flush(builder: _SegmentBuilder) -> None:
+            nonlocal offset
+            data = _compress(b"".join(builder.lines), compression)
+            target.write(data)
+            segments.append(builder.segment(offset, len(data)))
+            offset += len(data)
+
+        builder = _SegmentBuilder()
+        for line in lines:
+            builder.add(line)
+            if builder.full:
+                flush(builder)
+                builder = _SegmentBuilder()
+        if builder.lines:
+            flush(builder)
+
+    index = index_path(archive)
+    partial_index = index.with_name(f"{index.name}.part")
+    partial_index.write_text(
+        json.dumps(
+            {
+                "version": _index_version,
+                "compression": compression,
+                "segments": [asdict(segment) for segment in segments],
+            },
+            separators=(",", ":"),
+        )
+    )
+    os.replace(partial, archive)
+    os.replace(partial_index, index)
+    return segments
+
+
+def compress_file(path: Path, compression: CompressionType) -> Path:
+    """
+    Compresses a rotated log file next to itself, indexes it and removes the original.
+
+    Args:
+        path: The rotated log file.
+        compression: The compression format to use.
+
+    Returns:
+        The path of the archive.
+    """
+    archive = path.with_name(f"{path.name}.{_extensions[compression]}")
+    with open(path, "rb") as source:
+        write_archive(source, archive, compression)
+    path.unlink()
+    return archive
+
+
+class BackgroundCompressor:
+    """
+    Loguru compression callable that hands the rotated file to a worker thread.
+    Rotation only renames the file, the sink keeps writing while the archive is built.
+    """
+
+    def __init__(self, compression: CompressionType):
+        self.compression = resolve_compression(compression)
+
+    def __call__(self, path: str) -> None:
+        # Not a daemon: a rotation happening right before shutdown still gets archived
+        threading.Thread(
+            target=self._run,
+            args=(Path(path),),
+            name=f"log-compress-{Path(path).name}",
+        ).start()
+
+    def _run(self, path: Path) -> None:
+        try:
+            compress_file(path, self.compression)
+        except OSError as e:
+            # The raw file is kept, retention will clean it up eventually
+            logger.warning(f"Failed to compress rotated log file {path}: {e}")
+
+
+# endregion
+
+
+# region reading
+def read_index(archive: Path) -> list[Segment] | None:
+    """Returns the segments of an archive, None if it has no (valid) index."""
+    try:
+        data = json.loads(index_path(archive).read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != _index_version:
+        return None
+    return [Segment(**segment) for segment in data["segments"]]
+
+
+def read_segment(archive: Path, segment: Segment) -> list[bytes]:
+    """Decompresses a single segment of an archive."""
+    with open(archive, "rb") as source:
+        source.seek(segment.offset)
+        data = source.read(segment.length)
+    if compression_of(archive) == "zstd":
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data, wbits=31)
+    return raw.splitlines(keepends=True)
+
+
+def iter_archive(archive: Path) -> Iterator[bytes]:
+    """Streams every line of an archive, segmented or not."""
+    if compression_of(archive) == "zstd":
+        import zstandard
+
+        with open(archive, "rb") as source:
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                source, read_across_frames=True
+            )
+            yield from _lines(reader)
+    else:
+        with gzip.open(archive, "rb") as source:
+            yield from source
+
+
+def _lines(reader) -> Iterator[bytes]:
+    pending = b""
+    while chunk := reader.read(_segment_max_bytes):
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+
+def reindex(archive: Path) -> list[Segment]:
+    """
+    Rewrites an archive as a segmented one and builds its index.
+    Used for archives written before indexing existed.
+    """
+    compression = compression_of(archive)
+    if compression is None:
+        raise ValueError(f"{archive} is not a log archive")
+    return write_archive(iter_archive(archive), archive, compression)
+
+
+# endregion
@@ -1,10 +1,15 @@
+import json
 import logging
+import traceback
+from contextvars import ContextVar
 from pathlib import Path
 from sys import stderr, stdout
 from typing import TYPE_CHECKING
 
 from loguru import logger
 
+from utils.log_archive import BackgroundCompressor, CompressionType
+
 if TYPE_CHECKING:
     from utils.settings import AppSettings
 
@@ -12,7 +17,85 @@ _event_format = "{time:DD/MM/YYYY HH:mm:ss:SS} | <lvl>{level}</> | <lvl>{message
 _issue_format = "{time:DD/MM/YYYY HH:mm:ss:SS} | <lvl>{level}</> | <lvl>{message}</> | {file}:{line}"
 _rotation_duration = "1 week"
 _retention_duration = "1 month"
-_compression_type = "gz"
+_compression_type: CompressionType = "gz"
+
+# Updated by setup_logger, read by TraceSampler on every call
+_trace_enabled = True
+_trace_sample_every = 1
+
+# Structured fields attached to every record logged from the current task (see bind_context)
+_log_context: ContextVar[dict[str, object]] = ContextVar("log_context")
+
+
+class TraceSampler:
+    """
+    Rate limiter for high-volume TRACE logs.
+    Checking the sampler before building the message skips the formatting cost
+    when TRACE is disabled or the call is sampled out.
+
+    Usage:
+        if _sampler.should_log():
+            log.trace(f"...")
+    """
+
+    def __init__(self, every: int | None = None):
+        """
+        Args:
+            every: Keep one call out of `every`. Defaults to settings.runtime.log_trace_sample_every.
+        """
+        self._every = every
+        self._count = 0
+
+    def should_log(self) -> bool:
+        if not _trace_enabled:
+            return False
+        every = self._every if self._every is not None else _trace_sample_every
+        self._count += 1
+        if self._count >= every:
+            self._count = 0
+            return True
+        return False
+
+
+def bind_context(**fields: object) -> None:
+    """
+    Attaches structured fields (cog, guild_id, member_id, command, duration_ms...) to every record
+    logged from now on in the current task. Each listener and command runs in its own task,
+    so the fields never leak between events.
+    """
+    _log_context.set({**_log_context.get({}), **fields})
+
+
+def _inject_context(record) -> None:
+    context = _log_context.get(None)
+    if context:
+        record["extra"].update(context)
+
+
+def _json_format(record) -> str:
+    """Serializes a record as a single JSON line, the structured fields are kept top level."""
+    payload: dict[str, object] = {
+        "time": record["time"].isoformat(),
+        "timestamp": round(record["time"].timestamp(), 3),
+        "level": record["level"].name,
+        "message": record["message"],
+        "location": f"{record['file'].name}:{record['line']}",
+    }
+    payload.update(
+        (key, value)
+        for key, value in record["extra"].items()
+        if not key.startswith("_")
+    )
+    if record["exception"] is not None:
+        payload["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["_json"] = json.dumps(payload, default=str, ensure_ascii=False)
+    return "{extra[_json]}\n"
+
+
+def _below(level: str):
+    """Returns a filter letting through records strictly below `level`, with the threshold computed once."""
+    level_no = logger.level(level).no
+    return lambda record: record["level"].no < level_no
 
 
 def setup_basic_logger() -> None:
@@ -29,7 +112,7 @@ def setup_basic_logger() -> None:
         format=_event_format,
         level="DEBUG",
         colorize=True,
-        filter=lambda record: record["level"].no < logger.level("WARNING").no,
+        filter=_below("WARNING"),
     )
 
     # Add basic console handler for issues (WARNING and above)
@@ -60,6 +143,9 @@ def setup_logger(
     log_folder_path: Path | None = None,
     event_level: str | None = None,
     issue_level: str | None = None,
+    enqueue: bool | None = None,
+    compression: CompressionType | None = None,
+    json_logs: bool | None = None,
 ) -> None:
     """
     Setup loguru logger with file and console handlers.
@@ -68,7 +154,12 @@ def setup_logger(
         log_folder_path: Path to log directory (defaults to settings.config.logs_path)
         event_level: Log level for events (defaults to settings.config.log_event_level)
         issue_level: Log level for issues (defaults to settings.config.log_issue_level)
+        enqueue: Write records from a background thread (defaults to settings.config.log_enqueue)
+        compression: Compression of rotated files (defaults to settings.config.log_compression)
+        json_logs: Also write structured JSON lines (defaults to settings.config.log_json)
     """
+    global _trace_enabled, _trace_sample_every
+
     # Lazy load settings to avoid import at module level
     _settings = _get_settings()
 
@@ -79,49 +170,94 @@ def setup_logger(
         event_level = _settings.runtime.log_event_level
     if issue_level is None:
         issue_level = _settings.runtime.log_issue_level
+    if enqueue is None:
+        enqueue = _settings.runtime.log_enqueue
+    if compression is None:
+        compression = _settings.runtime.log_compression
+    if json_logs is None:
+        json_logs = _settings.runtime.log_json
+
+    _trace_enabled = logger.level(event_level).no <= logger.level("TRACE").no
+    _trace_sample_every = _settings.runtime.log_trace_sample_every
 
     logger.remove()
-    add_event_console(event_level, issue_level)
-    add_issue_console(issue_level)
-    add_event_log_file(event_level, issue_level, log_folder_path)
-    add_issue_log_file(issue_level, log_folder_path)
+    add_event_console(event_level, issue_level, enqueue)
+    add_issue_console(issue_level, enqueue)
+    add_event_log_file(event_level, issue_level, log_folder_path, enqueue, compression)
+    add_issue_log_file(issue_level, log_folder_path, enqueue, compression)
+    if json_logs:
+        add_json_log_file(event_level, log_folder_path, enqueue, compression)
+    logger.configure(patcher=_inject_context)
     set_colors()
 
 
-def add_event_console(log_level: str, issue_level: str) -> None:
+def add_event_console(log_level: str, issue_level: str, enqueue: bool = False) -> None:
     logger.add(
         stdout,
         format=_event_format,
         level=log_level,
         colorize=True,
-        filter=lambda record: record["level"].no < logger.level(issue_level).no,
+        filter=_below(issue_level),
+        enqueue=enqueue,
     )
 
 
-def add_issue_console(log_level: str) -> None:
-    logger.add(stderr, format=_issue_format, level=log_level, colorize=True)
+def add_issue_console(log_level: str, enqueue: bool = False) -> None:
+    logger.add(
+        stderr, format=_issue_format, level=log_level, colorize=True, enqueue=enqueue
+    )
 
 
-def add_event_log_file(log_level: str, issue_level: str, log_folder_path: Path) -> None:
+def add_event_log_file(
+    log_level: str,
+    issue_level: str,
+    log_folder_path: Path,
+    enqueue: bool = False,
+    compression: CompressionType = _compression_type,
+) -> None:
     logger.add(
         log_folder_path / "events" / "events.log",
         format=_event_format,
         rotation=_rotation_duration,
         retention=_retention_duration,
         level=log_level,
-        filter=lambda record: record["level"].no < logger.level(issue_level).no,
-        compression=_compression_type,
+        filter=_below(issue_level),
+        compression=BackgroundCompressor(compression),
+        enqueue=enqueue,
     )
 
 
-def add_issue_log_file(log_level: str, log_folder_path: Path) -> None:
+def add_issue_log_file(
+    log_level: str,
+    log_folder_path: Path,
+    enqueue: bool = False,
+    compression: CompressionType = _compression_type,
+) -> None:
     logger.add(
         log_folder_path / "issues" / "issues.log",
         format=_issue_format,
         rotation=_rotation_duration,
         retention=_retention_duration,
         level=log_level,
-        compression=_compression_type,
+        compression=BackgroundCompressor(compression),
+        enqueue=enqueue,
+    )
+
+
+def add_json_log_file(
+    log_level: str,
+    log_folder_path: Path,
+    enqueue: bool = False,
+    compression: CompressionType = _compression_type,
+) -> None:
+    logger.add(
+        log_folder_path / "json" / "zors.jsonl",
+        format=_json_format,
+        rotation=_rotation_duration,
+        retention=_retention_duration,
+        level=log_level,
+        compression=BackgroundCompressor(compression),
+        enqueue=enqueue,
     )
 
 
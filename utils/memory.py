@@ -0,0 +1,214 @@
+"""
+Memory diagnostics and the memory-budgeted py-cord cache configuration.
+
+The gateway intents and the member cache are derived from what the cogs declare they need
+(ZorsCog.required_intents / ZorsCog.member_cache), the message cache from the memory budget.
+Diagnostics: process RSS, py-cord cache sizes and tracemalloc snapshots diffed on demand.
+"""
+
+from __future__ import annotations
+
+import resource
+import tracemalloc
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import discord
+
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from utils.zors_cog import ZorsCog
+
+# Needed by slash commands, roles and channels, whatever the cogs are
+base_intents = frozenset({"guilds"})
+
+# Share of the budget given to the message cache and the rough size of a cached message
+_message_cache_share = 0.1
+_message_size_kib = 4
+_max_message_cache = 5000
+
+process_memory = metrics.gauge(
+    "zors_process_resident_memory_bytes", "Resident memory of the bot process."
+)
+discord_cache_entries = metrics.gauge(
+    "zors_discord_cache_entries", "Objects held in the py-cord caches.", ("cache",)
+)
+
+
+def rss_bytes() -> int:
+    """Current resident memory, read from /proc, falls back on the peak on other platforms."""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# region cache configuration
+@dataclass(frozen=True)
+class CacheConfiguration:
+    intents: discord.Intents
+    member_cache_flags: discord.MemberCacheFlags
+    max_messages: int | None
+
+    @classmethod
+    def from_cogs(
+        cls,
+        cogs: Iterable[type[ZorsCog]],
+        budget_mb: int,
+        max_messages: int | None = None,
+    ) -> CacheConfiguration:
+        """
+        Args:
+            cogs: The cog classes that will be loaded.
+            budget_mb: Target resident memory of the bot.
+            max_messages: Explicit message cache size, derived from the budget when None (0 disables it).
+        """
+        intent_names = set(base_intents)
+        member_cache_names: set[str] = set()
+        for cog in cogs:
+            intent_names |= cog.required_intents
+            member_cache_names |= cog.member_cache
+        intents = discord.Intents(**dict.fromkeys(intent_names, True))
+
+        if max_messages is None:
+            # Nothing reads messages: no message cache at all
+            if intents.guild_messages or intents.dm_messages:
+                max_messages = min(
+                    _max_message_cache,
+                    int(budget_mb * 1024 * _message_cache_share / _message_size_kib),
+                )
+            else:
+                max_messages = 0
+
+        # MemberCacheFlags() enables everything, start from none
+        member_cache_flags = discord.MemberCacheFlags.none()
+        for name in member_cache_names:
+            setattr(member_cache_flags, name, True)
+
+        return cls(
+            intents=intents,
+            member_cache_flags=member_cache_flags,
+            # py-cord replaces 0 with its default of 1000, None disables the cache
+            max_messages=max_messages or None,
+        )
+
+    def describe(self) -> str:
+        intents = ", ".join(name for name, enabled in self.intents if enabled)
+        member_cache = ", ".join(
+            name for name, enabled in self.member_cache_flags if enabled
+        )
+        return (
+            f"intents: {intents} | member cache: {member_cache or 'none'} | "
+            f"message cache: {self.max_messages or 'disabled'}"
+        )
+
+
+# endregion
+
+
+# region diagnostics
+def cache_sizes(bot: discord.Client) -> dict[str, int]:
+    """Number of objects held in each py-cord cache."""
+    guilds = bot.guilds
+    return {
+        "guilds": len(guilds),
+        "users": len(bot.users),
+        "members": sum(len(guild.members) for guild in guilds),
+        "channels": sum(len(guild.channels) for guild in guilds),
+        "roles": sum(len(guild.roles) for guild in guilds),
+        "voice_states": sum(len(guild._voice_states) for guild in guilds),
+        "emojis": len(bot.emojis),
+        "stickers": len(bot.stickers),
+        "messages": len(bot.cached_messages),
+    }
+
+
+def register_memory_metrics(bot: discord.Client) -> None:
+    process_memory.labels().set_function(rss_bytes)
+    for name in cache_sizes(bot):
+
+        def size(name: str = name) -> int:
+            return cache_sizes(bot)[name]
+
+        discord_cache_entries.labels(name).set_function(size)
+
+
+@dataclass
+class AllocationDiff:
+    location: str
+    size_diff: int
+    size: int
+    count_diff: int
+
+
+class AllocationTracker:
+    """
+    tracemalloc snapshots diffed on demand.
+    The first snapshot starts tracing (slows allocations down, stop it once done),
+    each following one is compared to the previous.
+    """
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._previous: tracemalloc.Snapshot | None = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def snapshot(self, limit: int = 10) -> list[AllocationDiff] | None:
+        """
+        Takes a snapshot and returns the biggest growths since the previous one.
+
+        Returns:
+            The top allocation sites by growth, None for the first snapshot.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._previous = None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return None
+        return [
+            AllocationDiff(
+                location=str(stat.traceback[0]),
+                size_diff=stat.size_diff,
+                size=stat.size,
+                count_diff=stat.count_diff,
+            )
+            for stat in snapshot.compare_to(previous, "lineno")[:limit]
+        ]
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._previous = None
+
+    @staticmethod
+    def traced_memory() -> tuple[int, int] | None:
+        """Current and peak memory traced by tracemalloc, None when not tracing."""
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+# endregion
@@ -0,0 +1,386 @@
+"""
+Minimal Prometheus-compatible metrics: counters, gauges, histograms and an HTTP exporter.
+
+Metrics are registered on the global `metrics` registry, from anywhere in the bot:
+    command_duration = metrics.histogram("zors_command_duration_seconds", "...", ("command",))
+    command_duration.labels(command="ping").observe(0.12)
+
+Cogs register theirs through ZorsCog.metric_counter/metric_gauge/metric_histogram.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager
+from time import perf_counter
+from typing import Literal
+
+from loguru import logger as log
+
+type MetricType = Literal["counter", "gauge", "histogram"]
+
+default_buckets = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("_function", "_value")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Callable[[], float] | None = None
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value when the metrics are collected instead of storing it."""
+        self._function = function
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "count", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimates a quantile by linear interpolation inside its bucket, like PromQL histogram_quantile.
+        Values in the +Inf bucket are reported as the highest finite bound.
+
+        Returns:
+            The estimate, None when nothing was observed.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1] if self.buckets else None
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1] if self.buckets else None
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the block, in seconds."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started)
+
+
+def merge_histograms(children: Iterable[_HistogramChild]) -> _HistogramChild | None:
+    """Sums histograms sharing the same buckets, e.g. every label value of a metric."""
+    merged: _HistogramChild | None = None
+    for child in children:
+        if merged is None:
+            merged = _HistogramChild(child.buckets)
+        merged.counts = [a + b for a, b in zip(merged.counts, child.counts)]
+        merged.count += child.count
+        merged.sum += child.sum
+    return merged
+
+
+class Metric[Child]:
+    """A metric family, children are created per label values."""
+
+    kind: MetricType
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        factory: Callable[[], Child],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: dict[tuple[str, ...], Child] = {}
+
+    def labels(self, *values: object, **kwargs: object) -> Child:
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {values}"
+            )
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._factory()
+        return child
+
+    def children(self) -> dict[tuple[str, ...], Child]:
+        return self._children
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from self._samples(values, child)
+
+    def _samples(self, values: tuple[str, ...], child: Child) -> Iterator[str]:
+        raise NotImplementedError
+
+
+# The unlabeled shortcuts of each type only exist on it: counter.set() is an error
+class Counter(Metric[_CounterChild]):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        super().__init__(name, documentation, labelnames, _CounterChild)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self, values: tuple[str, ...], child: _CounterChild) -> Iterator[str]:
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class Gauge(Metric[_GaugeChild]):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        super().__init__(name, documentation, labelnames, _GaugeChild)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def _samples(self, values: tuple[str, ...], child: _GaugeChild) -> Iterator[str]:
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class Histogram(Metric[_HistogramChild]):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: tuple[float, ...],
+    ):
+        super().__init__(
+            name, documentation, labelnames, lambda: _HistogramChild(buckets)
+        )
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> AbstractContextManager[None]:
+        return self.labels().time()
+
+    def _samples(
+        self, values: tuple[str, ...], child: _HistogramChild
+    ) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip((*child.buckets, math.inf), child.counts):
+            cumulative += count
+            labels = _format_labels(
+                self.labelnames, values, f'le="{_format_value(bound)}"'
+            )
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the process.
+    Registering an existing name returns the existing metric, so reloading a cog is harmless.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def _register[M: Metric](self, metric: M) -> M:
+        existing = self._metrics.get(metric.name)
+        if existing is None:
+            self._metrics[metric.name] = metric
+            return metric
+        kind: type[M] = type(metric)
+        if isinstance(existing, kind) and existing.labelnames == metric.labelnames:
+            return existing
+        raise ValueError(
+            f"Metric {metric.name} is already registered with another type or labels"
+        )
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = default_buckets,
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, documentation, labelnames, tuple(sorted(buckets)))
+        )
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Tiny HTTP server exposing the registry on /metrics.
+    Runs on the bot event loop, a scrape only costs the rendering of the registry.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        log.info(
+            f"Metrics exporter listening on http://{self.host}:{self.port}/metrics"
+        )
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers, the request has no body we care about
+            while await asyncio.wait_for(reader.readline(), timeout=5) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if (
+                len(parts) >= 2
+                and parts[0] == "GET"
+                and parts[1].split("?")[0] == "/metrics"
+            ):
+                status = "200 OK"
+                body = self.registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+                content_type = "text/plain; charset=utf-8"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (TimeoutError, ConnectionError) as e:
+            log.debug(f"Metrics scrape aborted: {e}")
+        finally:
+            writer.close()
+
+
+# Global registry
+metrics = MetricsRegistry()
+
+# Shared by every cache of the bot, hit ratio = hit / (hit + miss)
+cache_requests = metrics.counter(
+    "zors_cache_requests_total",
+    "Cache lookups by cache and result.",
+    ("cache", "result"),
+)
@@ -0,0 +1,160 @@
+"""
+On-demand statistical profiler, safe to run in production.
+
+Two modes, both writing collapsed stacks ("frame;frame;frame count" per line), the input of
+flamegraph.pl, speedscope or inferno:
+- threads: a thread samples the Python stack of every other thread (the event loop included)
+  through sys._current_frames. Shows where CPU time goes.
+- tasks: the event loop samples where every asyncio task is suspended by walking its
+  coroutine await chain. Shows which coroutines are waiting, and on what, under real load.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter, sleep
+from types import CodeType, FrameType
+from typing import Any, Literal
+
+type ProfileMode = Literal["threads", "tasks"]
+
+_max_await_depth = 64
+
+
+@dataclass
+class Profile:
+    mode: ProfileMode
+    duration: float
+    samples: int
+    stacks: Counter[str]
+
+    @property
+    def total(self) -> int:
+        """Stacks counted, one per thread or task of each sample: the base of the shares."""
+        return sum(self.stacks.values())
+
+    def top(self, count: int = 5) -> list[tuple[str, int]]:
+        """Most sampled leaf frames, the usual first look before opening the flamegraph."""
+        leaves: Counter[str] = Counter()
+        for stack, hits in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += hits
+        return leaves.most_common(count)
+
+    def write(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{datetime.now():%Y-%m-%d_%H-%M-%S}-{self.mode}.folded"
+        path.write_text(
+            "".join(f"{stack} {hits}\n" for stack, hits in self.stacks.most_common())
+        )
+        return path
+
+
+def _frame_name(code: CodeType, lineno: int | None = None) -> str:
+    filename = code.co_filename.rsplit("/", 1)[-1]
+    location = f"{filename}:{lineno}" if lineno is not None else filename
+    # ';' separates frames and ' ' separates the count in the collapsed format
+    return f"{code.co_qualname} ({location})".replace(";", ":").replace(" ", "_")
+
+
+# region threads
+def _thread_stack(frame: FrameType | None) -> list[str]:
+    stack: list[str] = []
+    while frame is not None:
+        stack.append(_frame_name(frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _sample_threads(duration: float, interval: float) -> tuple[Counter[str], int]:
+    stacks: Counter[str] = Counter()
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    samples = 0
+    deadline = perf_counter() + duration
+    while perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = [names.get(thread_id, str(thread_id)), *_thread_stack(frame)]
+            stacks[";".join(stack)] += 1
+        samples += 1
+        sleep(interval)
+    return stacks, samples
+
+
+# endregion
+
+
+# region tasks
+def _await_chain(awaitable: Any) -> list[str]:
+    """Follows cr_await from a task coroutine down to the future it is suspended on."""
+    stack: list[str] = []
+    for _ in range(_max_await_depth):
+        frame = getattr(awaitable, "cr_frame", None) or getattr(
+            awaitable, "gi_frame", None
+        )
+        if frame is not None:
+            stack.append(_frame_name(frame.f_code, frame.f_lineno))
+        elif (code := getattr(awaitable, "cr_code", None)) is not None:
+            stack.append(_frame_name(code))
+        else:
+            # A Future, a C-level awaitable... the leaf of the chain
+            stack.append(type(awaitable).__name__)
+            break
+        next_awaitable = getattr(awaitable, "cr_await", None)
+        if next_awaitable is None:
+            next_awaitable = getattr(awaitable, "gi_yieldfrom", None)
+        if next_awaitable is None:
+            break
+        awaitable = next_awaitable
+    return stack
+
+
+async def _sample_tasks(duration: float, interval: float) -> tuple[Counter[str], int]:
+    stacks: Counter[str] = Counter()
+    current = asyncio.current_task()
+    samples = 0
+    deadline = perf_counter() + duration
+    while perf_counter() < deadline:
+        for task in asyncio.all_tasks():
+            if task is current:
+                continue
+            # Task names of listeners look like "pycord: on_message"
+            stack = [task.get_name().replace(";", ":").replace(" ", "_")]
+            stack.extend(_await_chain(task.get_coro()))
+            stacks[";".join(stack)] += 1
+        samples += 1
+        await asyncio.sleep(interval)
+    return stacks, samples
+
+
+# endregion
+
+
+async def profile(
+    mode: ProfileMode, duration: float, interval: float = 0.01
+) -> Profile:
+    """
+    Samples the process for `duration` seconds without blocking the event loop.
+
+    Args:
+        mode: "threads" for Python stacks of every thread, "tasks" for asyncio task await chains.
+        duration: Sampling duration, in seconds.
+        interval: Time between two samples, in seconds.
+
+    Returns:
+        The collapsed stacks and how many samples were taken.
+    """
+    started = perf_counter()
+    if mode == "threads":
+        stacks, samples = await asyncio.to_thread(_sample_threads, duration, interval)
+    else:
+        stacks, samples = await _sample_tasks(duration, interval)
+    return Profile(mode, perf_counter() - started, samples, stacks)
@@ -4,6 +4,7 @@ from typing import Literal
 import yaml
 from pydantic import (
     BaseModel,
+    Field,
     PostgresDsn,
     SecretStr,
     ValidationError,
@@ -85,12 +86,97 @@ class Roles(BaseModel):
         return self
 
 
+class MetricsSettings(BaseModel):
+    """Prometheus exporter configuration."""
+
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9108
+
+
+class DatabaseSettings(BaseModel):
+    """
+    SQL instrumentation, entity cache, read coalescing, change notifications, write-behind,
+    preload and user ids mirror configuration.
+    """
+
+    slow_query_ms: float = Field(default=100.0, gt=0)
+    explain_slow_queries: bool = False
+    detect_query_patterns: bool = True
+    n_plus_one_threshold: int = Field(default=3, ge=2)
+    entity_cache_size: int = Field(default=4096, ge=0)
+    entity_cache_ttl_s: float = Field(default=300.0, gt=0)
+    coalesce_reads: bool = True
+    notify_changes: bool = True
+    listen_keepalive_s: float = Field(default=30.0, gt=0)
+    write_behind: bool = True
+    write_behind_window_s: float = Field(default=2.0, gt=0)
+    write_behind_max_rows: int = Field(default=500, ge=1)
+    preload: bool = True
+    mirror_user_ids: bool = True
+
+
+class TracingSettings(BaseModel):
+    """Interaction tracing configuration."""
+
+    enabled: bool = True
+    buffer_size: int = Field(default=200, ge=1)
+    otlp_file: Path | None = None
+
+
+class WatchdogSettings(BaseModel):
+    """Event loop watchdog configuration."""
+
+    enabled: bool = True
+    interval_ms: float = Field(default=100.0, gt=0)
+    stall_threshold_ms: float = Field(default=250.0, gt=0)
+    summary_interval_s: float = Field(default=300.0, gt=0)
+
+
+class MemorySettings(BaseModel):
+    """Memory budget of the py-cord caches and memory diagnostics."""
+
+    budget_mb: int = Field(default=256, ge=32)
+    max_messages: int | None = Field(default=None, ge=0)
+    tracemalloc_frames: int = Field(default=10, ge=1)
+
+
+class JournalSettings(BaseModel):
+    """Gateway event journal configuration (record-and-replay)."""
+
+    enabled: bool = False
+    flush_interval_s: float = Field(default=5.0, gt=0)
+    max_file_mb: int = Field(default=16, ge=1)
+    max_files: int = Field(default=20, ge=1)
+
+
+class WorkQueueSettings(BaseModel):
+    """Work queue between the gateway listeners and the database."""
+
+    workers: int = Field(default=8, ge=1)
+    capacity: int = Field(default=1000, ge=1)
+    policies: dict[str, Literal["block", "drop", "coalesce"]] = Field(
+        default_factory=dict
+    )
+
+
 class RuntimeSettings(BaseModel):
     """Settings from config.yaml."""
 
     log_event_level: Literal["TRACE", "DEBUG", "INFO"] = "DEBUG"
     log_issue_level: Literal["WARNING", "ERROR", "CRITICAL"] = "WARNING"
     logs_path: Path = Path("logs/")
+    log_enqueue: bool = True
+    log_compression: Literal["gz", "zstd"] = "gz"
+    log_trace_sample_every: int = Field(default=1, ge=1)
+    log_json: bool = False
+    metrics: MetricsSettings = Field(default_factory=MetricsSettings)
+    database: DatabaseSettings = Field(default_factory=DatabaseSettings)
+    tracing: TracingSettings = Field(default_factory=TracingSettings)
+    watchdog: WatchdogSettings = Field(default_factory=WatchdogSettings)
+    memory: MemorySettings = Field(default_factory=MemorySettings)
+    journal: JournalSettings = Field(default_factory=JournalSettings)
+    work_queue: WorkQueueSettings = Field(default_factory=WorkQueueSettings)
     main_guild: int
     roles: Roles
     discord_structure: DiscordStructure
@@ -267,6 +353,10 @@ class _LazySettings:
             self._instance = AppSettings.load()
         return getattr(self._instance, name)
 
+    def use(self, instance: AppSettings) -> None:
+        """Replaces the settings, for tools running the bot without config.yaml (simulator...)."""
+        self._instance = instance
+
 
 # Global settings - loads on first access
 settings = _LazySettings()
@@ -0,0 +1,74 @@
+"""
+Request coalescing ("singleflight") of concurrent identical async calls.
+
+The first caller of a key runs the call; the ones arriving while it is in flight wait for it
+and get the same result instead of running it again. Nothing is kept once the call returns:
+it is not a cache, the next caller runs the call again.
+
+Only results are shared. When the call fails, or its caller is cancelled, the waiting callers
+start over: one of them runs the call, the others wait for it. An error specific to the first
+caller (its session, its transaction...) doesn't spread to the others.
+
+Collapsed calls are counted in zors_singleflight_calls_total under the name of the flight.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+from utils.metrics import metrics
+
+singleflight_calls = metrics.counter(
+    "zors_singleflight_calls_total",
+    "Coalesced calls, by flight and role (leader: ran the call, shared: got its result).",
+    ("name", "role"),
+)
+
+
+class _Failed(Exception):
+    """The call a caller was waiting for didn't return."""
+
+
+class SingleFlight[R]:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[Hashable, asyncio.Future[R]] = {}
+        self._leaders = singleflight_calls.labels(name, "leader")
+        self._shared = singleflight_calls.labels(name, "shared")
+
+    def __len__(self) -> int:
+        """Calls in flight."""
+        return len(self._flights)
+
+    async def do(
+        self, key: Hashable, call: Callable[[], Awaitable[R]]
+    ) -> tuple[R, bool]:
+        """
+        Runs `call()`, or waits for the one in flight for `key`.
+
+        Returns:
+            The result, and whether it was shared by another caller.
+        """
+        while (flight := self._flights.get(key)) is not None:
+            try:
+                # Shielded: a cancelled waiter must not cancel the flight of the others
+                result = await asyncio.shield(flight)
+            except _Failed:
+                continue
+            self._shared.inc()
+            return result, True
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self._leaders.inc()
+        try:
+            result = await call()
+        except BaseException:
+            # Wakes the waiters up, they retry on their own
+            flight.set_exception(_Failed())
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result, False
+        finally:
+            del self._flights[key]
@@ -0,0 +1,272 @@
+"""
+Lightweight tracing: a span per interaction, child spans for what happens inside it.
+
+The current span is stored in a ContextVar, so it follows the command through awaits and
+into the tasks it creates. Child spans are only recorded inside a trace, code running
+outside an interaction (listeners, loops) pays a single ContextVar lookup.
+
+    with tracer.span("color.lookup", rgb="255,0,0"):
+        ...
+
+Completed traces are kept in a ring buffer (tracer.traces) and can be appended to a file
+as OTLP/JSON, one ExportTraceServiceRequest per line, readable by the OpenTelemetry
+collector (otlpjsonfile receiver) or any OTLP/JSON tool.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import secrets
+import threading
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter_ns, time_ns
+from typing import Any
+
+from loguru import logger as log
+
+type AttributeValue = str | int | float | bool
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    spans: list[Span] = field(default_factory=list)
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+
+@dataclass
+class Span:
+    name: str
+    trace: Trace
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    attributes: dict[str, AttributeValue] = field(default_factory=dict)
+    end_ns: int | None = None
+    error: str | None = None
+    _started: int = field(default_factory=perf_counter_ns, repr=False)
+
+    @property
+    def duration(self) -> float | None:
+        """Duration in seconds, None while the span is open."""
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def set(self, **attributes: AttributeValue | None) -> None:
+        self.attributes.update(
+            {key: value for key, value in attributes.items() if value is not None}
+        )
+
+    def record_error(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+# region OTLP
+def _otlp_value(value: AttributeValue) -> dict[str, Any]:
+    match value:
+        case bool():
+            return {"boolValue": value}
+        case int():
+            return {"intValue": str(value)}
+        case float():
+            return {"doubleValue": value}
+        case _:
+            return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict[str, Any]:
+    data: dict[str, Any] = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 2 if span.parent_id is None else 1,  # SERVER for the interaction
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in span.attributes.items()
+        ],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id is not None:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+def to_otlp(trace: Trace, service_name: str = "zorsbot") -> dict[str, Any]:
+    """Returns a trace as an OTLP/JSON ExportTraceServiceRequest."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service_name}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "zorsbot.tracing"},
+                        "spans": [_otlp_span(span) for span in trace.spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class _FileExporter:
+    """Appends traces to a file from a worker thread, the event loop never touches the disk."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._queue: queue.SimpleQueue[Trace | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="trace-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, trace: Trace) -> None:
+        self._queue.put(trace)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as target:
+            while (trace := self._queue.get()) is not None:
+                try:
+                    target.write(
+                        json.dumps(to_otlp(trace), separators=(",", ":")) + "\n"
+                    )
+                    target.flush()
+                except (OSError, TypeError, ValueError) as e:
+                    log.warning(f"Failed to export trace {trace.trace_id}: {e}")
+
+
+# endregion
+
+
+class Tracer:
+    """Creates spans and keeps the last completed traces."""
+
+    def __init__(self, buffer_size: int = 200):
+        self.enabled = True
+        self.traces: deque[Trace] = deque(maxlen=buffer_size)
+        self._exporter: _FileExporter | None = None
+
+    def configure(
+        self, enabled: bool, buffer_size: int, otlp_file: Path | None = None
+    ) -> None:
+        self.enabled = enabled
+        self.traces = deque(self.traces, maxlen=buffer_size)
+        if self._exporter is not None:
+            self._exporter.close()
+            self._exporter = None
+        if enabled and otlp_file is not None:
+            self._exporter = _FileExporter(otlp_file)
+            log.info(f"Exporting traces to {otlp_file}")
+
+    def close(self) -> None:
+        if self._exporter is not None:
+            self._exporter.close()
+            self._exporter = None
+
+    # region spans
+    def start_trace(
+        self, name: str, **attributes: AttributeValue | None
+    ) -> tuple[Span, Token] | None:
+        """
+        Opens the root span of a new trace and makes it current.
+        Used where the start and the end are in different functions (before/after hooks).
+
+        Returns:
+            The span and the token to give back to end_trace, None when tracing is disabled.
+        """
+        if not self.enabled:
+            return None
+        trace = Trace(secrets.token_hex(16))
+        span = self._new_span(name, trace, None, attributes)
+        return span, _current_span.set(span)
+
+    def end_trace(self, span: Span, token: Token | None = None) -> None:
+        """Closes the root span of a trace, the trace is then stored and exported."""
+        self._end_span(span)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Ended from another context than the one that started it
+                pass
+        self.traces.append(span.trace)
+        if self._exporter is not None:
+            self._exporter.export(span.trace)
+
+    @contextmanager
+    def span(
+        self, name: str, **attributes: AttributeValue | None
+    ) -> Iterator[Span | None]:
+        """
+        Child span of the current span, does nothing outside a trace.
+        Exceptions escaping the block mark the span as failed.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = self._new_span(name, parent.trace, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._end_span(span)
+
+    def _new_span(
+        self,
+        name: str,
+        trace: Trace,
+        parent_id: str | None,
+        attributes: dict[str, AttributeValue | None],
+    ) -> Span:
+        span = Span(
+            name=name,
+            trace=trace,
+            span_id=secrets.token_hex(8),
+            parent_id=parent_id,
+            start_ns=time_ns(),
+        )
+        span.set(**attributes)
+        trace.spans.append(span)
+        return span
+
+    @staticmethod
+    def _end_span(span: Span) -> None:
+        span.end_ns = span.start_ns + perf_counter_ns() - span._started
+
+    # endregion
+
+
+# Global tracer
+tracer = Tracer()
@@ -0,0 +1,214 @@
+"""
+Event loop watchdog: measures scheduling lag and catches the code blocking the loop.
+
+A heartbeat task wakes up every `interval` and records how late it was. A monitor thread
+watches the heartbeat; when it is overdue by more than the stall threshold, the loop is
+stuck in a callback, and the thread captures the stack of the loop thread at that moment.
+The stall is attributed to the cog and listener found in that stack (or to the running task)
+once the heartbeat comes back.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from time import perf_counter, time
+from types import FrameType
+
+import discord
+from loguru import logger as log
+
+from utils.metrics import metrics
+
+loop_lag = metrics.histogram(
+    "zors_event_loop_lag_seconds",
+    "Delay between a scheduled wake-up and the event loop running it.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+loop_stalls = metrics.counter(
+    "zors_event_loop_stalls_total",
+    "Callbacks that blocked the event loop longer than the stall threshold.",
+    ("cog", "handler"),
+)
+loop_stall_duration = metrics.histogram(
+    "zors_event_loop_stall_seconds",
+    "Duration of event loop stalls.",
+    ("cog", "handler"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+_stack_depth = 20
+
+
+@dataclass
+class Stall:
+    cog: str
+    handler: str
+    duration: float
+    stack: str
+    at: float = field(default_factory=time)
+
+
+@dataclass
+class _Capture:
+    cog: str
+    handler: str
+    stack: str
+
+
+@dataclass
+class _StallStats:
+    count: int = 0
+    total: float = 0.0
+    worst: Stall | None = None
+
+
+def _attribute(frame: FrameType, task: asyncio.Task | None) -> tuple[str, str]:
+    """
+    Finds the cog and the listener in a stack, the innermost cog method wins.
+    Falls back on the running task name ("pycord: on_voice_state_update"...) outside cogs.
+    """
+    current: FrameType | None = frame
+    while current is not None:
+        owner = current.f_locals.get("self")
+        if isinstance(owner, discord.Cog):
+            return owner.qualified_name, current.f_code.co_qualname
+        current = current.f_back
+    if task is not None:
+        return "-", task.get_name()
+    return "-", frame.f_code.co_qualname
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        interval: float = 0.1,
+        stall_threshold: float = 0.25,
+        summary_interval: float = 300.0,
+    ):
+        """
+        Args:
+            interval: Heartbeat period, in seconds.
+            stall_threshold: Lag above which a stall is recorded, in seconds.
+            summary_interval: Period of the summary logged at WARNING, in seconds.
+        """
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.summary_interval = summary_interval
+        self.recent_stalls: deque[Stall] = deque(maxlen=50)
+        self._stats: dict[tuple[str, str], _StallStats] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._last_beat = perf_counter()
+        self._capture: _Capture | None = None
+        self._captured_beat: float | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._summary_task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Starts the heartbeat and the monitor thread, must be called from the loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = perf_counter()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(
+            self._heartbeat(), name="zors: loop watchdog"
+        )
+        self._summary_task = self._loop.create_task(
+            self._summarize(), name="zors: loop watchdog summary"
+        )
+        self._thread = threading.Thread(
+            target=self._monitor, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for task in (self._heartbeat_task, self._summary_task):
+            if task is not None:
+                task.cancel()
+
+    # region heartbeat
+    async def _heartbeat(self) -> None:
+        while True:
+            beat = perf_counter()
+            self._last_beat = beat
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, perf_counter() - beat - self.interval)
+            loop_lag.observe(lag)
+            if lag >= self.stall_threshold:
+                self._record(lag, beat)
+
+    def _record(self, duration: float, beat: float) -> None:
+        capture = self._capture if self._captured_beat == beat else None
+        self._capture = None
+        if capture is None:
+            # The monitor thread didn't get to run during the stall (GIL held by C code)
+            capture = _Capture("-", "unknown", "")
+        stall = Stall(capture.cog, capture.handler, duration, capture.stack)
+        self.recent_stalls.append(stall)
+        loop_stalls.labels(stall.cog, stall.handler).inc()
+        loop_stall_duration.labels(stall.cog, stall.handler).observe(duration)
+        stats = self._stats.setdefault((stall.cog, stall.handler), _StallStats())
+        stats.count += 1
+        stats.total += duration
+        if stats.worst is None or duration > stats.worst.duration:
+            stats.worst = stall
+        log.debug(
+            f"Event loop blocked for {duration * 1000:.0f} ms by {stall.handler} (cog {stall.cog})"
+        )
+
+    # endregion
+
+    # region monitor thread
+    def _monitor(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            beat = self._last_beat
+            overdue = perf_counter() - beat - self.interval
+            if overdue < self.stall_threshold or self._captured_beat == beat:
+                continue
+            try:
+                self._capture = self._capture_loop_stack()
+                self._captured_beat = beat
+            except Exception as e:  # noqa: BLE001 - never let the watchdog die
+                log.debug(f"Loop watchdog failed to capture a stack: {e}")
+
+    def _capture_loop_stack(self) -> _Capture | None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore[arg-type]
+        if frame is None:
+            return None
+        task = asyncio.current_task(self._loop)
+        cog, handler = _attribute(frame, task)
+        stack = "".join(traceback.format_stack(frame, limit=_stack_depth))
+        return _Capture(cog, handler, stack)
+
+    # endregion
+
+    async def _summarize(self) -> None:
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            if not self._stats:
+                continue
+            stats, self._stats = self._stats, {}
+            ranking = sorted(
+                stats.items(), key=lambda item: item[1].total, reverse=True
+            )
+            lines = [
+                f"  {handler} (cog {cog}): {entry.count} stalls, {entry.total:.2f}s total, "
+                f"worst {entry.worst.duration:.2f}s"
+                for (cog, handler), entry in ranking
+                if entry.worst is not None
+            ]
+            worst = ranking[0][1].worst
+            log.warning(
+                f"Event loop stalled {sum(entry.count for entry in stats.values())} times "
+                f"in the last {self.summary_interval:.0f}s:\n"
+                + "\n".join(lines)
+                + (f"\nWorst stack:\n{worst.stack}" if worst and worst.stack else "")
+            )
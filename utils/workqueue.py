@@ -0,0 +1,247 @@
+"""
+Bounded work queue between the gateway listeners and the database.
+
+A listener submits a small job (a registered kind, the key of the entity it is about and its
+arguments) and returns: a fixed pool of workers runs the jobs, so the database never sees more
+than `workers` of them at once, however many events arrive. Jobs of the same key run one at a
+time in submission order, jobs of different keys run in parallel.
+
+Once `capacity` jobs are waiting, the policy of the kind decides what happens to a new one:
+- block: the listener waits for a free slot, nothing is lost,
+- drop: the job is discarded,
+- coalesce: the job is merged with the last waiting job of the same kind and key, full or not,
+  and waits for a slot when there is none to merge with. For jobs where only the latest state
+  matters (the roles of a member...).
+
+Each job runs in its own task, in the context copied from the listener that submitted it, so
+the log fields and the trace of the gateway event follow it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from collections import deque
+from collections.abc import Callable, Coroutine, Hashable, Mapping
+from dataclasses import dataclass, field
+from enum import StrEnum
+from time import perf_counter
+from typing import Any
+
+from loguru import logger as log
+
+from utils.metrics import metrics
+
+work_queue_depth = metrics.gauge(
+    "zors_work_queue_depth", "Jobs waiting for a worker, by kind.", ("kind",)
+)
+work_queue_jobs = metrics.counter(
+    "zors_work_queue_jobs_total",
+    "Jobs submitted to the work queue, by kind and outcome "
+    "(done, failed, dropped, coalesced).",
+    ("kind", "outcome"),
+)
+work_queue_wait = metrics.histogram(
+    "zors_work_queue_wait_seconds",
+    "Time between the submission of a job and a worker starting it.",
+    ("kind",),
+)
+work_queue_duration = metrics.histogram(
+    "zors_work_queue_job_duration_seconds", "Time spent running a job.", ("kind",)
+)
+
+
+class Policy(StrEnum):
+    BLOCK = "block"
+    DROP = "drop"
+    COALESCE = "coalesce"
+
+
+type Handler = Callable[..., Coroutine[Any, Any, None]]
+# Arguments of the waiting job and of the new one -> arguments of the merged job,
+# None when they cancel each other out
+type Merge = Callable[[tuple, tuple], tuple | None]
+
+
+def _keep_latest(waiting: tuple, new: tuple) -> tuple:
+    return new
+
+
+@dataclass
+class _Kind:
+    handler: Handler
+    policy: Policy
+    merge: Merge
+
+
+@dataclass
+class _Job:
+    kind: str
+    args: tuple
+    context: contextvars.Context
+    submitted: float = field(default_factory=perf_counter)
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        workers: int = 8,
+        capacity: int = 1000,
+        policies: Mapping[str, str] | None = None,
+    ):
+        """
+        Args:
+            workers: Jobs running at the same time.
+            capacity: Jobs waiting before the policies apply.
+            policies: Policy overrides by kind, over the ones given to `register`.
+        """
+        self.workers = workers
+        self.capacity = capacity
+        self._overrides = {
+            kind: Policy(policy) for kind, policy in (policies or {}).items()
+        }
+        self._kinds: dict[str, _Kind] = {}
+        # Waiting jobs by key, a key stays here while one of its jobs is running
+        self._pending: dict[Hashable, deque[_Job]] = {}
+        # Keys with a waiting job and none running
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(capacity)
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+
+    def register(
+        self,
+        kind: str,
+        handler: Handler,
+        policy: Policy = Policy.BLOCK,
+        merge: Merge = _keep_latest,
+    ) -> None:
+        """Declares a kind of job, registering it again replaces its handler."""
+        self._kinds[kind] = _Kind(handler, self._overrides.get(kind, policy), merge)
+
+    def __len__(self) -> int:
+        """Jobs waiting for a worker."""
+        return sum(len(waiting) for waiting in self._pending.values())
+
+    async def submit(self, kind: str, key: Hashable, *args: object) -> bool:
+        """
+        Queues `handler(*args)` of the kind, after the jobs already submitted for `key`.
+
+        Returns:
+            False when the job was dropped.
+        """
+        spec = self._kinds[kind]
+        if self._closed:
+            log.warning(f"Work queue: {kind} job for {key!r} submitted after shutdown")
+            work_queue_jobs.labels(kind, "dropped").inc()
+            return False
+        if spec.policy is Policy.COALESCE and self._coalesce(spec, kind, key, args):
+            return True
+        if self._slots.locked() and spec.policy is Policy.DROP:
+            log.debug(f"Work queue full, {kind} job for {key!r} dropped")
+            work_queue_jobs.labels(kind, "dropped").inc()
+            return False
+        await self._slots.acquire()
+        # The queue may have moved while waiting for the slot
+        if spec.policy is Policy.COALESCE and self._coalesce(spec, kind, key, args):
+            self._slots.release()
+            return True
+        self._enqueue(key, _Job(kind, args, contextvars.copy_context()))
+        return True
+
+    def _coalesce(self, spec: _Kind, kind: str, key: Hashable, args: tuple) -> bool:
+        waiting = self._pending.get(key)
+        if not waiting or waiting[-1].kind != kind:
+            return False
+        merged = spec.merge(waiting[-1].args, args)
+        if merged is None:
+            waiting.pop()
+            self._finished(kind)
+            self._slots.release()
+        else:
+            waiting[-1].args = merged
+        work_queue_jobs.labels(kind, "coalesced").inc()
+        return True
+
+    def _enqueue(self, key: Hashable, job: _Job) -> None:
+        waiting = self._pending.get(key)
+        if waiting is None:
+            waiting = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        waiting.append(job)
+        work_queue_depth.labels(job.kind).inc()
+        self._unfinished += 1
+        self._idle.clear()
+
+    def _finished(self, kind: str) -> None:
+        work_queue_depth.labels(kind).dec()
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+
+    @property
+    def idle(self) -> bool:
+        """No job waiting or running."""
+        return self._idle.is_set()
+
+    async def join(self) -> None:
+        """Waits until every submitted job has run."""
+        await self._idle.wait()
+
+    async def start(self) -> None:
+        self._closed = False
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"work queue: worker {index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Refuses new jobs and lets the workers finish the queued ones for `timeout` seconds."""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except TimeoutError:
+            log.warning(f"Work queue: {self._unfinished} jobs abandoned on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._ready.get()
+            waiting = self._pending[key]
+            if not waiting:
+                # Its only job was cancelled by a merge
+                del self._pending[key]
+                continue
+            job = waiting.popleft()
+            self._slots.release()
+            work_queue_depth.labels(job.kind).dec()
+            work_queue_wait.labels(job.kind).observe(perf_counter() - job.submitted)
+            started = perf_counter()
+            outcome = "done"
+            try:
+                await asyncio.create_task(
+                    self._kinds[job.kind].handler(*job.args),
+                    name=f"work: {job.kind}",
+                    context=job.context,
+                )
+            except Exception as e:
+                outcome = "failed"
+                log.opt(exception=e).error(
+                    f"Work queue: {job.kind} job for {key!r} failed"
+                )
+            finally:
+                work_queue_duration.labels(job.kind).observe(perf_counter() - started)
+                work_queue_jobs.labels(job.kind, outcome).inc()
+                if waiting:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                self._unfinished -= 1
+                if self._unfinished == 0:
+                    self._idle.set()
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
+from typing import ClassVar
+
 import discord
 from discord.ext import commands
 from loguru import logger as log
 
+from utils.logger import bind_context
+from utils.metrics import default_buckets, metrics
+
 
 class ZorsCog(commands.Cog):
+    # Gateway intents and MemberCacheFlags the cog relies on, the bot only enables those
+    # (see utils/memory.py). A listener whose intent is missing is simply never called.
+    required_intents: ClassVar[frozenset[str]] = frozenset()
+    member_cache: ClassVar[frozenset[str]] = frozenset()
+
     def __init__(self) -> None:
         super().__init__()
 
@@ -26,6 +37,47 @@ class ZorsCog(commands.Cog):
             )
         return author
 
+    def bind_log_context(
+        self, member: discord.Member | discord.User | None = None, **fields: object
+    ) -> None:
+        """Attach the cog and the member to the structured logs of the current event."""
+        if member is not None:
+            fields.setdefault("member_id", member.id)
+            guild = getattr(member, "guild", None)
+            if guild is not None:
+                fields.setdefault("guild_id", guild.id)
+        bind_context(cog=self.qualified_name, **fields)
+
+    # region metrics
+    def _metric_name(self, name: str) -> str:
+        return f"zors_{self.qualified_name.lower()}_{name}"
+
+    def metric_counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        """Register a counter named zors_<cog>_<name> on the global registry."""
+        return metrics.counter(self._metric_name(name), documentation, labelnames)
+
+    def metric_gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ):
+        """Register a gauge named zors_<cog>_<name> on the global registry."""
+        return metrics.gauge(self._metric_name(name), documentation, labelnames)
+
+    def metric_histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = default_buckets,
+    ):
+        """Register a histogram named zors_<cog>_<name> on the global registry."""
+        return metrics.histogram(
+            self._metric_name(name), documentation, labelnames, buckets
+        )
+
+    # endregion
+
     @commands.Cog.listener()
     async def on_ready(self):
         """